@@ -0,0 +1,30 @@
+from json import loads
+from os import getenv
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from app.models import DEFAULT_ASSET_ID, BatteryAsset
+
+## JSON list of the batteries in the fleet, e.g.
+## [{"assetId": "battery-1"}, {"assetId": "battery-2", "maxCapacity": 20}]
+## limits that are left out take the BatteryAsset defaults
+BATTERY_ASSETS = getenv("SVC_BATTERY_ASSETS")
+
+
+def loadFleet(description: Optional[str]) -> Dict[str, BatteryAsset]:
+    """The fleet described by `description`, or the single default battery."""
+    if not description:
+        return {DEFAULT_ASSET_ID: BatteryAsset(assetId=DEFAULT_ASSET_ID)}
+    assets = [BatteryAsset(**asset) for asset in loads(description)]
+    return {asset.assetId: asset for asset in assets}
+
+
+fleet = loadFleet(BATTERY_ASSETS)
+
+
+def getAsset(assetId: str) -> BatteryAsset:
+    try:
+        return fleet[assetId]
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown battery asset {assetId}")
@@ -1,32 +1,73 @@
+from collections import OrderedDict
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
-from typing import Optional, cast
-import boto3
-import re
-from boto3.dynamodb.conditions import Key
-
-from fastapi import FastAPI, HTTPException
-from botocore import errorfactory
 from os import getenv
-import logging
-
-from mypy_boto3_dynamodb.service_resource import _Table, Table
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar, cast
+from uuid import uuid4
 
-from app.models import BatteryState, ChargeRequest, DischargeRequest
-from app.utils import findLastKnownState
+from fastapi import FastAPI, HTTPException, Path, Query, Response
+from fastapi.responses import PlainTextResponse
+import logging
 
-BATTERY_MAX_CAPACITY = 10
+from app.assets import fleet, getAsset
+from app.models import (
+    DEFAULT_ASSET_ID,
+    DEFAULT_RUN_ID,
+    RUN_ID_PATTERN,
+    BatteryAction,
+    BatteryAsset,
+    BatteryState,
+    ChargeRequest,
+    DischargeRequest,
+    RewindRequest,
+    Run,
+    StateTransitionBatch,
+)
+from app.metrics import TracingMiddleware, render_metrics
+from app.storage import BatchTooLarge, StateConflict, create_store
+from app.timeline import (
+    BEGINNING,
+    CHARGE,
+    DISCHARGE,
+    REWIND,
+    SNAPSHOT,
+    StateTimeline,
+    applyEvent,
+    effectiveEpoch,
+    ledgerEntry,
+    snapshotOf,
+)
 
 app = FastAPI()
-dynamodb = boto3.resource(
-    "dynamodb", endpoint_url=getenv("SVC_DYNAMODB_HOST"), region_name="eu-west-2"
-)
-BATTERY_STATE_TABLENAME = "BATTERY_STATE"
+app.add_middleware(TracingMiddleware)
+## selected with SVC_BATTERY_STORAGE, "dynamodb" (default), "sqlite" or "memory"
+store = create_store()
 DATE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
-BATTERY_MAX_CHARGE_CYCLE = 20
-BATTERY_MAX_DISCHARGE_CYCLE = 20
-TIMESTEPS_BETWEEN_BATTERY_STATE = timedelta(minutes=30)
+## times a write is recomputed after another writer changed the asset first
+BATTERY_WRITE_RETRIES = int(getenv("SVC_BATTERY_WRITE_RETRIES", "5"))
+## events folded into a state before a snapshot of it is appended to the ledger
+BATTERY_SNAPSHOT_INTERVAL = int(getenv("SVC_BATTERY_SNAPSHOT_INTERVAL", "48"))
+## ledgers kept in memory, the least recently used are loaded again when needed
+BATTERY_LOADED_LEDGERS = int(getenv("SVC_BATTERY_LOADED_LEDGERS", "1024"))
+
+T = TypeVar("T")
+
+## the ledgers by run and asset, states are derived from them
+stateTimelines: "OrderedDict[Tuple[str, str], StateTimeline]" = OrderedDict()
+storeLock = Lock()
+seedLock = Lock()
+
+
+@app.on_event("startup")
+def load_store_on_startup():
+    ## creates the store if needed, so no request has to wait for it
+    try:
+        for assetId in fleet:
+            timelineFor(DEFAULT_RUN_ID, assetId)
+    except Exception as e:
+        logging.warning(f"Battery states not loaded on startup: {e}")
 
 
 @app.get("/")
@@ -34,80 +75,51 @@ def read_root():
     return {"Hello": "from battery service"}
 
 
-@app.get("/state/", response_model=BatteryState)
-def get_battery_state(settlementPeriodStartTime: str):
-    queryResult = {}
-    settlementPeriodStartTimeAsDateTime = datetime.strptime(
-        settlementPeriodStartTime, DATE_TIME_FORMAT
-    )
-    try:
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return render_metrics()
 
-        table = dynamodb.Table(BATTERY_STATE_TABLENAME)
-        table.load()
 
-        if not (table.table_status == "ACTIVE"):
-            logging.warning(
-                f"Table in {table.table_status} which is not active, attempting to create."
-            )
-            table = createTable()
+@app.get("/assets/", response_model=List[BatteryAsset])
+def get_battery_assets():
+    return list(fleet.values())
 
-        if table.item_count == 0:
-            logging.warning(f"Table in empty seeding.")
-            ## TODO FIX ME!!! ALWAYS SEDDING DATA!!! NO PERSISTENCe
-            seedDataBase(
-                table=table, initialTimeStamp=settlementPeriodStartTimeAsDateTime
-            )
 
-        queryResult = table.get_item(
-            Key={
-                "settlementPeriodStartTimeEpoch": Decimal(
-                    settlementPeriodStartTimeAsDateTime.timestamp()
-                ),
-                "settlementPeriodDay": settlementPeriodStartTimeAsDateTime.date().isoformat(),
-            },
-        )
-        if queryResult and queryResult.get("Item", None):
-            queryResult["Item"]["settlementPeriodStartTime"] = settlementPeriodStartTime
-            return queryResult["Item"]
+@app.post("/runs/", response_model=Run, status_code=201)
+def create_run():
+    """
+    A new run, whose batteries start afresh and are kept apart from every
+    other run. Nothing is stored until the run is first used.
+    """
+    return Run(runId=uuid4().hex)
 
-        ## if no current state, extrapolate from last known state
-        currentState = findLastKnownState(
-            dateTimeForRequest=settlementPeriodStartTimeAsDateTime, table=table
-        )
 
-        currentState[
-            "settlementPeriodDay"
-        ] = settlementPeriodStartTimeAsDateTime.date().isoformat()
-        currentState["settlementPeriodStartTimeEpoch"] = Decimal(
-            settlementPeriodStartTimeAsDateTime.timestamp()
-        )
-        currentState["settlementPeriodStartTime"] = settlementPeriodStartTime
+@app.delete("/runs/{runId}/", status_code=204)
+def reset_run(runId: str = Path(..., regex=RUN_ID_PATTERN)):
+    """
+    Start every battery of the run afresh. One rewind entry is appended to
+    each ledger and nothing is dropped or loaded, however much the run holds.
+    """
+    for asset in fleet.values():
+        rewindStoredLedger(runId, asset.assetId)
+    return Response(status_code=204)
 
-        response = table.put_item(Item=currentState)
-        return currentState
-    except errorfactory.ClientError as e:
-        if re.search(r"ResourceNotFoundException", str(e)):
-            # table is empty, create it and set initial state
-            table = createTable()
 
-            seedDataBase(
-                table=table, initialTimeStamp=settlementPeriodStartTimeAsDateTime
-            )
+@app.get("/state/", response_model=BatteryState)
+def get_battery_state(
+    settlementPeriodStartTime: str,
+    assetId: str = DEFAULT_ASSET_ID,
+    runId: str = Query(DEFAULT_RUN_ID, regex=RUN_ID_PATTERN),
+):
+    settlementPeriodStartTimeAsDateTime = datetime.strptime(
+        settlementPeriodStartTime, DATE_TIME_FORMAT
+    )
+    asset = getAsset(assetId)
 
-            response = table.get_item(
-                Key={
-                    "settlementPeriodStartTimeEpoch": Decimal(
-                        settlementPeriodStartTimeAsDateTime.timestamp()
-                    ),
-                    "settlementPeriodDay": settlementPeriodStartTimeAsDateTime.date().isoformat(),
-                },
-            )
-            item = response["Item"]
+    seedIfEmpty(runId, asset, settlementPeriodStartTimeAsDateTime)
 
-            item["settlementPeriodStartTime"] = settlementPeriodStartTime
-            return item
-        else:
-            raise e
+    ## if no state was written at this time, carry the last known state forward
+    return timelineFor(runId, assetId).at(settlementPeriodStartTimeAsDateTime)
 
 
 ## TODO Change to a POST on /state
@@ -123,75 +135,16 @@ def charge_battery(request: ChargeRequest):
         request.settlementPeriodStartTime, DATE_TIME_FORMAT
     )
 
-    dateTimeForNextState = dateTimeForRequest + TIMESTEPS_BETWEEN_BATTERY_STATE
-
-    table = dynamodb.Table(BATTERY_STATE_TABLENAME)
+    asset = getAsset(request.assetId)
 
-    currentState = table.get_item(
-        Key={
-            "settlementPeriodDay": dateTimeForRequest.date().isoformat(),
-            "settlementPeriodStartTimeEpoch": Decimal(dateTimeForRequest.timestamp()),
-        },
-    ).get("Item", {})
-
-    if not currentState:
-        ## Create a new current state from last known state on same day
-        currentState = findLastKnownState(
-            dateTimeForRequest=dateTimeForRequest, table=table
-        )
-
-        currentState["settlementPeriodDay"] = dateTimeForRequest.date().isoformat()
-        currentState["settlementPeriodStartTimeEpoch"] = Decimal(
-            dateTimeForRequest.timestamp()
-        )
-
-        table.put_item(Item=currentState)
-
-    if (
-        request.bidVolume + cast(Decimal, currentState["sameDayImportTotal"])
-    ) > Decimal(BATTERY_MAX_CHARGE_CYCLE):
-        raise HTTPException(
-            status_code=403,
-            detail="Request will cause battery to exceed max charge cycle",
-        )
-    elif (
-        request.bidVolume + cast(Decimal, currentState["chargeLevelAtPeriodStart"])
-    ) > Decimal(BATTERY_MAX_CAPACITY):
-        raise HTTPException(
-            status_code=403,
-            detail=f'Request of {request.bidVolume}MWh to current state of {currentState["chargeLevelAtPeriodStart"]}MWh will cause battery to exceed max charge capacity',
-        )
-    else:
-        sameDayImportTotal = (
-            cast(Decimal, currentState["sameDayImportTotal"]) + request.bidVolume
-            if datetime.fromtimestamp(
-                float(cast(Decimal, currentState["settlementPeriodStartTimeEpoch"]))
-            ).date()
-            == dateTimeForRequest.date()
-            else request.bidVolume
-        )
-
-        stateAtChargeRequestEnd = {
-            "settlementPeriodDay": dateTimeForNextState.date().isoformat(),
-            "settlementPeriodStartTimeEpoch": Decimal(dateTimeForNextState.timestamp()),
-            "settlementPeriodStartTime": dateTimeForNextState.strftime(
-                DATE_TIME_FORMAT
-            ),
-            "chargeLevelAtPeriodStart": cast(
-                Decimal, currentState["chargeLevelAtPeriodStart"]
-            )
-            + request.bidVolume,
-            "sameDayImportTotal": sameDayImportTotal,
-            "sameDayExportTotal": currentState["sameDayExportTotal"],
-            "cumulativeImportTotal": cast(
-                Decimal, currentState["cumulativeImportTotal"]
-            )
-            + request.bidVolume,
-            "cumulativeExportTotal": currentState["cumulativeExportTotal"],
-        }
-
-        table.put_item(Item=stateAtChargeRequestEnd)
-    return stateAtChargeRequestEnd
+    return changeState(
+        request.runId,
+        asset,
+        dateTimeForRequest,
+        lambda currentState: chargeEvent(
+            currentState, dateTimeForRequest, request.bidVolume, asset
+        ),
+    )
 
 
 ## TODO Change to a POST on /state
@@ -207,108 +160,389 @@ def discharge_battery(request: DischargeRequest):
         request.settlementPeriodStartTime, DATE_TIME_FORMAT
     )
 
-    dateTimeForNextState = dateTimeForRequest + TIMESTEPS_BETWEEN_BATTERY_STATE
+    asset = getAsset(request.assetId)
 
-    table = dynamodb.Table(BATTERY_STATE_TABLENAME)
+    return changeState(
+        request.runId,
+        asset,
+        dateTimeForRequest,
+        lambda currentState: dischargeEvent(
+            currentState, dateTimeForRequest, request.offerVolume, asset
+        ),
+    )
+
+
+@app.post("/rewind/", response_model=BatteryState)
+def rewind_battery(request: RewindRequest):
+    """
+    Discard every charge and discharge from the datetime specified on, so a
+    backtest window can be run again on the battery it started with.
+
+    Returns the battery state at that datetime.
+    """
+    dateTimeForRequest = datetime.strptime(
+        request.settlementPeriodStartTime, DATE_TIME_FORMAT
+    )
+
+    asset = getAsset(request.assetId)
+
+    rewind(request.runId, asset, dateTimeForRequest)
+    ## rewinding to before the first state leaves nothing to carry forward
+    seedIfEmpty(request.runId, asset, dateTimeForRequest)
+    return timelineFor(request.runId, asset.assetId).at(dateTimeForRequest)
 
-    currentState = table.get_item(
-        Key={
-            "settlementPeriodDay": dateTimeForRequest.date().isoformat(),
-            "settlementPeriodStartTimeEpoch": Decimal(dateTimeForRequest.timestamp()),
-        },
-    ).get("Item", {})
 
-    if not currentState:
-        ## Create a new current state from last known state on same day
-        currentState = findLastKnownState(
-            dateTimeForRequest=dateTimeForRequest, table=table
+@app.post("/transitions/", response_model=List[BatteryState])
+def apply_state_transitions(request: StateTransitionBatch):
+    """
+    Apply a list of reads, charges and discharges in order, each exactly as
+    the single endpoints would, and return the battery state after each one.
+
+    Transitions may address different assets. Later transitions see the events
+    of earlier ones. All events are appended to the ledger in one batch at the
+    end, so if any transition is rejected nothing is written, and the whole
+    batch is applied again if another writer changed its assets first.
+    """
+    return retryOnConflict(request.runId, lambda: applyTransitions(request))
+
+
+def applyTransitions(request: StateTransitionBatch) -> List[dict]:
+    pendingEvents: Dict[str, List[dict]] = {}
+    ## versions of the assets as they were first read by the batch
+    readVersions: Dict[str, int] = {}
+    results = []
+
+    for index, transition in enumerate(request.transitions):
+        dateTimeForRequest = datetime.strptime(
+            transition.settlementPeriodStartTime, DATE_TIME_FORMAT
         )
+        asset = getAsset(transition.assetId)
+
+        seedIfEmpty(request.runId, asset, dateTimeForRequest)
+
+        timeline = timelineFor(request.runId, asset.assetId)
+        readVersions.setdefault(asset.assetId, timeline.version)
+        assetPendingEvents = pendingEvents.setdefault(asset.assetId, [])
+        currentState = timeline.at(dateTimeForRequest, pending=assetPendingEvents)
+
+        try:
+            if transition.action == BatteryAction.charge:
+                event = chargeEvent(
+                    currentState, dateTimeForRequest, transition.volume, asset
+                )
+            elif transition.action == BatteryAction.discharge:
+                event = dischargeEvent(
+                    currentState, dateTimeForRequest, transition.volume, asset
+                )
+            else:
+                results.append(currentState)
+                continue
+        except HTTPException as e:
+            raise confirmedRejection(
+                request.runId,
+                readVersions,
+                HTTPException(
+                    status_code=e.status_code,
+                    detail=f"Transition {index} rejected: {e.detail}",
+                ),
+            )
 
-        currentState["settlementPeriodDay"] = dateTimeForRequest.date().isoformat()
-        currentState["settlementPeriodStartTimeEpoch"] = Decimal(
-            dateTimeForRequest.timestamp()
+        assetPendingEvents.append(event)
+        results.append(applyEvent(currentState, event))
+
+    ## only assets that are written are checked, reads never conflict
+    pendingEntries = {
+        assetId: withSnapshot(timelineFor(request.runId, assetId), assetPendingEvents)
+        for (assetId, assetPendingEvents) in pendingEvents.items()
+        if assetPendingEvents
+    }
+    if pendingEntries:
+        commitEntries(
+            request.runId,
+            pendingEntries,
+            {assetId: readVersions[assetId] for assetId in pendingEntries},
         )
 
-        table.put_item(Item=currentState)
+    return results
+
 
+def chargeEvent(
+    currentState: dict,
+    dateTimeForRequest: datetime,
+    bidVolume: Decimal,
+    asset: BatteryAsset,
+) -> dict:
+    """
+    The event charging `bidVolume` from `currentState`, rejected when it would
+    break the limits of `asset`.
+    """
     if (
-        request.offerVolume + cast(Decimal, currentState["sameDayExportTotal"])
-    ) > Decimal(BATTERY_MAX_DISCHARGE_CYCLE):
+        bidVolume + cast(Decimal, currentState["sameDayImportTotal"])
+    ) > asset.maxChargeCycle:
         raise HTTPException(
             status_code=403,
-            detail="Request will cause battery to exceed max discharge cycle",
+            detail="Request will cause battery to exceed max charge cycle",
         )
     elif (
-        cast(Decimal, currentState["chargeLevelAtPeriodStart"]) - request.offerVolume
-    ) < 0:
+        bidVolume + cast(Decimal, currentState["chargeLevelAtPeriodStart"])
+    ) > asset.maxCapacity:
         raise HTTPException(
             status_code=403,
-            detail="Request will cause battery to exceed max charge capacity",
+            detail=f'Request of {bidVolume}MWh to current state of {currentState["chargeLevelAtPeriodStart"]}MWh will cause battery to exceed max charge capacity',
         )
-    else:
-        sameDayExportTotal = (
-            cast(Decimal, currentState["sameDayExportTotal"]) + request.offerVolume
-            if datetime.fromtimestamp(
-                float(cast(Decimal, currentState["settlementPeriodStartTimeEpoch"]))
-            ).date()
-            == dateTimeForRequest.date()
-            else request.offerVolume
+
+    return ledgerEntry(CHARGE, asset.assetId, dateTimeForRequest, volume=bidVolume)
+
+
+def dischargeEvent(
+    currentState: dict,
+    dateTimeForRequest: datetime,
+    offerVolume: Decimal,
+    asset: BatteryAsset,
+) -> dict:
+    """
+    The event discharging `offerVolume` from `currentState`, rejected when it
+    would break the limits of `asset`.
+    """
+    if (
+        offerVolume + cast(Decimal, currentState["sameDayExportTotal"])
+    ) > asset.maxDischargeCycle:
+        raise HTTPException(
+            status_code=403,
+            detail="Request will cause battery to exceed max discharge cycle",
+        )
+    elif (cast(Decimal, currentState["chargeLevelAtPeriodStart"]) - offerVolume) < 0:
+        raise HTTPException(
+            status_code=403,
+            detail="Request will cause battery to exceed max charge capacity",
         )
 
-        stateAtChargeRequestEnd = {
-            "settlementPeriodDay": dateTimeForNextState.date().isoformat(),
-            "settlementPeriodStartTimeEpoch": Decimal(dateTimeForNextState.timestamp()),
-            "settlementPeriodStartTime": dateTimeForNextState.strftime(
-                DATE_TIME_FORMAT
-            ),
-            "chargeLevelAtPeriodStart": cast(
-                Decimal, currentState["chargeLevelAtPeriodStart"]
-            )
-            - request.offerVolume,
-            "sameDayImportTotal": currentState["sameDayImportTotal"],
-            "sameDayExportTotal": sameDayExportTotal,
-            "cumulativeImportTotal": currentState["cumulativeImportTotal"],
-            "cumulativeExportTotal": cast(
-                Decimal, currentState["cumulativeExportTotal"]
-            )
-            + request.offerVolume,
-        }
+    return ledgerEntry(DISCHARGE, asset.assetId, dateTimeForRequest, volume=offerVolume)
+
 
-        table.put_item(Item=stateAtChargeRequestEnd)
-    return stateAtChargeRequestEnd
-
-
-def createTable():
-    logging.warning(f"Create {BATTERY_STATE_TABLENAME} table")
-    table = dynamodb.create_table(
-        TableName=BATTERY_STATE_TABLENAME,
-        KeySchema=[
-            {"AttributeName": "settlementPeriodDay", "KeyType": "HASH"},
-            {"AttributeName": "settlementPeriodStartTimeEpoch", "KeyType": "RANGE"},
-        ],
-        AttributeDefinitions=[
-            {"AttributeName": "settlementPeriodDay", "AttributeType": "S"},
-            {"AttributeName": "settlementPeriodStartTimeEpoch", "AttributeType": "N"},
-        ],
-        ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+def withSnapshot(timeline: StateTimeline, events: List[dict]) -> List[dict]:
+    """
+    `events`, followed by a snapshot of the state after them once
+    BATTERY_SNAPSHOT_INTERVAL events are folded to reach it.
+    """
+    lastEvent = max(events, key=effectiveEpoch)
+    stateAfterEvents, eventsFolded = timeline.fold(
+        datetime.fromtimestamp(float(effectiveEpoch(lastEvent))), pending=events
+    )
+    if eventsFolded < BATTERY_SNAPSHOT_INTERVAL:
+        return events
+    return events + [snapshotOf(stateAfterEvents)]
+
+
+def seedDataBase(*, runId: str, asset: BatteryAsset, initialTimeStamp: datetime):
+    commitEntries(
+        runId,
+        {
+            asset.assetId: [
+                ledgerEntry(
+                    SNAPSHOT,
+                    asset.assetId,
+                    initialTimeStamp,
+                    chargeLevelAtPeriodStart=asset.initialChargeLevel,
+                    sameDayImportTotal=Decimal(0.00),
+                    sameDayExportTotal=Decimal(0.00),
+                    cumulativeImportTotal=Decimal(0.00),
+                    cumulativeExportTotal=Decimal(0.00),
+                )
+            ]
+        },
+        ## the ledger may hold entries that were all rewound
+        {asset.assetId: timelineFor(runId, asset.assetId).version},
     )
 
-    # Wait until the table exists.
-    table.meta.client.get_waiter("table_exists").wait(TableName=BATTERY_STATE_TABLENAME)
-    logging.info(f"Successfully created {BATTERY_STATE_TABLENAME} table")
 
-    return table
+def timelineFor(runId: str, assetId: str) -> StateTimeline:
+    """
+    The timeline of the asset in the run, loaded from the store the first
+    time it is used.
+    """
+    key = (runId, assetId)
+    with storeLock:
+        timeline = stateTimelines.get(key)
+        if timeline is not None:
+            stateTimelines.move_to_end(key)
+            return timeline
+
+    timeline = StateTimeline()
+    loadTimeline(timeline, runId, assetId)
+    with storeLock:
+        ## another request may have loaded it meanwhile
+        timeline = stateTimelines.setdefault(key, timeline)
+        while len(stateTimelines) > BATTERY_LOADED_LEDGERS:
+            stateTimelines.popitem(last=False)
+    return timeline
+
+
+def loadTimeline(timeline: StateTimeline, runId: str, assetId: str):
+    ## version first, so the timeline never gets a version newer than its entries
+    version = store.load_version(runId, assetId)
+    entries = store.load_entries(runId, assetId)
+    timeline.replace(entries, version)
+    logging.info(
+        f"Loaded {len(entries)} battery ledger entries of {assetId} in run {runId}"
+    )
 
 
-def seedDataBase(*, table: _Table, initialTimeStamp: datetime):
-    table.put_item(
-        Item={
-            "settlementPeriodDay": initialTimeStamp.date().isoformat(),
-            "settlementPeriodStartTimeEpoch": Decimal(initialTimeStamp.timestamp()),
-            "chargeLevelAtPeriodStart": Decimal(5.00),
-            "sameDayImportTotal": Decimal(0.00),
-            "sameDayExportTotal": Decimal(0.00),
-            "cumulativeImportTotal": Decimal(0.00),
-            "cumulativeExportTotal": Decimal(0.00),
+def seedIfEmpty(runId: str, asset: BatteryAsset, initialTimeStamp: datetime):
+    if len(timelineFor(runId, asset.assetId)):
+        return
+    with seedLock:
+        if not len(timelineFor(runId, asset.assetId)):
+            logging.warning(f"No state stored for {asset.assetId}, seeding.")
+            ## TODO FIX ME!!! ALWAYS SEDDING DATA!!! NO PERSISTENCe
+            try:
+                seedDataBase(
+                    runId=runId, asset=asset, initialTimeStamp=initialTimeStamp
+                )
+            except StateConflict:
+                ## another process seeded the asset first
+                loadTimeline(timelineFor(runId, asset.assetId), runId, asset.assetId)
+
+
+def changeState(
+    runId: str,
+    asset: BatteryAsset,
+    dateTimeForRequest: datetime,
+    change: Callable[[dict], dict],
+) -> dict:
+    """
+    Append the event `change` makes from the state of `asset` at
+    `dateTimeForRequest` and return the state after it, on a fresh state again
+    if another writer changed the asset first.
+    """
+
+    def changeOnce() -> dict:
+        timeline = timelineFor(runId, asset.assetId)
+        version = timeline.version
+        currentState = timeline.at(dateTimeForRequest)
+        try:
+            event = change(currentState)
+        except HTTPException as rejection:
+            raise confirmedRejection(runId, {asset.assetId: version}, rejection)
+        commitEntries(
+            runId,
+            {asset.assetId: withSnapshot(timeline, [event])},
+            {asset.assetId: version},
+        )
+        return applyEvent(currentState, event)
+
+    return retryOnConflict(runId, changeOnce)
+
+
+def rewind(runId: str, asset: BatteryAsset, dateTime: datetime):
+    """Discard the events of `asset` in the run from `dateTime` on."""
+
+    def rewindOnce():
+        version = timelineFor(runId, asset.assetId).version
+        commitEntries(
+            runId,
+            {asset.assetId: [ledgerEntry(REWIND, asset.assetId, dateTime)]},
+            {asset.assetId: version},
+        )
+
+    retryOnConflict(runId, rewindOnce)
+
+
+def rewindStoredLedger(runId: str, assetId: str):
+    """
+    Append a rewind to the beginning to the ledger of the asset in the run,
+    conditional on its version in the store, so the ledger is not loaded.
+    """
+    for _ in range(BATTERY_WRITE_RETRIES + 1):
+        version = store.load_version(runId, assetId)
+        if not version:
+            return
+        entry = {
+            **ledgerEntry(REWIND, assetId, BEGINNING),
+            "runId": runId,
+            "sequence": version + 1,
         }
+        try:
+            store.append(runId, [entry], {assetId: version})
+        except StateConflict as e:
+            logging.warning(f"{e}, retrying on the latest version")
+            continue
+        with storeLock:
+            timeline = stateTimelines.get((runId, assetId))
+            ## a loaded timeline that missed other writes is loaded again when used
+            if timeline is not None and timeline.version != version:
+                del stateTimelines[(runId, assetId)]
+                timeline = None
+        if timeline is not None:
+            timeline.advance([entry], version + 1)
+        return
+    raise HTTPException(
+        status_code=409,
+        detail="Battery state kept changing during the request, please retry",
     )
+
+
+def retryOnConflict(runId: str, write: Callable[[], T]) -> T:
+    """
+    Run `write` until it is not beaten by another writer, reloading the
+    conflicting assets of the run from the store in between.
+    """
+    for _ in range(BATTERY_WRITE_RETRIES + 1):
+        try:
+            return write()
+        except StateConflict as e:
+            logging.warning(f"{e}, retrying on the latest states")
+            for assetId in e.assetIds:
+                loadTimeline(timelineFor(runId, assetId), runId, assetId)
+    raise HTTPException(
+        status_code=409,
+        detail="Battery state kept changing during the request, please retry",
+    )
+
+
+def commitEntries(
+    runId: str,
+    entriesByAsset: Dict[str, List[dict]],
+    readVersions: Dict[str, int],
+):
+    """
+    Append the entries of every asset to its ledger in the run, numbered on
+    from the version it was read at, if the assets are still at those
+    versions. StateConflict is raised otherwise.
+    """
+    numberedEntries = {
+        assetId: [
+            {**entry, "runId": runId, "sequence": readVersions[assetId] + index + 1}
+            for (index, entry) in enumerate(entries)
+        ]
+        for (assetId, entries) in entriesByAsset.items()
+    }
+    try:
+        store.append(
+            runId,
+            [entry for entries in numberedEntries.values() for entry in entries],
+            readVersions,
+        )
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    for assetId, entries in numberedEntries.items():
+        timelineFor(runId, assetId).advance(
+            entries, readVersions[assetId] + len(entries)
+        )
+
+
+def confirmedRejection(
+    runId: str, readVersions: Dict[str, int], rejection: HTTPException
+) -> HTTPException:
+    """
+    `rejection`, if the states it is based on are still current. Otherwise
+    another writer changed them and StateConflict is raised to retry.
+    """
+    staleAssetIds = [
+        assetId
+        for (assetId, version) in readVersions.items()
+        if store.load_version(runId, assetId) != version
+    ]
+    if staleAssetIds:
+        raise StateConflict(staleAssetIds)
+    return rejection
@@ -1,21 +1,71 @@
 from decimal import Decimal
-from pydantic import BaseModel
+from enum import Enum
+from typing import List
+from pydantic import BaseModel, Field
+
+## the battery addressed by requests that do not name one
+DEFAULT_ASSET_ID = "battery-1"
+## the run written by requests that do not name one
+DEFAULT_RUN_ID = "default"
+## runs name directories, so ids start with a letter or digit and are never ".."
+RUN_ID_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$"
+
+
+class BatteryAsset(BaseModel):
+    assetId: str
+    maxCapacity: Decimal = Decimal(10)
+    maxChargeCycle: Decimal = Decimal(20)
+    maxDischargeCycle: Decimal = Decimal(20)
+    initialChargeLevel: Decimal = Decimal(5)
+
+
+class Run(BaseModel):
+    runId: str
 
 
 class ChargeRequest(BaseModel):
     settlementPeriodStartTime: str
     bidVolume: Decimal
+    assetId: str = DEFAULT_ASSET_ID
+    runId: str = Field(DEFAULT_RUN_ID, regex=RUN_ID_PATTERN)
 
 
 class DischargeRequest(BaseModel):
     settlementPeriodStartTime: str
     offerVolume: Decimal
+    assetId: str = DEFAULT_ASSET_ID
+    runId: str = Field(DEFAULT_RUN_ID, regex=RUN_ID_PATTERN)
+
+
+class RewindRequest(BaseModel):
+    settlementPeriodStartTime: str
+    assetId: str = DEFAULT_ASSET_ID
+    runId: str = Field(DEFAULT_RUN_ID, regex=RUN_ID_PATTERN)
 
 
 class BatteryState(BaseModel):
+    assetId: str
     settlementPeriodStartTime: str
     chargeLevelAtPeriodStart: Decimal
     sameDayImportTotal: Decimal
     sameDayExportTotal: Decimal
     cumulativeImportTotal: Decimal
     cumulativeExportTotal: Decimal
+
+
+class BatteryAction(str, Enum):
+    read = "read"
+    charge = "charge"
+    discharge = "discharge"
+
+
+class StateTransition(BaseModel):
+    settlementPeriodStartTime: str
+    action: BatteryAction = BatteryAction.read
+    volume: Decimal = Decimal(0)
+    assetId: str = DEFAULT_ASSET_ID
+
+
+class StateTransitionBatch(BaseModel):
+    transitions: List[StateTransition]
+    runId: str = Field(DEFAULT_RUN_ID, regex=RUN_ID_PATTERN)
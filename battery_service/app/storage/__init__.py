@@ -0,0 +1,27 @@
+from os import getenv
+
+from app.storage.base import BatchTooLarge, StateConflict, StateStore
+from app.storage.timed import TimedStateStore
+
+BATTERY_STORAGE = getenv("SVC_BATTERY_STORAGE", "dynamodb")
+
+
+def create_store(kind: str = BATTERY_STORAGE) -> StateStore:
+    """Build the battery state store for `kind`, "dynamodb", "sqlite" or "memory"."""
+    return TimedStateStore(createUntimedStore(kind))
+
+
+def createUntimedStore(kind: str) -> StateStore:
+    if kind == "dynamodb":
+        from app.storage.dynamodb import DynamoDbStateStore
+
+        return DynamoDbStateStore()
+    if kind == "sqlite":
+        from app.storage.sqlite import SqliteStateStore
+
+        return SqliteStateStore()
+    if kind == "memory":
+        from app.storage.memory import InMemoryStateStore
+
+        return InMemoryStateStore()
+    raise ValueError(f"Unknown battery storage: {kind}")
@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, List, Protocol
+
+
+class StateConflict(Exception):
+    """Another writer changed some of the assets since their states were read."""
+
+    def __init__(self, assetIds: Iterable[str]):
+        self.assetIds = list(assetIds)
+        super().__init__(f"Conflicting write for {', '.join(self.assetIds)}")
+
+
+class BatchTooLarge(Exception):
+    """The store cannot write this many ledgers in one append."""
+
+
+class StateStore(Protocol):
+    """
+    Where the battery service keeps its ledgers, one per run and asset.
+
+    Ledger entries are dicts keyed by `runId`, `assetId` and `sequence`, so
+    every battery of every run has its own partition, in the order the
+    entries were written. Entries are only ever appended. Their quantities are
+    Decimals, and every implementation must hand them back exactly as they
+    were put.
+
+    Each ledger also has a version, the sequence of its latest entry or 0
+    before the first one. Appends only succeed if the versions they expect
+    are still current, so concurrent writers never overwrite each other.
+    """
+
+    def load_entries(self, runId: str, assetId: str) -> List[dict]:
+        """
+        Every entry of one ledger, creating the store first if it does not
+        exist.
+        """
+        ...
+
+    def load_version(self, runId: str, assetId: str) -> int:
+        """The current version of one ledger."""
+        ...
+
+    def append(
+        self, runId: str, entries: Iterable[dict], expectedVersions: Dict[str, int]
+    ) -> None:
+        """
+        Add all of `entries` to the ledgers of the run, numbered on from the
+        versions their assets are expected at, and move every asset on to the
+        sequence of its last entry. Nothing is written and StateConflict is
+        raised if any of them is no longer at the expected version, or
+        BatchTooLarge if the store cannot write that many ledgers at once.
+        """
+        ...
+
+    def clear(self) -> None:
+        """Remove every ledger entry and version of every run."""
+        ...
+
+
+def nextVersions(
+    entries: Iterable[dict], expectedVersions: Dict[str, int]
+) -> Dict[str, int]:
+    """The version every asset of `expectedVersions` moves on to with `entries`."""
+    versions = dict(expectedVersions)
+    for entry in entries:
+        versions[entry["assetId"]] = max(
+            versions[entry["assetId"]], int(entry["sequence"])
+        )
+    return versions
@@ -0,0 +1,236 @@
+import logging
+import re
+from os import getenv
+from time import sleep
+from typing import Dict, Iterable, List
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore import errorfactory
+from mypy_boto3_dynamodb.service_resource import Table
+
+from app.storage.base import BatchTooLarge, StateConflict, nextVersions
+
+## partitioned by run and asset, sorted by sequence
+BATTERY_LEDGER_TABLENAME = "BATTERY_LEDGER"
+## the version of every ledger, moved on by each write
+BATTERY_VERSION_TABLENAME = "BATTERY_ASSET_VERSION"
+
+## transaction cancellation reasons caused by another writer
+CONFLICT_REASONS = {"ConditionalCheckFailed", "TransactionConflict"}
+## the most items DynamoDB takes in one transaction
+MAX_TRANSACTION_ITEMS = 25
+## how long a load waits for the entries a large append is still writing
+PENDING_ENTRY_RETRIES = int(getenv("SVC_DYNAMODB_PENDING_ENTRY_RETRIES", "10"))
+PENDING_ENTRY_SECONDS = float(getenv("SVC_DYNAMODB_PENDING_ENTRY_SECONDS", "0.1"))
+
+
+class DynamoDbStateStore:
+    """
+    Keeps the ledgers in the BATTERY_LEDGER DynamoDB table and their versions
+    in BATTERY_ASSET_VERSION, both keyed by a `ledgerId` of the run and asset.
+    Every append is conditional on the versions, and can write at most
+    MAX_TRANSACTION_ITEMS batteries.
+    """
+
+    def __init__(
+        self,
+        tableName: str = BATTERY_LEDGER_TABLENAME,
+        versionTableName: str = BATTERY_VERSION_TABLENAME,
+    ):
+        self.tableName = tableName
+        self.versionTableName = versionTableName
+        self.dynamodb = boto3.resource(
+            "dynamodb",
+            endpoint_url=getenv("SVC_DYNAMODB_HOST"),
+            region_name="eu-west-2",
+        )
+        self.table: Table = self.dynamodb.Table(tableName)
+        self.versionTable: Table = self.dynamodb.Table(versionTableName)
+        self.tablesChecked = False
+
+    def load_entries(self, runId: str, assetId: str) -> List[dict]:
+        self.checkTables()
+        for attempt in range(PENDING_ENTRY_RETRIES + 1):
+            ## version first, every entry up to it has been reserved by a write
+            version = self.load_version(runId, assetId)
+            entries = self.readAll(
+                self.table.query,
+                KeyConditionExpression=Key("ledgerId").eq(ledgerIdOf(runId, assetId)),
+                ConsistentRead=True,
+            )
+            sequences = {int(entry["sequence"]) for entry in entries}
+            if sequences.issuperset(range(1, version + 1)):
+                return entries
+            ## a large append is still writing the entries it reserved
+            if attempt < PENDING_ENTRY_RETRIES:
+                sleep(PENDING_ENTRY_SECONDS)
+        logging.error(
+            f"Ledger of {assetId} in run {runId} is missing entries up to version "
+            f"{version}, loading it without them"
+        )
+        return entries
+
+    def load_version(self, runId: str, assetId: str) -> int:
+        self.checkTables()
+        item = self.versionTable.get_item(
+            Key={"ledgerId": ledgerIdOf(runId, assetId)}, ConsistentRead=True
+        ).get("Item")
+        return int(item["version"]) if item else 0
+
+    def append(
+        self, runId: str, entries: Iterable[dict], expectedVersions: Dict[str, int]
+    ) -> None:
+        """
+        Appends that fit in one transaction write the version updates and the
+        entries together. Larger ones reserve the entries' sequences with a
+        transaction of the version updates, then write the entries in batches,
+        and readers wait for the reserved entries to arrive.
+        """
+        self.checkTables()
+        entries = list(entries)
+        if len(expectedVersions) > MAX_TRANSACTION_ITEMS:
+            raise BatchTooLarge(
+                f"At most {MAX_TRANSACTION_ITEMS} batteries can be written at once, "
+                f"not {len(expectedVersions)}"
+            )
+        versions = nextVersions(entries, expectedVersions)
+        versionUpdates = [
+            {
+                "Update": {
+                    "TableName": self.versionTableName,
+                    "Key": {"ledgerId": ledgerIdOf(runId, assetId)},
+                    "UpdateExpression": "SET version = :next",
+                    "ConditionExpression": (
+                        "attribute_not_exists(version)"
+                        if version == 0
+                        else "version = :expected"
+                    ),
+                    "ExpressionAttributeValues": {
+                        ":next": versions[assetId],
+                        **({":expected": version} if version else {}),
+                    },
+                }
+            }
+            for (assetId, version) in expectedVersions.items()
+        ]
+        items = [
+            {**entry, "ledgerId": ledgerIdOf(runId, entry["assetId"])}
+            for entry in entries
+        ]
+        if len(versionUpdates) + len(items) <= MAX_TRANSACTION_ITEMS:
+            self.transactVersionUpdates(
+                expectedVersions,
+                versionUpdates
+                + [
+                    {"Put": {"TableName": self.tableName, "Item": item}}
+                    for item in items
+                ],
+            )
+            return
+
+        self.transactVersionUpdates(expectedVersions, versionUpdates)
+        with self.table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+
+    def transactVersionUpdates(
+        self, expectedVersions: Dict[str, int], transactItems: List[dict]
+    ):
+        """
+        Write `transactItems`, starting with the version updates of
+        `expectedVersions`, in one transaction. StateConflict is raised with
+        the assets whose version moved on.
+        """
+        try:
+            ## the resource's client serializes the attribute values
+            self.dynamodb.meta.client.transact_write_items(TransactItems=transactItems)
+        except errorfactory.ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise e
+            reasons = e.response.get("CancellationReasons", [])
+            if any(
+                reason.get("Code") not in CONFLICT_REASONS | {"None"}
+                for reason in reasons
+            ):
+                raise e
+            conflicts = [
+                assetId
+                for (assetId, reason) in zip(expectedVersions, reasons)
+                if reason.get("Code") in CONFLICT_REASONS
+            ]
+            raise StateConflict(conflicts or expectedVersions)
+
+    def clear(self) -> None:
+        """Delete the tables, they are created again by the next load."""
+        for table in [self.table, self.versionTable]:
+            try:
+                table.delete()
+                table.wait_until_not_exists()
+            except errorfactory.ClientError as e:
+                if not re.search(r"ResourceNotFoundException", str(e)):
+                    raise e
+        self.tablesChecked = False
+
+    def readAll(self, read, **arguments) -> List[dict]:
+        response = read(**arguments)
+        items = response["Items"]
+        while "LastEvaluatedKey" in response:
+            response = read(ExclusiveStartKey=response["LastEvaluatedKey"], **arguments)
+            items.extend(response["Items"])
+        return items
+
+    def checkTables(self):
+        """Create the tables if they are missing or not active, once."""
+        if self.tablesChecked:
+            return
+        self.versionTable = self.checkTable(
+            self.versionTable, [("ledgerId", "HASH", "S")]
+        )
+        self.table = self.checkTable(
+            self.table,
+            [
+                ("ledgerId", "HASH", "S"),
+                ("sequence", "RANGE", "N"),
+            ],
+        )
+        self.tablesChecked = True
+
+    def checkTable(self, table: Table, keys) -> Table:
+        """`table`, or a new one with `keys` if it is missing or not active."""
+        try:
+            table.load()
+            if not (table.table_status == "ACTIVE"):
+                logging.warning(
+                    f"Table in {table.table_status} which is not active, attempting to create."
+                )
+                return self.createTable(table.name, keys)
+        except errorfactory.ClientError as e:
+            if not re.search(r"ResourceNotFoundException", str(e)):
+                raise e
+            return self.createTable(table.name, keys)
+        return table
+
+    def createTable(self, tableName: str, keys) -> Table:
+        logging.warning(f"Create {tableName} table")
+        table = self.dynamodb.create_table(
+            TableName=tableName,
+            KeySchema=[
+                {"AttributeName": name, "KeyType": keyType}
+                for (name, keyType, _) in keys
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": name, "AttributeType": attributeType}
+                for (name, _, attributeType) in keys
+            ],
+            ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+        )
+
+        # Wait until the table exists.
+        table.meta.client.get_waiter("table_exists").wait(TableName=tableName)
+        logging.info(f"Successfully created {tableName} table")
+        return table
+
+
+def ledgerIdOf(runId: str, assetId: str) -> str:
+    return f"{runId}/{assetId}"
@@ -0,0 +1,48 @@
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+from app.storage.base import StateConflict, nextVersions
+
+
+class InMemoryStateStore:
+    """Keeps the ledgers in dicts, they are lost when the service stops."""
+
+    def __init__(self):
+        ## keyed by run and asset, then by sequence
+        self.entries: Dict[Tuple[str, str], Dict[int, dict]] = {}
+        self.versions: Dict[Tuple[str, str], int] = {}
+        self.lock = Lock()
+
+    def load_entries(self, runId: str, assetId: str) -> List[dict]:
+        with self.lock:
+            return [
+                dict(entry) for entry in self.entries.get((runId, assetId), {}).values()
+            ]
+
+    def load_version(self, runId: str, assetId: str) -> int:
+        with self.lock:
+            return self.versions.get((runId, assetId), 0)
+
+    def append(
+        self, runId: str, entries: Iterable[dict], expectedVersions: Dict[str, int]
+    ) -> None:
+        entries = list(entries)
+        with self.lock:
+            conflicts = [
+                assetId
+                for (assetId, version) in expectedVersions.items()
+                if self.versions.get((runId, assetId), 0) != version
+            ]
+            if conflicts:
+                raise StateConflict(conflicts)
+            for assetId, version in nextVersions(entries, expectedVersions).items():
+                self.versions[(runId, assetId)] = version
+            for entry in entries:
+                self.entries.setdefault((runId, entry["assetId"]), {})[
+                    int(entry["sequence"])
+                ] = dict(entry)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
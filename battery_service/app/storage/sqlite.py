@@ -0,0 +1,139 @@
+import sqlite3
+from decimal import Decimal
+from os import getenv
+from threading import Lock
+from typing import Dict, Iterable, List
+
+from app.storage.base import StateConflict, nextVersions
+
+SQLITE_LOCATION = getenv("SVC_SQLITE_LOCATION", "./battery_state.db")
+
+LEDGER_TEXT_COLUMNS = ["runId", "assetId", "kind", "settlementPeriodDay"]
+## quantities are kept as text so Decimals come back exactly as they were put,
+## those an entry does not have are NULL
+LEDGER_DECIMAL_COLUMNS = [
+    "settlementPeriodStartTimeEpoch",
+    "volume",
+    "chargeLevelAtPeriodStart",
+    "sameDayImportTotal",
+    "sameDayExportTotal",
+    "cumulativeImportTotal",
+    "cumulativeExportTotal",
+]
+LEDGER_COLUMNS = ["sequence"] + LEDGER_TEXT_COLUMNS + LEDGER_DECIMAL_COLUMNS
+
+
+class SqliteStateStore:
+    """
+    Keeps the ledgers in a local SQLite file in WAL mode, indexed on the run,
+    asset and sequence. Pass ":memory:" for a throwaway database.
+    """
+
+    def __init__(self, location: str = SQLITE_LOCATION):
+        ## endpoints run in a thread pool, the connection is shared under a lock
+        self.connection = sqlite3.connect(location, check_same_thread=False)
+        self.lock = Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(f"""
+                CREATE TABLE IF NOT EXISTS battery_ledger (
+                    sequence INTEGER NOT NULL,
+                    {", ".join(f"{column} TEXT NOT NULL" for column in LEDGER_TEXT_COLUMNS)},
+                    {", ".join(f"{column} TEXT" for column in LEDGER_DECIMAL_COLUMNS)},
+                    PRIMARY KEY (runId, assetId, sequence)
+                )
+                """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS battery_asset_version (
+                    runId TEXT NOT NULL,
+                    assetId TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    PRIMARY KEY (runId, assetId)
+                )
+                """)
+
+    def load_entries(self, runId: str, assetId: str) -> List[dict]:
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(LEDGER_COLUMNS)} FROM battery_ledger "
+                "WHERE runId = ? AND assetId = ? ORDER BY sequence",
+                [runId, assetId],
+            ).fetchall()
+        textColumns = len(LEDGER_TEXT_COLUMNS) + 1
+        return [
+            {
+                "sequence": row[0],
+                **dict(zip(LEDGER_TEXT_COLUMNS, row[1:textColumns])),
+                **{
+                    column: Decimal(value)
+                    for (column, value) in zip(
+                        LEDGER_DECIMAL_COLUMNS, row[textColumns:]
+                    )
+                    if value is not None
+                },
+            }
+            for row in rows
+        ]
+
+    def load_version(self, runId: str, assetId: str) -> int:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT version FROM battery_asset_version "
+                "WHERE runId = ? AND assetId = ?",
+                [runId, assetId],
+            ).fetchone()
+        return row[0] if row else 0
+
+    def append(
+        self, runId: str, entries: Iterable[dict], expectedVersions: Dict[str, int]
+    ) -> None:
+        """
+        Add all of `entries` in one transaction, which the conditional version
+        updates roll back on a conflict, also with other processes.
+        """
+        entries = list(entries)
+        rows = [
+            [int(entry["sequence"])]
+            + [entry[column] for column in LEDGER_TEXT_COLUMNS]
+            + [
+                str(entry[column]) if column in entry else None
+                for column in LEDGER_DECIMAL_COLUMNS
+            ]
+            for entry in entries
+        ]
+        versions = nextVersions(entries, expectedVersions)
+        with self.lock, self.connection:
+            conflicts = [
+                assetId
+                for (assetId, version) in expectedVersions.items()
+                if not self.advanceVersion(runId, assetId, version, versions[assetId])
+            ]
+            if conflicts:
+                raise StateConflict(conflicts)
+            self.connection.executemany(
+                f"INSERT INTO battery_ledger ({', '.join(LEDGER_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(LEDGER_COLUMNS))})",
+                rows,
+            )
+
+    def advanceVersion(
+        self, runId: str, assetId: str, version: int, nextVersion: int
+    ) -> bool:
+        if version == 0:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO battery_asset_version VALUES (?, ?, ?)",
+                [runId, assetId, nextVersion],
+            )
+        else:
+            cursor = self.connection.execute(
+                "UPDATE battery_asset_version SET version = ? "
+                "WHERE runId = ? AND assetId = ? AND version = ?",
+                [nextVersion, runId, assetId, version],
+            )
+        return cursor.rowcount == 1
+
+    def clear(self) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM battery_ledger")
+            self.connection.execute("DELETE FROM battery_asset_version")
@@ -0,0 +1,35 @@
+from typing import Dict, Iterable, List
+
+from app.metrics import Histogram, timed
+from app.storage.base import StateStore
+
+STORE_SECONDS = Histogram(
+    "battery_store_duration_seconds",
+    "Duration of battery state store calls, by operation.",
+    ("operation",),
+)
+
+
+class TimedStateStore:
+    """Times every call to `store`, so store latency shows apart from the rest."""
+
+    def __init__(self, store: StateStore):
+        self.store = store
+
+    def load_entries(self, runId: str, assetId: str) -> List[dict]:
+        with timed(STORE_SECONDS, "store", "load_entries"):
+            return self.store.load_entries(runId, assetId)
+
+    def load_version(self, runId: str, assetId: str) -> int:
+        with timed(STORE_SECONDS, "store", "load_version"):
+            return self.store.load_version(runId, assetId)
+
+    def append(
+        self, runId: str, entries: Iterable[dict], expectedVersions: Dict[str, int]
+    ) -> None:
+        with timed(STORE_SECONDS, "store", "append"):
+            self.store.append(runId, entries, expectedVersions)
+
+    def clear(self) -> None:
+        with timed(STORE_SECONDS, "store", "clear"):
+            self.store.clear()
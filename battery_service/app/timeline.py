@@ -0,0 +1,226 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from decimal import Decimal
+from threading import Lock
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from fastapi import HTTPException
+
+DATE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+## a charge or discharge takes effect at the end of its settlement period
+SETTLEMENT_PERIOD = timedelta(minutes=30)
+
+## a rewind to here discards the whole ledger
+BEGINNING = datetime.fromtimestamp(0)
+
+## kinds of ledger entries
+SNAPSHOT = "snapshot"
+CHARGE = "charge"
+DISCHARGE = "discharge"
+REWIND = "rewind"
+
+SNAPSHOT_FIELDS = [
+    "assetId",
+    "settlementPeriodDay",
+    "settlementPeriodStartTimeEpoch",
+    "chargeLevelAtPeriodStart",
+    "sameDayImportTotal",
+    "sameDayExportTotal",
+    "cumulativeImportTotal",
+    "cumulativeExportTotal",
+]
+
+
+class StateTimeline:
+    """
+    In-memory index of the ledger of one battery asset. The ledger is an
+    append-only list of entries, numbered by `sequence`:
+
+    - snapshots of the full state at a settlement period start,
+    - charge and discharge events, of a volume in a settlement period, each
+      replacing any earlier event of the same settlement period,
+    - rewinds, which discard every event from a settlement period on and the
+      snapshots after it.
+
+    The state at any time is the latest snapshot at or before it, with the
+    events that took effect since folded in. The same-day totals are reset
+    whenever a day boundary is crossed. States are derived on every lookup and
+    never stored, except as snapshots.
+
+    `version` is the sequence of the latest entry the timeline was read at. A
+    reader that takes the version before the entries never sees a version
+    newer than its entries, so a write conditioned on it cannot lose updates.
+    """
+
+    def __init__(self):
+        self.snapshotEpochs: List[Decimal] = []
+        self.snapshots: Dict[Decimal, dict] = {}
+        ## keyed by the epoch they take effect at
+        self.eventEpochs: List[Decimal] = []
+        self.events: Dict[Decimal, dict] = {}
+        self.version = 0
+        ## endpoints run in a thread pool
+        self.lock = Lock()
+
+    def advance(self, entries: Iterable[dict], version: int):
+        """Apply the entries written at `version`, then move on to it."""
+        with self.lock:
+            for entry in entries:
+                self.apply(entry)
+            self.version = max(self.version, version)
+
+    def replace(self, entries: Iterable[dict], version: int):
+        """Swap in the entries and version read from the store."""
+        with self.lock:
+            self.reset()
+            for entry in sorted(entries, key=lambda entry: int(entry["sequence"])):
+                self.apply(entry)
+            self.version = version
+
+    def clear(self):
+        with self.lock:
+            self.reset()
+            self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.snapshotEpochs) + len(self.eventEpochs)
+
+    def at(self, dateTime: datetime, pending: Sequence[dict] = ()) -> dict:
+        """
+        The battery state in effect at `dateTime`. Events in `pending`, such
+        as the ones a batch has not written yet, are applied after the stored
+        ones.
+        """
+        return self.fold(dateTime, pending)[0]
+
+    def fold(
+        self, dateTime: datetime, pending: Sequence[dict] = ()
+    ) -> Tuple[dict, int]:
+        """The state at `dateTime` and the number of events folded to reach it."""
+        epoch = Decimal(dateTime.timestamp())
+        with self.lock:
+            index = bisect_right(self.snapshotEpochs, epoch)
+            ## pending events are newer than every snapshot, which cannot include them
+            for event in pending:
+                index = min(
+                    index, bisect_left(self.snapshotEpochs, effectiveEpoch(event))
+                )
+            if index == 0:
+                raise HTTPException(
+                    status_code=500,
+                    detail="no previous state found for the battery",
+                )
+            snapshotEpoch = self.snapshotEpochs[index - 1]
+            state = self.snapshots[snapshotEpoch]
+            events = {
+                eventEpoch: self.events[eventEpoch]
+                for eventEpoch in self.eventEpochs[
+                    bisect_right(self.eventEpochs, snapshotEpoch) : bisect_right(
+                        self.eventEpochs, epoch
+                    )
+                ]
+            }
+
+        for event in pending:
+            if effectiveEpoch(event) <= epoch:
+                events[effectiveEpoch(event)] = event
+        for eventEpoch in sorted(events):
+            state = applyEvent(state, events[eventEpoch])
+        return stateAt(state, dateTime), len(events)
+
+    def apply(self, entry: dict):
+        """Apply one ledger entry on top of all entries before it, lock held."""
+        epoch = Decimal(entry["settlementPeriodStartTimeEpoch"])
+        if entry["kind"] == SNAPSHOT:
+            if epoch not in self.snapshots:
+                insort(self.snapshotEpochs, epoch)
+            self.snapshots[epoch] = dict(entry)
+        elif entry["kind"] == REWIND:
+            index = bisect_left(self.eventEpochs, effectiveEpoch(entry))
+            dropFrom(self.eventEpochs, self.events, index)
+            dropFrom(
+                self.snapshotEpochs,
+                self.snapshots,
+                bisect_right(self.snapshotEpochs, epoch),
+            )
+        else:
+            eventEpoch = effectiveEpoch(entry)
+            if eventEpoch not in self.events:
+                insort(self.eventEpochs, eventEpoch)
+            self.events[eventEpoch] = dict(entry)
+            ## snapshots from when it takes effect on are missing the event
+            dropFrom(
+                self.snapshotEpochs,
+                self.snapshots,
+                bisect_left(self.snapshotEpochs, eventEpoch),
+            )
+
+    def reset(self):
+        self.snapshotEpochs.clear()
+        self.snapshots.clear()
+        self.eventEpochs.clear()
+        self.events.clear()
+
+
+def dropFrom(epochs: List[Decimal], entries: Dict[Decimal, dict], index: int):
+    """Remove the entries from `epochs[index]` on."""
+    for epoch in epochs[index:]:
+        del entries[epoch]
+    del epochs[index:]
+
+
+def ledgerEntry(kind: str, assetId: str, dateTime: datetime, **fields) -> dict:
+    """An entry of `kind` for the settlement period starting at `dateTime`."""
+    return {
+        "assetId": assetId,
+        "kind": kind,
+        "settlementPeriodDay": dateTime.date().isoformat(),
+        "settlementPeriodStartTimeEpoch": Decimal(dateTime.timestamp()),
+        **fields,
+    }
+
+
+def snapshotOf(state: dict) -> dict:
+    """A snapshot entry of `state`."""
+    return {**{field: state[field] for field in SNAPSHOT_FIELDS}, "kind": SNAPSHOT}
+
+
+def effectiveEpoch(entry: dict) -> Decimal:
+    """The epoch an event takes effect at, the end of its settlement period."""
+    return Decimal(entry["settlementPeriodStartTimeEpoch"]) + Decimal(
+        SETTLEMENT_PERIOD.total_seconds()
+    )
+
+
+def applyEvent(state: dict, event: dict) -> dict:
+    """
+    The state at the end of the settlement period of `event`, after charging
+    or discharging its volume from `state`.
+    """
+    dateTime = datetime.fromtimestamp(float(event["settlementPeriodStartTimeEpoch"]))
+    volume = Decimal(event["volume"])
+    nextState = stateAt(state, dateTime)
+    if event["kind"] == CHARGE:
+        nextState["chargeLevelAtPeriodStart"] += volume
+        nextState["sameDayImportTotal"] += volume
+        nextState["cumulativeImportTotal"] += volume
+    else:
+        nextState["chargeLevelAtPeriodStart"] -= volume
+        nextState["sameDayExportTotal"] += volume
+        nextState["cumulativeExportTotal"] += volume
+    return stateAt(nextState, dateTime + SETTLEMENT_PERIOD)
+
+
+def stateAt(lastKnownState: dict, dateTime: datetime) -> dict:
+    """Carry `lastKnownState` forward to `dateTime`."""
+    state = {
+        **lastKnownState,
+        "settlementPeriodDay": dateTime.date().isoformat(),
+        "settlementPeriodStartTimeEpoch": Decimal(dateTime.timestamp()),
+        "settlementPeriodStartTime": dateTime.strftime(DATE_TIME_FORMAT),
+    }
+    if lastKnownState["settlementPeriodDay"] != state["settlementPeriodDay"]:
+        ## day rollover, nothing has been imported or exported on the new day
+        state["sameDayImportTotal"] = Decimal(0)
+        state["sameDayExportTotal"] = Decimal(0)
+    return state
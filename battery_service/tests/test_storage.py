@@ -0,0 +1,148 @@
+from decimal import Decimal
+from os import getenv
+from uuid import uuid4
+
+import pytest
+
+from app.storage import BatchTooLarge, StateConflict, createUntimedStore
+
+RUN_ID = "run-1"
+EPOCH = Decimal(1633305600)
+
+
+@pytest.fixture(params=["memory", "sqlite", "dynamodb"])
+def store(request):
+    if request.param == "sqlite":
+        from app.storage.sqlite import SqliteStateStore
+
+        store = SqliteStateStore(":memory:")
+    elif request.param == "dynamodb":
+        if not getenv("SVC_DYNAMODB_HOST"):
+            pytest.skip("SVC_DYNAMODB_HOST is not set to a DynamoDB to test against")
+        from app.storage.dynamodb import DynamoDbStateStore
+
+        ## tables of their own, so runs against a shared DynamoDB do not collide
+        suffix = uuid4().hex
+        store = DynamoDbStateStore(
+            f"BATTERY_LEDGER_{suffix}", f"BATTERY_ASSET_VERSION_{suffix}"
+        )
+    else:
+        store = createUntimedStore(request.param)
+    yield store
+    store.clear()
+
+
+def charges(assetId: str, firstSequence: int, count: int) -> list:
+    return [
+        {
+            "runId": RUN_ID,
+            "assetId": assetId,
+            "sequence": firstSequence + index,
+            "kind": "charge",
+            "settlementPeriodDay": "2021-10-04",
+            "settlementPeriodStartTimeEpoch": EPOCH + 1800 * index,
+            "volume": Decimal("0.1"),
+        }
+        for index in range(count)
+    ]
+
+
+def stored(entries: list) -> list:
+    """The entries as they were put, without any keys the store adds."""
+    return sorted(
+        (
+            {
+                **{field: entry[field] for field in charges("", 0, 1)[0]},
+                "sequence": int(entry["sequence"]),
+            }
+            for entry in entries
+        ),
+        key=lambda entry: entry["sequence"],
+    )
+
+
+def test_appended_entries_load_back_exactly(store):
+    entries = charges("battery-1", 1, 3)
+
+    store.append(RUN_ID, entries, {"battery-1": 0})
+
+    assert stored(store.load_entries(RUN_ID, "battery-1")) == entries
+    assert store.load_version(RUN_ID, "battery-1") == 3
+    assert store.load_entries(RUN_ID, "battery-2") == []
+    assert store.load_version(RUN_ID, "battery-2") == 0
+
+
+def test_append_at_a_stale_version_raises_state_conflict(store):
+    store.append(RUN_ID, charges("battery-1", 1, 2), {"battery-1": 0})
+    store.append(RUN_ID, charges("battery-1", 3, 1), {"battery-1": 2})
+
+    with pytest.raises(StateConflict) as conflict:
+        store.append(RUN_ID, charges("battery-1", 3, 1), {"battery-1": 2})
+
+    assert conflict.value.assetIds == ["battery-1"]
+    assert store.load_version(RUN_ID, "battery-1") == 3
+    assert len(store.load_entries(RUN_ID, "battery-1")) == 3
+
+
+def test_first_append_conflicts_once_the_ledger_exists(store):
+    store.append(RUN_ID, charges("battery-1", 1, 1), {"battery-1": 0})
+
+    with pytest.raises(StateConflict):
+        store.append(RUN_ID, charges("battery-1", 1, 1), {"battery-1": 0})
+
+
+def test_conflicting_append_writes_none_of_its_assets(store):
+    store.append(RUN_ID, charges("battery-1", 1, 1), {"battery-1": 0})
+
+    with pytest.raises(StateConflict) as conflict:
+        store.append(
+            RUN_ID,
+            charges("battery-2", 1, 1) + charges("battery-1", 1, 1),
+            {"battery-2": 0, "battery-1": 0},
+        )
+
+    assert conflict.value.assetIds == ["battery-1"]
+    assert store.load_version(RUN_ID, "battery-2") == 0
+    assert store.load_entries(RUN_ID, "battery-2") == []
+
+
+def test_ledgers_of_other_runs_are_separate(store):
+    store.append(RUN_ID, charges("battery-1", 1, 2), {"battery-1": 0})
+
+    store.append(
+        "run-2",
+        [{**entry, "runId": "run-2"} for entry in charges("battery-1", 1, 1)],
+        {"battery-1": 0},
+    )
+
+    assert store.load_version(RUN_ID, "battery-1") == 2
+    assert store.load_version("run-2", "battery-1") == 1
+
+
+def test_appends_larger_than_a_transaction_load_back(store):
+    ## 48 settlement periods of one battery and one of each of 20 more
+    entries = charges("battery-0", 1, 48) + [
+        entry for index in range(1, 21) for entry in charges(f"battery-{index}", 1, 1)
+    ]
+
+    store.append(RUN_ID, entries, {f"battery-{index}": 0 for index in range(21)})
+
+    assert stored(store.load_entries(RUN_ID, "battery-0")) == charges(
+        "battery-0", 1, 48
+    )
+    assert store.load_version(RUN_ID, "battery-20") == 1
+
+
+def test_dynamodb_rejects_more_batteries_than_a_transaction_takes(store):
+    if not hasattr(store, "transactVersionUpdates"):
+        pytest.skip("only DynamoDB limits the batteries of one append")
+    from app.storage.dynamodb import MAX_TRANSACTION_ITEMS
+
+    assetIds = [f"battery-{index}" for index in range(MAX_TRANSACTION_ITEMS + 1)]
+
+    with pytest.raises(BatchTooLarge):
+        store.append(
+            RUN_ID,
+            [entry for assetId in assetIds for entry in charges(assetId, 1, 1)],
+            {assetId: 0 for assetId in assetIds},
+        )
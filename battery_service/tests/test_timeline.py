@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from app.timeline import (
+    BEGINNING,
+    CHARGE,
+    DISCHARGE,
+    REWIND,
+    SNAPSHOT,
+    StateTimeline,
+    ledgerEntry,
+)
+
+ASSET_ID = "battery-1"
+START = datetime(2021, 10, 4)
+
+
+def at(minutes: int) -> datetime:
+    return START + timedelta(minutes=minutes)
+
+
+def numbered(entries: list) -> list:
+    return [{**entry, "sequence": index + 1} for (index, entry) in enumerate(entries)]
+
+
+def firstState() -> dict:
+    return ledgerEntry(
+        SNAPSHOT,
+        ASSET_ID,
+        START,
+        chargeLevelAtPeriodStart=Decimal(0),
+        sameDayImportTotal=Decimal(0),
+        sameDayExportTotal=Decimal(0),
+        cumulativeImportTotal=Decimal(0),
+        cumulativeExportTotal=Decimal(0),
+    )
+
+
+def chargeAndDischarge() -> list:
+    return numbered(
+        [
+            firstState(),
+            ledgerEntry(CHARGE, ASSET_ID, at(0), volume=Decimal(5)),
+            ledgerEntry(CHARGE, ASSET_ID, at(30), volume=Decimal(5)),
+            ledgerEntry(DISCHARGE, ASSET_ID, at(60), volume=Decimal(5)),
+        ]
+    )
+
+
+def quantities(state: dict) -> tuple:
+    return (
+        state["chargeLevelAtPeriodStart"],
+        state["sameDayImportTotal"],
+        state["sameDayExportTotal"],
+        state["cumulativeImportTotal"],
+        state["cumulativeExportTotal"],
+    )
+
+
+def test_events_take_effect_at_the_end_of_their_settlement_period():
+    timeline = StateTimeline()
+    entries = chargeAndDischarge()
+    timeline.advance(entries, len(entries))
+
+    assert quantities(timeline.at(at(0))) == (0, 0, 0, 0, 0)
+    assert quantities(timeline.at(at(30))) == (5, 5, 0, 5, 0)
+    assert quantities(timeline.at(at(60))) == (10, 10, 0, 10, 0)
+    assert quantities(timeline.at(at(90))) == (5, 10, 5, 10, 5)
+    assert timeline.version == len(entries)
+
+
+def test_day_totals_reset_on_a_new_day():
+    timeline = StateTimeline()
+    timeline.advance(chargeAndDischarge(), 4)
+
+    state = timeline.at(at(24 * 60))
+
+    assert quantities(state) == (5, 0, 0, 10, 5)
+    assert state["settlementPeriodDay"] == "2021-10-05"
+
+
+def test_rewind_restores_the_earlier_state():
+    timeline = StateTimeline()
+    timeline.advance(chargeAndDischarge(), 4)
+    stateBefore = timeline.at(at(30))
+
+    timeline.advance([{**ledgerEntry(REWIND, ASSET_ID, at(30)), "sequence": 5}], 5)
+
+    ## the charge and discharge from the rewind on are gone
+    assert timeline.at(at(30)) == stateBefore
+    assert quantities(timeline.at(at(90))) == quantities(stateBefore)
+    assert timeline.version == 5
+
+
+def test_rewind_to_the_beginning_discards_the_ledger():
+    timeline = StateTimeline()
+    timeline.advance(chargeAndDischarge(), 4)
+
+    timeline.advance([{**ledgerEntry(REWIND, ASSET_ID, BEGINNING), "sequence": 5}], 5)
+
+    assert len(timeline) == 0
+    with pytest.raises(HTTPException):
+        timeline.at(at(0))
+
+
+def test_replace_matches_advancing_entry_by_entry():
+    entries = numbered(
+        chargeAndDischarge()
+        + [
+            ledgerEntry(REWIND, ASSET_ID, at(30)),
+            ledgerEntry(DISCHARGE, ASSET_ID, at(60), volume=Decimal(5)),
+        ]
+    )
+    advanced = StateTimeline()
+    for entry in entries:
+        advanced.advance([entry], entry["sequence"])
+    replaced = StateTimeline()
+    ## the store may hand entries back in any order
+    replaced.replace(reversed(entries), len(entries))
+
+    for minutes in range(0, 180, 30):
+        assert replaced.at(at(minutes)) == advanced.at(at(minutes))
+    assert quantities(replaced.at(at(90))) == (0, 5, 5, 5, 5)
+    assert replaced.version == advanced.version
+
+
+def test_pending_events_are_applied_after_stored_ones():
+    timeline = StateTimeline()
+    timeline.advance(numbered([firstState()]), 1)
+    pending = [ledgerEntry(CHARGE, ASSET_ID, at(0), volume=Decimal(5))]
+
+    assert quantities(timeline.at(at(30), pending)) == (5, 5, 0, 5, 0)
+    ## nothing was written
+    assert quantities(timeline.at(at(30))) == (0, 0, 0, 0, 0)
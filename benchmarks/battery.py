@@ -0,0 +1,132 @@
+"""
+Battery service benchmarks: state reads, charges and discharges, transition
+batches and run resets, through the endpoint functions and the store chosen by
+SVC_BATTERY_STORAGE. Run from battery_service by `run.py`, which picks the
+in-memory store unless told otherwise.
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import cycle
+import logging
+from uuid import uuid4
+
+from harness import report, suiteArguments, timeCalls
+
+from app import main
+from app.models import (
+    DEFAULT_ASSET_ID,
+    BatteryAction,
+    ChargeRequest,
+    DischargeRequest,
+    StateTransition,
+    StateTransitionBatch,
+)
+from app.storage import BATTERY_STORAGE
+
+FIRST_SETTLEMENT_PERIOD_START = datetime(2021, 10, 4)
+SETTLEMENT_PERIOD = timedelta(minutes=30)
+PERIODS_PER_DAY = 48
+## small enough for a day of alternating charges to stay within the cycle limits
+VOLUME = Decimal("0.5")
+
+
+def settlementPeriodStartTimes(numberOfPeriods: int):
+    return [
+        (FIRST_SETTLEMENT_PERIOD_START + period * SETTLEMENT_PERIOD).strftime(
+            main.DATE_TIME_FORMAT
+        )
+        for period in range(numberOfPeriods)
+    ]
+
+
+def newRun() -> str:
+    return uuid4().hex
+
+
+def runDay(runId: str, startTimes):
+    """Alternate charging and discharging the battery over `startTimes`."""
+    for period, startTime in enumerate(startTimes):
+        if period % 2 == 0:
+            main.charge_battery(
+                ChargeRequest(
+                    settlementPeriodStartTime=startTime, bidVolume=VOLUME, runId=runId
+                )
+            )
+        else:
+            main.discharge_battery(
+                DischargeRequest(
+                    settlementPeriodStartTime=startTime,
+                    offerVolume=VOLUME,
+                    runId=runId,
+                )
+            )
+
+
+if __name__ == "__main__":
+    arguments = suiteArguments(__doc__.split("\n\n")[0].strip()).parse_args()
+    ## every new run warns that it is seeded
+    logging.disable(logging.WARNING)
+    startTimes = settlementPeriodStartTimes(PERIODS_PER_DAY)
+
+    ## a day of events to read from and reset
+    dayRunId = newRun()
+    main.get_battery_state(startTimes[0], DEFAULT_ASSET_ID, dayRunId)
+    runDay(dayRunId, startTimes)
+    readTimes = cycle(startTimes)
+
+    def freshDay():
+        runId = newRun()
+        main.get_battery_state(startTimes[0], DEFAULT_ASSET_ID, runId)
+        runDay(runId, startTimes)
+
+    def freshBatch():
+        main.apply_state_transitions(
+            StateTransitionBatch(
+                runId=newRun(),
+                transitions=[
+                    StateTransition(
+                        settlementPeriodStartTime=startTime,
+                        action=(
+                            BatteryAction.charge
+                            if period % 2 == 0
+                            else BatteryAction.discharge
+                        ),
+                        volume=VOLUME,
+                    )
+                    for (period, startTime) in enumerate(startTimes)
+                ],
+            )
+        )
+
+    results = [
+        timeCalls(
+            "battery.get_battery_state",
+            lambda: main.get_battery_state(next(readTimes), DEFAULT_ASSET_ID, dayRunId),
+            repeat=arguments.repeat,
+            number=100,
+            storage=BATTERY_STORAGE,
+        ),
+        timeCalls(
+            "battery.charge_discharge",
+            freshDay,
+            repeat=arguments.repeat,
+            operations=PERIODS_PER_DAY,
+            storage=BATTERY_STORAGE,
+        ),
+        timeCalls(
+            "battery.apply_state_transitions",
+            freshBatch,
+            repeat=arguments.repeat,
+            operations=PERIODS_PER_DAY,
+            storage=BATTERY_STORAGE,
+        ),
+        timeCalls(
+            "battery.reset_run",
+            lambda: main.reset_run(dayRunId),
+            repeat=arguments.repeat,
+            storage=BATTERY_STORAGE,
+        ),
+    ]
+
+    report(results)
@@ -0,0 +1,68 @@
+"""
+Compare the medians of two benchmark reports written by `run.py`, and fail if
+any benchmark got worse by more than the threshold.
+
+    python benchmarks/compare.py baseline.json current.json --threshold 0.1
+"""
+
+import json
+import sys
+from argparse import ArgumentParser
+from typing import Dict, Tuple
+
+
+def resultsByKey(reportFileName: str) -> Dict[Tuple[str, str, str], dict]:
+    with open(reportFileName, "r") as read:
+        report = json.load(read)
+    return {
+        (
+            entry["suite"],
+            entry["name"],
+            json.dumps(entry["params"], sort_keys=True),
+        ): entry
+        for entry in report["results"]
+    }
+
+
+def describeParams(entry: dict) -> str:
+    return ", ".join(
+        f"{name}={value}"
+        for (name, value) in entry["params"].items()
+        if name not in ("number", "operations")
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("baseline", help="report to compare against")
+    parser.add_argument("current", help="report to compare")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change of a median that counts as a regression",
+    )
+    arguments = parser.parse_args()
+
+    baseline = resultsByKey(arguments.baseline)
+    current = resultsByKey(arguments.current)
+    regressions = 0
+    for key in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[key], current[key]
+        change = after["median"] / before["median"] - 1 if before["median"] else 0.0
+        worse = -change if after["higherIsBetter"] else change
+        regressed = worse > arguments.threshold
+        regressions += regressed
+        print(
+            f"{'REGRESSED' if regressed else '':<10}{key[1]:<45} {change:+8.1%}"
+            f"  {describeParams(after)}"
+        )
+    for key in sorted(baseline.keys() ^ current.keys()):
+        reportFileName = arguments.baseline if key in baseline else arguments.current
+        entry = baseline.get(key) or current[key]
+        print(f"{'':<10}{key[1]:<45} only in {reportFileName}  {describeParams(entry)}")
+
+    print(
+        f"{regressions} of {len(baseline.keys() & current.keys())} benchmarks regressed"
+    )
+    sys.exit(1 if regressions else 0)
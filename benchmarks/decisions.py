@@ -0,0 +1,114 @@
+"""
+Strategy decision benchmarks: greedy candidate prices, solving the optimal
+dispatch policy and deciding the dispatch of fleets of battery states. Run from
+optimiser_service by `run.py`.
+"""
+
+from itertools import cycle
+
+import numpy as np
+
+from harness import report, suiteArguments, timeCalls
+
+from app.backends.embedded import EmbeddedMarket, loadFleet
+from app.decisions import LIMITS, dispatchDecisions, greedyDayPrices
+from app.strategies import (
+    NUMBER_OF_CANDIDATES,
+    optimal_dispatch_policy,
+    optimal_dispatch_prices,
+)
+from app.utils import convertFromFormatToDateTime
+
+STEPS_PER_DAY = 48
+FLEET_SIZES = [1, 20, 1000]
+
+if __name__ == "__main__":
+    arguments = suiteArguments(__doc__.split("\n\n")[0].strip()).parse_args()
+    market = EmbeddedMarket()
+    predictionWindow = market.get_predictions_for_range(
+        market.requestTimes[0], market.requestTimes[-1]
+    )
+    rows = cycle(range(len(market.requestTimes) - STEPS_PER_DAY))
+    ## the windows a run's prefetcher loads, a day of vintages each
+    dayWindows = cycle(
+        [
+            market.get_predictions_for_range(
+                market.requestTimes[first],
+                market.requestTimes[first + STEPS_PER_DAY - 1],
+            )
+            for first in range(0, len(market.requestTimes) - STEPS_PER_DAY, 8)
+        ]
+    )
+    asset = loadFleet(None)[0]
+    limits = {limit: float(asset[limit]) for limit in LIMITS}
+
+    def greedyDay():
+        dayWindow = next(dayWindows)
+        ## candidates are selected once per window, count that with the day
+        dayWindow.candidates.clear()
+        greedyDayPrices(dayWindow, 0, STEPS_PER_DAY, NUMBER_OF_CANDIDATES)
+
+    def optimalPolicy():
+        row = next(rows)
+        return optimal_dispatch_policy(
+            predictionWindow=predictionWindow,
+            predictionRow=row,
+            simulationTimestamp=convertFromFormatToDateTime(market.requestTimes[row]),
+            asset=asset,
+        )
+
+    results = [
+        timeCalls(
+            "decisions.greedyDayPrices",
+            greedyDay,
+            repeat=arguments.repeat,
+            number=10,
+            steps=STEPS_PER_DAY,
+            numberOfCandidates=NUMBER_OF_CANDIDATES,
+        ),
+        timeCalls(
+            "strategies.optimal_dispatch_policy",
+            optimalPolicy,
+            repeat=arguments.repeat,
+        ),
+    ]
+
+    policy = optimalPolicy()
+    random = np.random.default_rng(0)
+    for fleetSize in FLEET_SIZES:
+        ## states on the 5 MWh grid the batteries move on
+        chargeLevel = 5.0 * random.integers(0, 3, fleetSize)
+        importedToday = 5.0 * random.integers(0, 5, fleetSize)
+        exportedToday = 5.0 * random.integers(0, 5, fleetSize)
+        bidPrices, offerPrices = optimal_dispatch_prices(
+            policy, chargeLevel, importedToday, exportedToday
+        )
+        results.extend(
+            [
+                timeCalls(
+                    "strategies.optimal_dispatch_prices",
+                    lambda: optimal_dispatch_prices(
+                        policy, chargeLevel, importedToday, exportedToday
+                    ),
+                    repeat=arguments.repeat,
+                    number=100,
+                    fleetSize=fleetSize,
+                ),
+                timeCalls(
+                    "decisions.dispatchDecisions",
+                    lambda: dispatchDecisions(
+                        bidPrices=bidPrices,
+                        offerPrices=offerPrices,
+                        chargeLevel=chargeLevel,
+                        importedToday=importedToday,
+                        exportedToday=exportedToday,
+                        **limits,
+                    ),
+                    repeat=arguments.repeat,
+                    number=100,
+                    fleetSize=fleetSize,
+                ),
+            ]
+        )
+
+    report(results)
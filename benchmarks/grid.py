@@ -0,0 +1,41 @@
+"""
+Mock grid operator benchmarks: parsing and evaluating bid offer pairs as the
+submissions endpoint does. Run from mock_grid_operator_service by `run.py`.
+"""
+
+from random import seed
+
+from harness import report, suiteArguments, timeCalls
+
+from app.main import BidOfferPair, evaluate_offer_or_bid
+
+SUBMISSION = {
+    "submissionTime": "2021-10-04T00:00:00",
+    "settlementPeriodStartTime": "2021-10-04T01:00:00",
+    "offerPrice": "81.23",
+    "offerVolume": "5",
+    "bidPrice": "0",
+    "bidVolume": "0",
+}
+IDLE_SUBMISSION = {**SUBMISSION, "offerPrice": "0", "offerVolume": "0"}
+
+if __name__ == "__main__":
+    arguments = suiteArguments(__doc__.split("\n\n")[0].strip()).parse_args()
+    seed(0)
+
+    results = [
+        timeCalls(
+            "grid.evaluate_offer_or_bid",
+            lambda: evaluate_offer_or_bid(BidOfferPair.parse_obj(SUBMISSION)),
+            repeat=arguments.repeat,
+            number=1000,
+        ),
+        timeCalls(
+            "grid.evaluate_offer_or_bid.idle",
+            lambda: evaluate_offer_or_bid(BidOfferPair.parse_obj(IDLE_SUBMISSION)),
+            repeat=arguments.repeat,
+            number=1000,
+        ),
+    ]
+
+    report(results)
@@ -0,0 +1,85 @@
+"""
+Timing and reporting shared by the benchmark suites.
+
+Every suite is a script that `run.py` starts with a service folder as its
+working directory and on its path, so it imports that service's `app` package
+as the service itself would. A suite prints its results to stdout as a JSON
+list, one entry per benchmark.
+"""
+
+import json
+import sys
+from argparse import ArgumentParser
+from statistics import mean, median, pstdev
+from time import perf_counter
+from typing import Callable, List
+
+
+def summarise(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "min": ordered[0],
+        "median": median(ordered),
+        "mean": mean(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max": ordered[-1],
+        "stdev": pstdev(ordered),
+        "samples": len(ordered),
+    }
+
+
+def result(
+    name: str,
+    samples: List[float],
+    *,
+    unit: str = "s",
+    higherIsBetter: bool = False,
+    **params,
+) -> dict:
+    """One benchmark's entry of the report, `samples` summarised."""
+    return {
+        "name": name,
+        "unit": unit,
+        "higherIsBetter": higherIsBetter,
+        **summarise(samples),
+        "params": params,
+    }
+
+
+def timeCalls(
+    name: str,
+    call: Callable[[], object],
+    *,
+    repeat: int,
+    number: int = 1,
+    operations: int = 1,
+    warmup: int = 1,
+    **params,
+) -> dict:
+    """
+    Seconds per operation of `call`, which does `operations` of them, over
+    `repeat` samples of `number` calls each. The first `warmup` calls are not
+    timed, so caches and lazy imports are not counted.
+    """
+    for _ in range(warmup):
+        call()
+    samples = []
+    for _ in range(repeat):
+        startTime = perf_counter()
+        for _ in range(number):
+            call()
+        samples.append((perf_counter() - startTime) / (number * operations))
+    return result(name, samples, number=number, operations=operations, **params)
+
+
+def suiteArguments(description: str) -> ArgumentParser:
+    parser = ArgumentParser(description=description)
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="timed samples per benchmark"
+    )
+    return parser
+
+
+def report(results: List[dict]):
+    json.dump(results, sys.stdout)
+    sys.stdout.write("\n")
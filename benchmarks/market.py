@@ -0,0 +1,95 @@
+"""
+Market service benchmarks: prediction lookups from the store the service loads
+on startup, the endpoints rendering them, and range reads from a chunked
+dataset. Run from market_service by `run.py`.
+"""
+
+from itertools import cycle
+from os import path
+from random import Random
+from tempfile import TemporaryDirectory
+
+from harness import report, suiteArguments, timeCalls
+
+from app import main
+from app.dataset import ChunkedPredictionDataset, writeChunkedDataset
+from app.store import DATE_TIME_FORMAT
+
+## prediction vintages in a day of 30 minute requests
+VINTAGES_PER_DAY = 48
+
+if __name__ == "__main__":
+    arguments = suiteArguments(__doc__.split("\n\n")[0].strip()).parse_args()
+    main.load_predictions_into_memory()
+    store = main.prediction_sources[main.DEFAULT_MARKET]
+
+    random = Random(0)
+    indices = cycle(random.sample(range(len(store)), min(len(store), 64)))
+    dayIndices = cycle(
+        random.choices(range(max(len(store) - VINTAGES_PER_DAY, 1)), k=64)
+    )
+    requestTimes = [
+        store.requestTime(index).strftime(DATE_TIME_FORMAT)
+        for index in range(len(store))
+    ]
+    timesOfPredictionRequest = cycle(random.sample(requestTimes, len(requestTimes)))
+
+    def dayRange(format: main.PredictionEncoding):
+        firstIndex = next(dayIndices)
+        lastIndex = min(firstIndex + VINTAGES_PER_DAY, len(store)) - 1
+        return main.get_predictions_for_range(
+            requestTimes[firstIndex],
+            requestTimes[lastIndex],
+            format,
+            main.DEFAULT_MARKET,
+        )
+
+    results = [
+        timeCalls(
+            "market.requestIndex",
+            lambda: store.requestIndex(store.requestTime(next(indices))),
+            repeat=arguments.repeat,
+            number=1000,
+        ),
+        timeCalls(
+            "market.get_predictions",
+            lambda: main.get_predictions(next(timesOfPredictionRequest)),
+            repeat=arguments.repeat,
+            number=100,
+        ),
+        timeCalls(
+            "market.get_predictions_for_range.records",
+            lambda: dayRange(main.PredictionEncoding.records),
+            repeat=arguments.repeat,
+            number=10,
+            vintages=VINTAGES_PER_DAY,
+        ),
+        timeCalls(
+            "market.get_predictions_for_range.columnar",
+            lambda: dayRange(main.PredictionEncoding.columnar),
+            repeat=arguments.repeat,
+            number=10,
+            vintages=VINTAGES_PER_DAY,
+        ),
+    ]
+
+    with TemporaryDirectory() as datasetLocation:
+        writeChunkedDataset(store, path.join(datasetLocation, "benchmark"))
+        dataset = ChunkedPredictionDataset(path.join(datasetLocation, "benchmark"))
+
+        def datasetDay():
+            firstIndex = next(dayIndices)
+            dataset.offerPricesBetween(firstIndex, firstIndex + VINTAGES_PER_DAY)
+            dataset.bidPricesBetween(firstIndex, firstIndex + VINTAGES_PER_DAY)
+
+        results.append(
+            timeCalls(
+                "market.dataset.pricesBetween",
+                datasetDay,
+                repeat=arguments.repeat,
+                number=100,
+                vintages=VINTAGES_PER_DAY,
+            )
+        )
+
+    report(results)
@@ -0,0 +1,165 @@
+"""
+Run the benchmark suites of the services and write their results as one JSON
+report, so runs on different commits can be compared with `compare.py`.
+
+    python benchmarks/run.py --output benchmarks/results/$(git rev-parse --short HEAD).json
+"""
+
+import json
+import platform
+import subprocess
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from os import cpu_count, environ, makedirs, path, pathsep
+from typing import List, Optional
+
+from compare import describeParams
+
+BENCHMARKS_LOCATION = path.dirname(path.abspath(__file__))
+REPOSITORY_LOCATION = path.dirname(BENCHMARKS_LOCATION)
+
+## the service folder every suite runs from, and the settings it runs with
+SUITES = {
+    "market": ("market_service", {}),
+    "battery": ("battery_service", {}),
+    "grid": ("mock_grid_operator_service", {}),
+    "decisions": ("optimiser_service", {"SVC_LOG_TO_CONSOLE": "false"}),
+    "strategy": (
+        "optimiser_service",
+        {"SVC_LOG_TO_CONSOLE": "false", "SVC_RECORD_RESULTS": "false"},
+    ),
+}
+
+
+def gitOutput(*arguments: str) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", *arguments],
+            cwd=REPOSITORY_LOCATION,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runSuite(suite: str, suiteArguments: List[str], settings: dict) -> List[dict]:
+    """
+    Run `suite` from its service folder, with that folder and the benchmarks on
+    the path, and return its results.
+    """
+    serviceFolder, suiteSettings = SUITES[suite]
+    serviceLocation = path.join(REPOSITORY_LOCATION, serviceFolder)
+    completed = subprocess.run(
+        [
+            sys.executable,
+            path.join(BENCHMARKS_LOCATION, f"{suite}.py"),
+            *suiteArguments,
+        ],
+        cwd=serviceLocation,
+        env={
+            **environ,
+            **suiteSettings,
+            **settings,
+            "PYTHONPATH": pathsep.join([serviceLocation, BENCHMARKS_LOCATION]),
+        },
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise Exception(f"exited with {completed.returncode}")
+    return [{"suite": suite, **entry} for entry in json.loads(completed.stdout)]
+
+
+def formatValue(value: float, unit: str) -> str:
+    if unit != "s":
+        return f"{value:.1f} {unit}"
+    for scale, scaleUnit in ((1, "s"), (1e-3, "ms"), (1e-6, "us")):
+        if value >= scale:
+            return f"{value / scale:.2f} {scaleUnit}"
+    return f"{value / 1e-9:.0f} ns"
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--suite",
+        choices=list(SUITES),
+        nargs="+",
+        default=list(SUITES),
+        help="suites to run",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="timed samples per benchmark"
+    )
+    parser.add_argument(
+        "--battery-storage",
+        default="memory",
+        help='SVC_BATTERY_STORAGE of the battery suite, "memory", "sqlite" or "dynamodb"',
+    )
+    parser.add_argument(
+        "--first", default="2021-10-04T00:00:00", help="first step of strategy runs"
+    )
+    parser.add_argument(
+        "--last", default="2021-10-04T22:00:00", help="last step of strategy runs"
+    )
+    parser.add_argument(
+        "--optimiser-url",
+        default=None,
+        help="run the strategy suite against this running optimiser",
+    )
+    parser.add_argument("--output", default=None, help="write the report here")
+    arguments = parser.parse_args()
+
+    strategyArguments = ["--first", arguments.first, "--last", arguments.last]
+    if arguments.optimiser_url:
+        strategyArguments += ["--optimiser-url", arguments.optimiser_url]
+
+    results = []
+    errors = {}
+    for suite in arguments.suite:
+        print(f"running {suite}", file=sys.stderr)
+        try:
+            results += runSuite(
+                suite,
+                ["--repeat", str(arguments.repeat)]
+                + (strategyArguments if suite == "strategy" else []),
+                (
+                    {"SVC_BATTERY_STORAGE": arguments.battery_storage}
+                    if suite == "battery"
+                    else {}
+                ),
+            )
+        except Exception as e:
+            errors[suite] = str(e)
+            print(f"{suite} failed, cause: {str(e)}", file=sys.stderr)
+
+    report = {
+        "commit": gitOutput("rev-parse", "HEAD"),
+        "dirty": bool(gitOutput("status", "--porcelain", "--untracked-files=no")),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": cpu_count(),
+        "repeat": arguments.repeat,
+        "results": results,
+        "errors": errors,
+    }
+    if arguments.output:
+        makedirs(path.dirname(path.abspath(arguments.output)), exist_ok=True)
+        with open(arguments.output, "w") as write:
+            json.dump(report, write, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    for entry in results:
+        print(
+            f"{entry['name']:<45} {formatValue(entry['median'], entry['unit']):>14}"
+            f"  p95 {formatValue(entry['p95'], entry['unit']):>14}"
+            f"  {describeParams(entry)}",
+            file=sys.stderr,
+        )
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,188 @@
+"""
+End to end strategy benchmarks: throughput and per-step latency of whole
+strategy runs. Runs in-process against the embedded services, or with
+`--optimiser-url` against a running optimiser and its services, streaming
+/strategy/ as NDJSON. Run from optimiser_service by `run.py`.
+"""
+
+import asyncio
+import json
+from datetime import datetime
+from decimal import Decimal
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import List, Tuple
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from uuid import uuid4
+
+from loguru import logger
+
+from harness import report, result, suiteArguments
+
+from app.backends.embedded import (
+    EmbeddedBattery,
+    EmbeddedGridOperator,
+    EmbeddedMarket,
+    EmbeddedServiceBackend,
+    loadFleet,
+)
+from app.logwriter import start_log_writer, stop_log_writer
+from app.models import Strategy
+from app.services import use_backend
+from app.simulation import iterate_strategy
+from app.strategies import NUMBER_OF_CANDIDATES
+from app.utils import convertFromFormatToDateTime
+
+FLEET_SIZES = [1, 20]
+
+
+def embeddedRun(
+    market: EmbeddedMarket,
+    first: datetime,
+    last: datetime,
+    strategy: Strategy,
+    fleetSize: int,
+) -> Tuple[List[float], float]:
+    """The seconds each step took and the whole run took, on fresh batteries."""
+    assets = loadFleet(
+        json.dumps(
+            [{"assetId": f"battery-{number}"} for number in range(1, fleetSize + 1)]
+        )
+    )
+    backend = EmbeddedServiceBackend(
+        market=market,
+        gridOperator=EmbeddedGridOperator(0),
+        battery=EmbeddedBattery(assets),
+    )
+
+    async def timedSteps() -> List[float]:
+        stepSeconds = []
+        stepStartTime = perf_counter()
+        async for _ in iterate_strategy(
+            first,
+            last,
+            numberOfCandidates=NUMBER_OF_CANDIDATES,
+            strategy=strategy,
+            assets=assets,
+        ):
+            stepEndTime = perf_counter()
+            stepSeconds.append(stepEndTime - stepStartTime)
+            stepStartTime = stepEndTime
+        return stepSeconds
+
+    startTime = perf_counter()
+    with use_backend(backend):
+        stepSeconds = asyncio.run(timedSteps())
+    return stepSeconds, perf_counter() - startTime
+
+
+def streamedRun(
+    optimiserUrl: str, first: str, last: str, strategy: Strategy
+) -> Tuple[List[float], float]:
+    """
+    The seconds each step took to arrive and the whole run took, streaming
+    /strategy/ in a run of its own.
+    """
+    query = urlencode(
+        {
+            "firstSettlementPeriodStart": first,
+            "lastSettlementPeriodStart": last,
+            "strategy": strategy.value,
+            "format": "ndjson",
+            "runId": f"benchmark-{uuid4().hex}",
+        }
+    )
+    stepSeconds = []
+    settlementPeriodStartTime = None
+    startTime = stepStartTime = perf_counter()
+    with urlopen(f"{optimiserUrl.rstrip('/')}/strategy/?{query}") as response:
+        for line in response:
+            outcome = json.loads(line, parse_float=Decimal)
+            if "detail" in outcome:
+                raise Exception(f"Strategy run failed, cause: {outcome['detail']}")
+            ## the assets of a step arrive together, a new time starts a new step
+            pair = outcome["submittedBidOfferPair"]
+            if pair["settlementPeriodStartTime"] != settlementPeriodStartTime:
+                settlementPeriodStartTime = pair["settlementPeriodStartTime"]
+                stepEndTime = perf_counter()
+                stepSeconds.append(stepEndTime - stepStartTime)
+                stepStartTime = stepEndTime
+    return stepSeconds, perf_counter() - startTime
+
+
+def runResults(
+    name: str, runs: List[Tuple[List[float], float]], **params
+) -> List[dict]:
+    """Per-step latency and throughput of `runs`."""
+    return [
+        result(
+            f"{name}.step",
+            [seconds for (stepSeconds, _) in runs for seconds in stepSeconds],
+            **params,
+        ),
+        result(
+            f"{name}.throughput",
+            [len(stepSeconds) / seconds for (stepSeconds, seconds) in runs],
+            unit="steps/s",
+            higherIsBetter=True,
+            **params,
+        ),
+    ]
+
+
+if __name__ == "__main__":
+    parser = suiteArguments(__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--first", default="2021-10-04T00:00:00", help="first settlement period start"
+    )
+    parser.add_argument(
+        "--last", default="2021-10-04T22:00:00", help="last settlement period start"
+    )
+    parser.add_argument(
+        "--optimiser-url", default=None, help="benchmark this running optimiser"
+    )
+    arguments = parser.parse_args()
+    period = {"first": arguments.first, "last": arguments.last}
+
+    results = []
+    if arguments.optimiser_url:
+        for strategy in Strategy:
+            runs = [
+                streamedRun(
+                    arguments.optimiser_url, arguments.first, arguments.last, strategy
+                )
+                for _ in range(arguments.repeat)
+            ]
+            results.extend(
+                runResults("strategy.http", runs, strategy=strategy.value, **period)
+            )
+    else:
+        market = EmbeddedMarket()
+        first = convertFromFormatToDateTime(arguments.first)
+        last = convertFromFormatToDateTime(arguments.last)
+        ## state records go to a file as they do in the service
+        logger.remove()
+        with TemporaryDirectory() as logLocation:
+            start_log_writer(path.join(logLocation, "run_output.log"))
+            for strategy in Strategy:
+                for fleetSize in FLEET_SIZES:
+                    ## untimed, so the first timed run is not the one warming up
+                    embeddedRun(market, first, last, strategy, fleetSize)
+                    runs = [
+                        embeddedRun(market, first, last, strategy, fleetSize)
+                        for _ in range(arguments.repeat)
+                    ]
+                    results.extend(
+                        runResults(
+                            "strategy.embedded",
+                            runs,
+                            strategy=strategy.value,
+                            fleetSize=fleetSize,
+                            **period,
+                        )
+                    )
+            stop_log_writer()
+
+    report(results)
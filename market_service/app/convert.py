@@ -0,0 +1,33 @@
+"""
+Convert bid_price_predictions.json/offer_price_predictions.json into the
+chunked dataset format served by the market service.
+
+    python -m app.convert --input ./app --output ./datasets --market default
+"""
+
+from argparse import ArgumentParser
+from os import path
+
+from app.dataset import DEFAULT_CHUNK_LENGTH, writeChunkedDataset
+from app.store import PredictionStore
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--input", default="./app", help="folder with the JSON files")
+    parser.add_argument("--output", default="./datasets", help="dataset root folder")
+    parser.add_argument("--market", default="default", help="name of the market")
+    parser.add_argument(
+        "--chunk-length",
+        type=int,
+        default=DEFAULT_CHUNK_LENGTH,
+        help="prediction vintages per chunk file",
+    )
+    arguments = parser.parse_args()
+
+    store = PredictionStore.fromJson(arguments.input)
+    writeChunkedDataset(
+        store,
+        path.join(arguments.output, arguments.market),
+        chunkLength=arguments.chunk_length,
+    )
+    print(f"wrote {len(store)} vintages for {arguments.market} to {arguments.output}")
@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from json import dump, load
+from os import getenv, listdir, makedirs, path, replace
+from threading import Lock
+from typing import Dict, Tuple
+
+import numpy as np
+
+from app.store import DATE_TIME_FORMAT, PredictionSource
+
+MANIFEST_FILENAME = "manifest.json"
+DEFAULT_CHUNK_LENGTH = 48 * 28
+MAX_OPEN_CHUNKS = int(getenv("SVC_PREDICTION_MAX_OPEN_CHUNKS", "64"))
+SIDES = ("bid_prices", "offer_prices")
+
+
+def chunkFileName(marketLocation: str, side: str, chunk: int) -> str:
+    return path.join(marketLocation, side, f"{chunk:06d}.npy")
+
+
+class ChunkedPredictionDataset(PredictionSource):
+    """
+    Predictions for one market, split into fixed-length chunks of rows.
+
+    Each chunk is an .npy file that is only memory-mapped when a request
+    touches its rows, and only the requested rows are paged in. A bounded
+    number of chunks stay open, so resident memory does not grow with the
+    length of the history.
+    """
+
+    def __init__(self, marketLocation: str, maxOpenChunks: int = MAX_OPEN_CHUNKS):
+        with open(path.join(marketLocation, MANIFEST_FILENAME), "r") as read:
+            manifest = load(read)
+        super().__init__(
+            datetime.strptime(manifest["firstRequestTime"], DATE_TIME_FORMAT),
+            numberOfRequests=manifest["numberOfRequests"],
+            predictionsPerRequest=manifest["predictionsPerRequest"],
+            interval=timedelta(seconds=manifest["intervalSeconds"]),
+        )
+        self.marketLocation = marketLocation
+        self.chunkLength = manifest["chunkLength"]
+        self.maxOpenChunks = max(maxOpenChunks, 1)
+        self.openChunks: "OrderedDict[Tuple[str, int], np.ndarray]" = OrderedDict()
+        self.openChunksLock = Lock()
+
+    def chunk(self, side: str, chunk: int) -> np.ndarray:
+        with self.openChunksLock:
+            key = (side, chunk)
+            if key in self.openChunks:
+                self.openChunks.move_to_end(key)
+                return self.openChunks[key]
+
+            prices = np.load(
+                chunkFileName(self.marketLocation, side, chunk), mmap_mode="r"
+            )
+            self.openChunks[key] = prices
+            if len(self.openChunks) > self.maxOpenChunks:
+                self.openChunks.popitem(last=False)
+            return prices
+
+    def pricesBetween(self, side: str, firstIndex: int, stopIndex: int) -> np.ndarray:
+        if stopIndex <= firstIndex:
+            return np.empty((0, self.predictionsPerRequest))
+
+        firstChunk = firstIndex // self.chunkLength
+        lastChunk = (stopIndex - 1) // self.chunkLength
+        parts = []
+        for chunk in range(firstChunk, lastChunk + 1):
+            chunkStart = chunk * self.chunkLength
+            parts.append(
+                self.chunk(side, chunk)[
+                    max(firstIndex - chunkStart, 0) : stopIndex - chunkStart
+                ]
+            )
+        ## a window inside one chunk is returned as a view of the mapped file
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def bidPricesBetween(self, firstIndex: int, stopIndex: int) -> np.ndarray:
+        return self.pricesBetween("bid_prices", firstIndex, stopIndex)
+
+    def offerPricesBetween(self, firstIndex: int, stopIndex: int) -> np.ndarray:
+        return self.pricesBetween("offer_prices", firstIndex, stopIndex)
+
+
+def writeChunkedDataset(
+    source: PredictionSource,
+    marketLocation: str,
+    chunkLength: int = DEFAULT_CHUNK_LENGTH,
+):
+    """Write any prediction source out in the chunked format."""
+    for side in SIDES:
+        makedirs(path.join(marketLocation, side), exist_ok=True)
+
+    for chunk, firstIndex in enumerate(range(0, len(source), chunkLength)):
+        stopIndex = min(firstIndex + chunkLength, len(source))
+        for side, prices in (
+            ("bid_prices", source.bidPricesBetween(firstIndex, stopIndex)),
+            ("offer_prices", source.offerPricesBetween(firstIndex, stopIndex)),
+        ):
+            np.save(chunkFileName(marketLocation, side, chunk), np.asarray(prices))
+
+    ## the manifest goes last so a half-written dataset is never picked up
+    temporaryFileName = path.join(marketLocation, f"{MANIFEST_FILENAME}.tmp")
+    with open(temporaryFileName, "w") as write:
+        dump(
+            {
+                "firstRequestTime": source.firstRequestTime.strftime(DATE_TIME_FORMAT),
+                "intervalSeconds": source.intervalSeconds,
+                "numberOfRequests": len(source),
+                "predictionsPerRequest": source.predictionsPerRequest,
+                "chunkLength": chunkLength,
+            },
+            write,
+        )
+    replace(temporaryFileName, path.join(marketLocation, MANIFEST_FILENAME))
+
+
+def discoverMarkets(datasetLocation: str) -> Dict[str, ChunkedPredictionDataset]:
+    """Open every market directory under `datasetLocation` that has a manifest."""
+    if not path.isdir(datasetLocation):
+        return {}
+    return {
+        market: ChunkedPredictionDataset(path.join(datasetLocation, market))
+        for market in sorted(listdir(datasetLocation))
+        if path.isfile(path.join(datasetLocation, market, MANIFEST_FILENAME))
+    }
@@ -1,16 +1,29 @@
+from datetime import datetime
+from enum import Enum
 from typing import Dict, Optional
 
 from decimal import Decimal
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
+import numpy as np
 import os
 
-from json import load
+from app.dataset import discoverMarkets
+from app.metrics import TracingMiddleware, render_metrics
+from app.store import DATE_TIME_FORMAT, PredictionSource, PredictionStore
 
 app = FastAPI()
+app.add_middleware(TracingMiddleware)
 
-bid_price_predictions = {}
-offer_price_predictions = {}
+PREDICTION_DATA_LOCATION = os.getenv("SVC_PREDICTION_DATA_LOCATION", "./app")
+PREDICTION_CACHE_LOCATION = os.getenv(
+    "SVC_PREDICTION_CACHE_LOCATION", "./prediction_cache"
+)
+PREDICTION_DATASET_LOCATION = os.getenv("SVC_PREDICTION_DATASET_LOCATION", "./datasets")
+DEFAULT_MARKET = "default"
+
+prediction_sources: Dict[str, PredictionSource] = {}
 
 hi = "hi"
 bye = "bye"
@@ -21,29 +34,141 @@ class Prediction(BaseModel):
     bid_prices: Dict[str, Decimal]
 
 
+class PredictionEncoding(str, Enum):
+    records = "records"
+    columnar = "columnar"
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "from market service"}
 
 
-@app.on_event("startup")
-def load_bid_prices_into_memory():
-    with open("./app/bid_price_predictions.json", "r") as read:
-        for (key, value) in load(read).items():
-            bid_price_predictions[key] = value
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return render_metrics()
 
 
 @app.on_event("startup")
-def load_offer_prices_into_memory():
-    with open("./app/offer_price_predictions.json", "r") as read:
-        for (key, value) in load(read).items():
-            offer_price_predictions[key] = value
+def load_predictions_into_memory():
+    prediction_sources.update(discoverMarkets(PREDICTION_DATASET_LOCATION))
+    ## without a converted dataset the default market is served from the JSON files
+    if DEFAULT_MARKET not in prediction_sources:
+        prediction_sources[DEFAULT_MARKET] = PredictionStore.load(
+            PREDICTION_DATA_LOCATION, PREDICTION_CACHE_LOCATION
+        )
 
 
-@app.get("/predictions/")
-def get_predictions(timeOfPredictionRequest: str):
-    print(f"predictions now has {[key for key in offer_price_predictions][0:5]}")
+def getPredictionSource(market: str) -> PredictionSource:
+    if market not in prediction_sources:
+        raise HTTPException(status_code=404, detail=f"unknown market {market}")
+    return prediction_sources[market]
+
+
+def parseTimeOfPredictionRequest(timeOfPredictionRequest: str) -> datetime:
+    try:
+        return datetime.strptime(timeOfPredictionRequest, DATE_TIME_FORMAT)
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail=f"{timeOfPredictionRequest} is not in the format {DATE_TIME_FORMAT}",
+        )
+
+
+def pricesByPredictionTime(predictionTimes, prices: np.ndarray) -> Dict[str, float]:
     return {
-        "offer_prices": offer_price_predictions[timeOfPredictionRequest],
-        "bid_prices": bid_price_predictions[timeOfPredictionRequest],
+        predictionTime: price
+        for (predictionTime, price) in zip(predictionTimes, prices.tolist())
+        if not np.isnan(price)
     }
+
+
+def withNulls(prices: np.ndarray) -> list:
+    return np.where(np.isnan(prices), None, prices).tolist()
+
+
+@app.get("/markets/")
+def get_markets():
+    return sorted(prediction_sources)
+
+
+@app.get("/predictions/")
+def get_predictions(timeOfPredictionRequest: str, market: str = DEFAULT_MARKET):
+    predictionSource = getPredictionSource(market)
+    index = predictionSource.requestIndex(
+        parseTimeOfPredictionRequest(timeOfPredictionRequest)
+    )
+    if index is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"no predictions were made at {timeOfPredictionRequest}",
+        )
+
+    predictionTimes = predictionSource.predictionTimes(index)
+    return JSONResponse(
+        {
+            "offer_prices": pricesByPredictionTime(
+                predictionTimes,
+                predictionSource.offerPricesBetween(index, index + 1)[0],
+            ),
+            "bid_prices": pricesByPredictionTime(
+                predictionTimes, predictionSource.bidPricesBetween(index, index + 1)[0]
+            ),
+        }
+    )
+
+
+@app.get("/predictions/range/")
+def get_predictions_for_range(
+    fromTimeOfPredictionRequest: str = Query(..., alias="from"),
+    toTimeOfPredictionRequest: str = Query(..., alias="to"),
+    format: PredictionEncoding = PredictionEncoding.records,
+    market: str = DEFAULT_MARKET,
+):
+    """
+    Return every prediction vintage requested between `from` and `to`, inclusive.
+
+    The default `records` encoding maps each request time to the same body
+    /predictions/ returns. The `columnar` encoding returns the request times
+    and lead times once, with one row of prices per request time, and null
+    where a vintage has no prediction for a lead time.
+    """
+    predictionSource = getPredictionSource(market)
+    fromDateTime = parseTimeOfPredictionRequest(fromTimeOfPredictionRequest)
+    toDateTime = parseTimeOfPredictionRequest(toTimeOfPredictionRequest)
+    if fromDateTime > toDateTime:
+        raise HTTPException(status_code=422, detail="from must not be after to")
+
+    firstIndex, stopIndex = predictionSource.requestIndexRange(fromDateTime, toDateTime)
+    requestTimes = [
+        predictionSource.requestTime(index).strftime(DATE_TIME_FORMAT)
+        for index in range(firstIndex, stopIndex)
+    ]
+    offerPrices = predictionSource.offerPricesBetween(firstIndex, stopIndex)
+    bidPrices = predictionSource.bidPricesBetween(firstIndex, stopIndex)
+
+    ## values are plain floats, so skip FastAPI's generic encoder
+    if format == PredictionEncoding.records:
+        predictionsByRequestTime = {}
+        for row, requestTime in enumerate(requestTimes):
+            predictionTimes = predictionSource.predictionTimes(firstIndex + row)
+            predictionsByRequestTime[requestTime] = {
+                "offer_prices": pricesByPredictionTime(
+                    predictionTimes, offerPrices[row]
+                ),
+                "bid_prices": pricesByPredictionTime(predictionTimes, bidPrices[row]),
+            }
+        return JSONResponse(predictionsByRequestTime)
+
+    intervalMinutes = predictionSource.intervalSeconds // 60
+    return JSONResponse(
+        {
+            "timesOfPredictionRequest": requestTimes,
+            "leadTimeMinutes": [
+                intervalMinutes * lead
+                for lead in range(1, predictionSource.predictionsPerRequest + 1)
+            ],
+            "offer_prices": withNulls(offerPrices),
+            "bid_prices": withNulls(bidPrices),
+        }
+    )
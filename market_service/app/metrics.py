@@ -0,0 +1,146 @@
+## each service is built from its own directory, so this module is copied into
+## every one of them and trimmed to what that service uses
+from bisect import bisect_left
+from os import getenv
+from threading import Lock
+from time import perf_counter
+from typing import Dict, List, Tuple
+from uuid import uuid4
+import logging
+import re
+
+## requests slower than this are logged with their trace and span IDs
+SLOW_REQUEST_SECONDS = float(getenv("SVC_SLOW_REQUEST_SECONDS", "1"))
+TRACE_HEADER = "X-Trace-Id"
+## trace IDs sent by callers are only kept if they look like one
+TRACE_ID_PATTERN = re.compile(rb"[A-Za-z0-9_.-]{1,64}")
+## the optimiser step a call was made for, sent along with its trace ID
+SPAN_HEADER = "X-Span-Id"
+## span IDs are a trace ID and the step's time
+SPAN_ID_PATTERN = re.compile(rb"[A-Za-z0-9_.-]{1,96}")
+## upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+## every histogram made, in the order they are served on /metrics
+histograms: List["Histogram"] = []
+
+
+class Histogram:
+    """
+    A latency histogram with one series per combination of label values,
+    rendered in the Prometheus text format.
+    """
+
+    def __init__(self, name: str, description: str, labelNames: Tuple[str, ...]):
+        self.name = name
+        self.description = description
+        self.labelNames = labelNames
+        ## bucket counts, then the sum and count, of every series
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+        ## handlers run in a thread pool
+        self.lock = Lock()
+        histograms.append(self)
+
+    def observe(self, seconds: float, *labelValues: str):
+        bucket = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            series = self.series.get(labelValues)
+            if series is None:
+                series = self.series[labelValues] = [0.0] * (len(BUCKETS) + 3)
+            series[bucket] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            series = {labels: list(values) for (labels, values) in self.series.items()}
+        for labelValues, values in sorted(series.items()):
+            labels = ",".join(
+                f'{name}="{value}"'
+                for (name, value) in zip(self.labelNames, labelValues)
+            )
+            separator = "," if labels else ""
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), values):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative:.0f}'
+                )
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {values[-1]:.0f}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Duration of requests, by endpoint.",
+    ("method", "endpoint", "status"),
+)
+
+
+def render_metrics() -> str:
+    return (
+        "\n".join(line for histogram in histograms for line in histogram.render())
+        + "\n"
+    )
+
+
+class TracingMiddleware:
+    """
+    Times every request by endpoint, and adds its trace ID and the time spent
+    to the response headers. The trace ID is taken from the request, so every
+    call the optimiser makes while handling one request shares it, or a new
+    one is made. The span ID the optimiser sends for each of its steps is
+    logged with slow requests, so they can be matched to the step.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        traceId = headers.get(TRACE_HEADER.lower().encode(), b"")
+        traceId = (
+            traceId.decode() if TRACE_ID_PATTERN.fullmatch(traceId) else uuid4().hex
+        )
+        spanId = headers.get(SPAN_HEADER.lower().encode(), b"")
+        spanId = spanId.decode() if SPAN_ID_PATTERN.fullmatch(spanId) else None
+        startTime = perf_counter()
+        status = 500
+
+        async def sendWithTiming(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (TRACE_HEADER.lower().encode(), traceId.encode()),
+                        (
+                            b"server-timing",
+                            f"total;dur={(perf_counter() - startTime) * 1000:.3f}".encode(),
+                        ),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, sendWithTiming)
+        finally:
+            seconds = perf_counter() - startTime
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            REQUEST_SECONDS.observe(seconds, scope["method"], endpoint, str(status))
+            if seconds > SLOW_REQUEST_SECONDS:
+                logging.warning(
+                    f"Slow request {scope['method']} {scope['path']} took {seconds:.3f}s, "
+                    f"trace {traceId}, span {spanId}"
+                )
@@ -0,0 +1,207 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from json import dump, load
+import math
+from os import makedirs, path, replace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DATE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+PREDICTION_INTERVAL = timedelta(minutes=30)
+PREDICTIONS_PER_REQUEST = 48
+UNIX_EPOCH = datetime(1970, 1, 1)
+
+BID_PRICES_FILENAME = "bid_price_predictions.json"
+OFFER_PRICES_FILENAME = "offer_price_predictions.json"
+CACHE_METADATA_FILENAME = "metadata.json"
+
+
+def toEpochSeconds(dateTime: datetime) -> int:
+    ## prediction times carry no timezone, so they are counted from a naive epoch
+    return int((dateTime - UNIX_EPOCH).total_seconds())
+
+
+class PredictionSource(ABC):
+    """
+    Index arithmetic shared by every way of holding predictions, which only
+    have to provide the prices of a range of rows.
+
+    Row `i` holds the vintage requested at `firstRequestTime + i * interval`
+    and column `j` the price predicted for `(j + 1) * interval` after that, so
+    a timestamp maps to its row with integer arithmetic and a time window is a
+    contiguous range of rows. Leads a vintage has no prediction for are NaN.
+    """
+
+    def __init__(
+        self,
+        firstRequestTime: datetime,
+        numberOfRequests: int,
+        predictionsPerRequest: int = PREDICTIONS_PER_REQUEST,
+        interval: timedelta = PREDICTION_INTERVAL,
+    ):
+        self.firstRequestTime = firstRequestTime
+        self.firstRequestEpoch = toEpochSeconds(firstRequestTime)
+        self.numberOfRequests = numberOfRequests
+        self.predictionsPerRequest = predictionsPerRequest
+        self.intervalSeconds = int(interval.total_seconds())
+        self.interval = interval
+
+    def __len__(self) -> int:
+        return self.numberOfRequests
+
+    @abstractmethod
+    def bidPricesBetween(self, firstIndex: int, stopIndex: int) -> np.ndarray: ...
+
+    @abstractmethod
+    def offerPricesBetween(self, firstIndex: int, stopIndex: int) -> np.ndarray: ...
+
+    def requestTime(self, index: int) -> datetime:
+        return self.firstRequestTime + self.interval * index
+
+    def requestIndex(self, timeOfPredictionRequest: datetime) -> Optional[int]:
+        """Row holding the vintage requested at the given time, if there is one."""
+        offset = toEpochSeconds(timeOfPredictionRequest) - self.firstRequestEpoch
+        if offset % self.intervalSeconds != 0:
+            return None
+        index = offset // self.intervalSeconds
+        return index if 0 <= index < len(self) else None
+
+    def requestIndexRange(
+        self, fromTimeOfPredictionRequest: datetime, toTimeOfPredictionRequest: datetime
+    ) -> Tuple[int, int]:
+        """Half-open row range of the vintages requested within the window."""
+        firstOffset = (
+            toEpochSeconds(fromTimeOfPredictionRequest) - self.firstRequestEpoch
+        )
+        lastOffset = toEpochSeconds(toTimeOfPredictionRequest) - self.firstRequestEpoch
+        firstIndex = max(math.ceil(firstOffset / self.intervalSeconds), 0)
+        stopIndex = min(math.floor(lastOffset / self.intervalSeconds) + 1, len(self))
+        return firstIndex, max(stopIndex, firstIndex)
+
+    def predictionTimes(self, index: int) -> List[str]:
+        requestTime = self.requestTime(index)
+        return [
+            (requestTime + self.interval * lead).strftime(DATE_TIME_FORMAT)
+            for lead in range(1, self.predictionsPerRequest + 1)
+        ]
+
+
+class PredictionStore(PredictionSource):
+    """Bid and offer predictions held as two dense float arrays."""
+
+    def __init__(
+        self,
+        firstRequestTime: datetime,
+        bidPrices: np.ndarray,
+        offerPrices: np.ndarray,
+        interval: timedelta = PREDICTION_INTERVAL,
+    ):
+        super().__init__(
+            firstRequestTime,
+            numberOfRequests=offerPrices.shape[0],
+            predictionsPerRequest=offerPrices.shape[1],
+            interval=interval,
+        )
+        self.bidPrices = bidPrices
+        self.offerPrices = offerPrices
+
+    def bidPricesBetween(self, firstIndex: int, stopIndex: int) -> np.ndarray:
+        return self.bidPrices[firstIndex:stopIndex]
+
+    def offerPricesBetween(self, firstIndex: int, stopIndex: int) -> np.ndarray:
+        return self.offerPrices[firstIndex:stopIndex]
+
+    @classmethod
+    def fromJson(cls, dataLocation: str) -> "PredictionStore":
+        with open(path.join(dataLocation, BID_PRICES_FILENAME), "r") as read:
+            bidPricePredictions = load(read)
+        with open(path.join(dataLocation, OFFER_PRICES_FILENAME), "r") as read:
+            offerPricePredictions = load(read)
+
+        requestTimes = sorted(
+            datetime.strptime(each, DATE_TIME_FORMAT) for each in offerPricePredictions
+        )
+        firstRequestTime = requestTimes[0]
+        numberOfRequests = (
+            int((requestTimes[-1] - firstRequestTime) / PREDICTION_INTERVAL) + 1
+        )
+
+        bidPrices = np.full((numberOfRequests, PREDICTIONS_PER_REQUEST), np.nan)
+        offerPrices = np.full((numberOfRequests, PREDICTIONS_PER_REQUEST), np.nan)
+        for (predictions, prices) in (
+            (bidPricePredictions, bidPrices),
+            (offerPricePredictions, offerPrices),
+        ):
+            for (requestTimeString, pricesByTime) in predictions.items():
+                requestTime = datetime.strptime(requestTimeString, DATE_TIME_FORMAT)
+                row = int((requestTime - firstRequestTime) / PREDICTION_INTERVAL)
+                for (predictionTimeString, price) in pricesByTime.items():
+                    lead = int(
+                        (
+                            datetime.strptime(predictionTimeString, DATE_TIME_FORMAT)
+                            - requestTime
+                        )
+                        / PREDICTION_INTERVAL
+                    )
+                    if 1 <= lead <= PREDICTIONS_PER_REQUEST:
+                        prices[row, lead - 1] = price
+
+        return cls(firstRequestTime, bidPrices, offerPrices)
+
+    def save(self, cacheLocation: str, sourceModifiedTimes: Dict[str, float]):
+        """Write the arrays as .npy files that later starts can memory-map."""
+        makedirs(cacheLocation, exist_ok=True)
+        for (name, prices) in (
+            ("bid_prices", self.bidPrices),
+            ("offer_prices", self.offerPrices),
+        ):
+            temporaryFileName = path.join(cacheLocation, f"{name}.tmp.npy")
+            np.save(temporaryFileName, prices)
+            replace(temporaryFileName, path.join(cacheLocation, f"{name}.npy"))
+
+        temporaryFileName = path.join(cacheLocation, f"{CACHE_METADATA_FILENAME}.tmp")
+        with open(temporaryFileName, "w") as write:
+            dump(
+                {
+                    "firstRequestTime": self.firstRequestTime.strftime(
+                        DATE_TIME_FORMAT
+                    ),
+                    "intervalSeconds": self.intervalSeconds,
+                    "sourceModifiedTimes": sourceModifiedTimes,
+                },
+                write,
+            )
+        replace(temporaryFileName, path.join(cacheLocation, CACHE_METADATA_FILENAME))
+
+    @classmethod
+    def fromCache(
+        cls, cacheLocation: str, sourceModifiedTimes: Dict[str, float]
+    ) -> Optional["PredictionStore"]:
+        """Memory-map a cache written by `save`, unless it is missing or stale."""
+        try:
+            with open(path.join(cacheLocation, CACHE_METADATA_FILENAME), "r") as read:
+                metadata = load(read)
+            if metadata["sourceModifiedTimes"] != sourceModifiedTimes:
+                return None
+            return cls(
+                datetime.strptime(metadata["firstRequestTime"], DATE_TIME_FORMAT),
+                np.load(path.join(cacheLocation, "bid_prices.npy"), mmap_mode="r"),
+                np.load(path.join(cacheLocation, "offer_prices.npy"), mmap_mode="r"),
+                interval=timedelta(seconds=metadata["intervalSeconds"]),
+            )
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def load(cls, dataLocation: str, cacheLocation: str) -> "PredictionStore":
+        """Load from the binary cache, rebuilding it from JSON when out of date."""
+        sourceModifiedTimes = {
+            each: path.getmtime(path.join(dataLocation, each))
+            for each in (BID_PRICES_FILENAME, OFFER_PRICES_FILENAME)
+        }
+        store = cls.fromCache(cacheLocation, sourceModifiedTimes)
+        if store is None:
+            store = cls.fromJson(dataLocation)
+            store.save(cacheLocation, sourceModifiedTimes)
+        return store
@@ -1,8 +1,12 @@
 from typing import Optional
 from random import choices
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from app.metrics import TracingMiddleware, render_metrics
 
 app = FastAPI()
+app.add_middleware(TracingMiddleware)
 
 from pydantic import BaseModel
 from decimal import Decimal
@@ -29,6 +33,11 @@ def read_root():
     return {"Hello": "from mock grid operator"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return render_metrics()
+
+
 @app.post("/submissions", response_model=BidOfferPairSubmissionResult)
 def evaluate_offer_or_bid(bidOfferPair: BidOfferPair) -> BidOfferPairSubmissionResult:
     info(f"received bidOfferPair, {bidOfferPair}")
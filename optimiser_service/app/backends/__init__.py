@@ -0,0 +1,18 @@
+from os import getenv
+
+from app.backends.base import ServiceBackend
+
+SERVICE_BACKEND_MODE = getenv("SVC_BACKEND_MODE", "http")
+
+
+def create_backend(mode: str = SERVICE_BACKEND_MODE) -> ServiceBackend:
+    """Build the service backend for `mode`, either "http" or "embedded"."""
+    if mode == "http":
+        from app.backends.http import HttpServiceBackend
+
+        return HttpServiceBackend()
+    if mode == "embedded":
+        from app.backends.embedded import EmbeddedServiceBackend
+
+        return EmbeddedServiceBackend()
+    raise ValueError(f"Unknown service backend mode: {mode}")
@@ -0,0 +1,49 @@
+from datetime import datetime
+from typing import List, Protocol
+
+from app.models import (
+    DEFAULT_ASSET_ID,
+    BatteryAsset,
+    BatteryState,
+    BatteryStateTransition,
+    BidOfferPair,
+    BidOfferPairSubmissionResult,
+)
+from app.predictions import PredictionWindow
+
+
+class ServiceBackend(Protocol):
+    """
+    The calls the optimiser makes to the market, grid operator and battery.
+
+    Implementations either talk to the other services over HTTP or run their
+    logic in-process, and must return the same results either way.
+    """
+
+    async def get_market_predictions_for_range(
+        self, firstDateTime: datetime, lastDateTime: datetime
+    ) -> PredictionWindow: ...
+
+    async def get_battery_assets(self) -> List[BatteryAsset]: ...
+
+    async def get_battery_state(
+        self, dateTime: datetime, assetId: str = DEFAULT_ASSET_ID
+    ) -> BatteryState: ...
+
+    async def apply_battery_transitions(
+        self, transitions: List[BatteryStateTransition]
+    ) -> List[BatteryState]: ...
+
+    async def submit_bid_offer_pair(
+        self, bidOfferPair: BidOfferPair
+    ) -> BidOfferPairSubmissionResult: ...
+
+    async def reset_run(self) -> None:
+        """Start every battery of this backend's run afresh."""
+        ...
+
+    def for_run(self, runId: str) -> "ServiceBackend":
+        """The same services, with the batteries of the battery service run `runId`."""
+        ...
+
+    async def aclose(self) -> None: ...
@@ -0,0 +1,452 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from json import load, loads
+from os import getenv
+from random import Random
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.logwriter import log_record
+from app.models import (
+    DEFAULT_ASSET_ID,
+    DEFAULT_RUN_ID,
+    BatteryAsset,
+    BatteryState,
+    BatteryStateTransition,
+    BidOfferPair,
+    BidOfferPairSubmissionResult,
+    ChargeRequest,
+    DischargeRequest,
+)
+from app.predictions import PredictionWindow
+from app.utils import convertDateTimeToFormat, convertFromFormatToDateTime
+
+MARKET_DATA_LOCATION = getenv(
+    "SVC_EMBEDDED_MARKET_DATA_LOCATION", "../market_service/app"
+)
+EMBEDDED_RANDOM_SEED = getenv("SVC_EMBEDDED_RANDOM_SEED")
+## the same fleet description as the battery service reads
+BATTERY_ASSETS = getenv("SVC_BATTERY_ASSETS")
+## runs kept in memory, the least recently used are dropped and start afresh when used again
+EMBEDDED_RUNS = int(getenv("SVC_EMBEDDED_RUNS", "128"))
+
+## mirrors of the constants used by the market, grid operator and battery services
+PREDICTION_INTERVAL = timedelta(minutes=30)
+PREDICTIONS_PER_REQUEST = 48
+BID_OFFER_PAIR_ACCEPTANCE_RATE = 0.8
+BATTERY_MAX_CAPACITY = 10
+BATTERY_MAX_CHARGE_CYCLE = 20
+BATTERY_MAX_DISCHARGE_CYCLE = 20
+BATTERY_INITIAL_CHARGE_LEVEL = 5
+TIMESTEPS_BETWEEN_BATTERY_STATE = timedelta(minutes=30)
+
+
+class EmbeddedMarket:
+    """In-process copy of market_service, reading the same prediction files."""
+
+    def __init__(self, dataLocation: str = MARKET_DATA_LOCATION):
+        with open(f"{dataLocation}/bid_price_predictions.json", "r") as read:
+            self.bidPricePredictions = load(read)
+        with open(f"{dataLocation}/offer_price_predictions.json", "r") as read:
+            self.offerPricePredictions = load(read)
+        self.requestTimes = sorted(self.offerPricePredictions)
+        self.leadTimeMinutes = [
+            int(PREDICTION_INTERVAL.total_seconds() // 60) * lead
+            for lead in range(1, PREDICTIONS_PER_REQUEST + 1)
+        ]
+        self.offerPrices = self.toArray(self.offerPricePredictions)
+        self.bidPrices = self.toArray(self.bidPricePredictions)
+
+    def toArray(self, predictions: Dict[str, Dict[str, float]]) -> np.ndarray:
+        prices = np.full((len(self.requestTimes), PREDICTIONS_PER_REQUEST), np.nan)
+        for row, requestTime in enumerate(self.requestTimes):
+            requestDateTime = convertFromFormatToDateTime(requestTime)
+            for predictionTime, price in predictions[requestTime].items():
+                lead = (
+                    int(
+                        (convertFromFormatToDateTime(predictionTime) - requestDateTime)
+                        / PREDICTION_INTERVAL
+                    )
+                    - 1
+                )
+                if 0 <= lead < PREDICTIONS_PER_REQUEST:
+                    prices[row, lead] = price
+        return prices
+
+    def get_predictions_for_range(
+        self, fromTimeOfPredictionRequest: str, toTimeOfPredictionRequest: str
+    ) -> PredictionWindow:
+        firstIndex = bisect_left(self.requestTimes, fromTimeOfPredictionRequest)
+        lastIndex = bisect_right(self.requestTimes, toTimeOfPredictionRequest)
+        return PredictionWindow(
+            self.requestTimes[firstIndex:lastIndex],
+            self.leadTimeMinutes,
+            self.offerPrices[firstIndex:lastIndex],
+            self.bidPrices[firstIndex:lastIndex],
+        )
+
+
+class EmbeddedGridOperator:
+    """In-process copy of mock_grid_operator_service."""
+
+    def __init__(self, seed: Optional[int] = None):
+        self.random = Random(seed)
+
+    def evaluate_offer_or_bid(
+        self, bidOfferPair: BidOfferPair
+    ) -> BidOfferPairSubmissionResult:
+        if bidOfferPair.bidVolume == Decimal(0) and bidOfferPair.offerVolume == Decimal(
+            0
+        ):
+            accepted = True
+        else:
+            accepted = self.random.choices(
+                [True, False], cum_weights=(BID_OFFER_PAIR_ACCEPTANCE_RATE, 1.00), k=1
+            )[0]
+        return {**bidOfferPair.dict(), "accepted": accepted}
+
+
+class EmbeddedBatteryAsset:
+    """
+    In-process copy of one battery of battery_service.
+
+    Only written states are kept, ordered by time like the service's state
+    timeline; the state at any other time is carried forward from the last
+    known one, resetting the same-day totals on a new day.
+    """
+
+    def __init__(self, asset: BatteryAsset):
+        self.asset = asset
+        self.states: Dict[Decimal, dict] = {}
+        self.epochs: List[Decimal] = []
+        ## while a batch runs, the state every write replaced, so it can be undone
+        self.journal: Optional[List[Tuple[Decimal, Optional[dict]]]] = None
+
+    def addState(self, state: dict):
+        epoch = state["settlementPeriodStartTimeEpoch"]
+        if self.journal is not None:
+            self.journal.append((epoch, self.states.get(epoch)))
+        if epoch not in self.states:
+            insort(self.epochs, epoch)
+        self.states[epoch] = state
+
+    def rollBack(self):
+        """Undo every write of the journal, latest first."""
+        for epoch, state in reversed(self.journal or []):
+            if state is not None:
+                self.states[epoch] = state
+            else:
+                del self.states[epoch]
+                del self.epochs[bisect_left(self.epochs, epoch)]
+
+    def getOrExtrapolateState(self, dateTimeForRequest: datetime) -> dict:
+        index = bisect_right(self.epochs, Decimal(dateTimeForRequest.timestamp()))
+        if index == 0:
+            raise Exception("no previous state found for the battery")
+        return stateAt(self.states[self.epochs[index - 1]], dateTimeForRequest)
+
+    def seed(self, initialTimeStamp: datetime):
+        logger.warning(f"embedded battery {self.asset['assetId']} is empty, seeding.")
+        self.addState(
+            {
+                "assetId": self.asset["assetId"],
+                "settlementPeriodDay": initialTimeStamp.date().isoformat(),
+                "settlementPeriodStartTimeEpoch": Decimal(initialTimeStamp.timestamp()),
+                "settlementPeriodStartTime": convertDateTimeToFormat(initialTimeStamp),
+                "chargeLevelAtPeriodStart": self.asset["initialChargeLevel"],
+                "sameDayImportTotal": Decimal(0.00),
+                "sameDayExportTotal": Decimal(0.00),
+                "cumulativeImportTotal": Decimal(0.00),
+                "cumulativeExportTotal": Decimal(0.00),
+            }
+        )
+
+    def get_battery_state(self, settlementPeriodStartTime: str) -> BatteryState:
+        settlementPeriodStartTimeAsDateTime = convertFromFormatToDateTime(
+            settlementPeriodStartTime
+        )
+        if not self.states:
+            self.seed(settlementPeriodStartTimeAsDateTime)
+
+        currentState = self.getOrExtrapolateState(settlementPeriodStartTimeAsDateTime)
+        return toBatteryState(currentState, settlementPeriodStartTime)
+
+    def charge_battery(self, request: ChargeRequest) -> BatteryState:
+        dateTimeForRequest = convertFromFormatToDateTime(
+            request.settlementPeriodStartTime
+        )
+        currentState = self.getOrExtrapolateState(dateTimeForRequest)
+
+        if (request.bidVolume + currentState["sameDayImportTotal"]) > self.asset[
+            "maxChargeCycle"
+        ]:
+            raise Exception("Request will cause battery to exceed max charge cycle")
+        elif (
+            request.bidVolume + currentState["chargeLevelAtPeriodStart"]
+        ) > self.asset["maxCapacity"]:
+            raise Exception(
+                f'Request of {request.bidVolume}MWh to current state of {currentState["chargeLevelAtPeriodStart"]}MWh will cause battery to exceed max charge capacity'
+            )
+
+        stateAtChargeRequestEnd = self.nextState(
+            currentState,
+            dateTimeForRequest,
+            chargeLevelAtPeriodStart=currentState["chargeLevelAtPeriodStart"]
+            + request.bidVolume,
+            sameDayImportTotal=currentState["sameDayImportTotal"] + request.bidVolume,
+            cumulativeImportTotal=currentState["cumulativeImportTotal"]
+            + request.bidVolume,
+        )
+        return toBatteryState(
+            stateAtChargeRequestEnd,
+            stateAtChargeRequestEnd["settlementPeriodStartTime"],
+        )
+
+    def discharge_battery(self, request: DischargeRequest) -> BatteryState:
+        dateTimeForRequest = convertFromFormatToDateTime(
+            request.settlementPeriodStartTime
+        )
+        currentState = self.getOrExtrapolateState(dateTimeForRequest)
+
+        if (request.offerVolume + currentState["sameDayExportTotal"]) > self.asset[
+            "maxDischargeCycle"
+        ]:
+            raise Exception("Request will cause battery to exceed max discharge cycle")
+        elif (currentState["chargeLevelAtPeriodStart"] - request.offerVolume) < 0:
+            raise Exception("Request will cause battery to exceed max charge capacity")
+
+        stateAtDischargeRequestEnd = self.nextState(
+            currentState,
+            dateTimeForRequest,
+            chargeLevelAtPeriodStart=currentState["chargeLevelAtPeriodStart"]
+            - request.offerVolume,
+            sameDayExportTotal=currentState["sameDayExportTotal"] + request.offerVolume,
+            cumulativeExportTotal=currentState["cumulativeExportTotal"]
+            + request.offerVolume,
+        )
+        return toBatteryState(
+            stateAtDischargeRequestEnd,
+            stateAtDischargeRequestEnd["settlementPeriodStartTime"],
+        )
+
+    def nextState(self, currentState: dict, dateTimeForRequest: datetime, **changes):
+        stateAtRequestEnd = stateAt(
+            {**currentState, **changes},
+            dateTimeForRequest + TIMESTEPS_BETWEEN_BATTERY_STATE,
+        )
+        self.addState(stateAtRequestEnd)
+        return stateAtRequestEnd
+
+
+class EmbeddedBattery:
+    """In-process copy of battery_service, one EmbeddedBatteryAsset per battery."""
+
+    def __init__(self, assets: Optional[List[BatteryAsset]] = None):
+        self.assets = {
+            asset["assetId"]: EmbeddedBatteryAsset(asset)
+            for asset in (assets or loadFleet(BATTERY_ASSETS))
+        }
+
+    def asset(self, assetId: str) -> EmbeddedBatteryAsset:
+        try:
+            return self.assets[assetId]
+        except KeyError:
+            raise Exception(f"Unknown battery asset {assetId}")
+
+    def get_battery_assets(self) -> List[BatteryAsset]:
+        return [battery.asset for battery in self.assets.values()]
+
+    def get_battery_state(
+        self, settlementPeriodStartTime: str, assetId: str = DEFAULT_ASSET_ID
+    ) -> BatteryState:
+        return self.asset(assetId).get_battery_state(settlementPeriodStartTime)
+
+    def apply_state_transitions(
+        self, transitions: List[BatteryStateTransition]
+    ) -> List[BatteryState]:
+        ## nothing is kept if any transition is rejected, like the batch write, so
+        ## the batteries it touches journal their writes until it is done
+        journalled = []
+        results = []
+        try:
+            for index, transition in enumerate(transitions):
+                try:
+                    battery = self.asset(transition.assetId)
+                    if battery.journal is None:
+                        battery.journal = []
+                        journalled.append(battery)
+                    if transition.action == "charge":
+                        results.append(
+                            battery.charge_battery(
+                                ChargeRequest(
+                                    settlementPeriodStartTime=transition.settlementPeriodStartTime,
+                                    bidVolume=transition.volume,
+                                    assetId=transition.assetId,
+                                )
+                            )
+                        )
+                    elif transition.action == "discharge":
+                        results.append(
+                            battery.discharge_battery(
+                                DischargeRequest(
+                                    settlementPeriodStartTime=transition.settlementPeriodStartTime,
+                                    offerVolume=transition.volume,
+                                    assetId=transition.assetId,
+                                )
+                            )
+                        )
+                    else:
+                        results.append(
+                            battery.get_battery_state(
+                                transition.settlementPeriodStartTime
+                            )
+                        )
+                except Exception as e:
+                    raise Exception(f"Transition {index} rejected: {str(e)}")
+        except Exception as e:
+            for battery in journalled:
+                battery.rollBack()
+            raise e
+        finally:
+            for battery in journalled:
+                battery.journal = None
+        return results
+
+
+def loadFleet(description: Optional[str]) -> List[BatteryAsset]:
+    """The fleet described like SVC_BATTERY_ASSETS of battery_service."""
+    assets = loads(description) if description else [{"assetId": DEFAULT_ASSET_ID}]
+    return [
+        {
+            "assetId": asset["assetId"],
+            "maxCapacity": Decimal(str(asset.get("maxCapacity", BATTERY_MAX_CAPACITY))),
+            "maxChargeCycle": Decimal(
+                str(asset.get("maxChargeCycle", BATTERY_MAX_CHARGE_CYCLE))
+            ),
+            "maxDischargeCycle": Decimal(
+                str(asset.get("maxDischargeCycle", BATTERY_MAX_DISCHARGE_CYCLE))
+            ),
+            "initialChargeLevel": Decimal(
+                str(asset.get("initialChargeLevel", BATTERY_INITIAL_CHARGE_LEVEL))
+            ),
+        }
+        for asset in assets
+    ]
+
+
+def stateAt(lastKnownState: dict, dateTime: datetime) -> dict:
+    """Carry `lastKnownState` forward to `dateTime`."""
+    state = {
+        **lastKnownState,
+        "settlementPeriodDay": dateTime.date().isoformat(),
+        "settlementPeriodStartTimeEpoch": Decimal(dateTime.timestamp()),
+        "settlementPeriodStartTime": convertDateTimeToFormat(dateTime),
+    }
+    if lastKnownState["settlementPeriodDay"] != state["settlementPeriodDay"]:
+        ## day rollover, nothing has been imported or exported on the new day
+        state["sameDayImportTotal"] = Decimal(0)
+        state["sameDayExportTotal"] = Decimal(0)
+    return state
+
+
+def toBatteryState(item: dict, settlementPeriodStartTime: str) -> BatteryState:
+    return {
+        "assetId": item["assetId"],
+        "settlementPeriodStartTime": settlementPeriodStartTime,
+        "chargeLevelAtPeriodStart": item["chargeLevelAtPeriodStart"],
+        "sameDayImportTotal": item["sameDayImportTotal"],
+        "sameDayExportTotal": item["sameDayExportTotal"],
+        "cumulativeImportTotal": item["cumulativeImportTotal"],
+        "cumulativeExportTotal": item["cumulativeExportTotal"],
+    }
+
+
+class EmbeddedServiceBackend:
+    """
+    Runs the market, grid operator and battery logic as in-process objects,
+    skipping the HTTP round trips so long backtests run much faster.
+
+    Every run has its own battery, and shares the market and grid operator.
+    Only the EMBEDDED_RUNS most recently used runs are kept, besides the
+    default one.
+    """
+
+    def __init__(
+        self,
+        market: Optional[EmbeddedMarket] = None,
+        gridOperator: Optional[EmbeddedGridOperator] = None,
+        battery: Optional[EmbeddedBattery] = None,
+        runId: str = DEFAULT_RUN_ID,
+        runs: Optional["OrderedDict[str, EmbeddedServiceBackend]"] = None,
+    ):
+        self.market = market or EmbeddedMarket()
+        self.gridOperator = gridOperator or EmbeddedGridOperator(
+            int(EMBEDDED_RANDOM_SEED) if EMBEDDED_RANDOM_SEED else None
+        )
+        self.battery = battery or EmbeddedBattery()
+        self.runId = runId
+        ## the backends of every run, shared by all of them
+        self.runs = runs if runs is not None else OrderedDict({runId: self})
+
+    def for_run(self, runId: str) -> "EmbeddedServiceBackend":
+        runBackend = self.runs.get(runId)
+        if runBackend is None:
+            runBackend = self.runs[runId] = EmbeddedServiceBackend(
+                market=self.market,
+                gridOperator=self.gridOperator,
+                battery=EmbeddedBattery(self.battery.get_battery_assets()),
+                runId=runId,
+                runs=self.runs,
+            )
+            while len(self.runs) > EMBEDDED_RUNS + 1:
+                ## the default run is what calls outside of any run use
+                del self.runs[
+                    next(each for each in self.runs if each != DEFAULT_RUN_ID)
+                ]
+        self.runs.move_to_end(runId)
+        return runBackend
+
+    async def reset_run(self) -> None:
+        self.battery = EmbeddedBattery(self.battery.get_battery_assets())
+
+    async def get_market_predictions_for_range(
+        self, firstDateTime: datetime, lastDateTime: datetime
+    ) -> PredictionWindow:
+        return self.market.get_predictions_for_range(
+            convertDateTimeToFormat(firstDateTime),
+            convertDateTimeToFormat(lastDateTime),
+        )
+
+    async def get_battery_assets(self) -> List[BatteryAsset]:
+        return self.battery.get_battery_assets()
+
+    async def get_battery_state(
+        self, dateTime: datetime, assetId: str = DEFAULT_ASSET_ID
+    ) -> BatteryState:
+        try:
+            return self.battery.get_battery_state(
+                convertDateTimeToFormat(dateTime), assetId
+            )
+        except Exception as e:
+            raise Exception(f"Failed to get battery state, cause: {str(e)}")
+
+    async def apply_battery_transitions(
+        self, transitions: List[BatteryStateTransition]
+    ) -> List[BatteryState]:
+        try:
+            return self.battery.apply_state_transitions(transitions)
+        except Exception as e:
+            raise Exception(f"Failed to apply battery transitions, cause: {str(e)}")
+
+    async def submit_bid_offer_pair(
+        self, bidOfferPair: BidOfferPair
+    ) -> BidOfferPairSubmissionResult:
+        log_record("INFO", "submitting bid offer", submittedBidOfferPair=bidOfferPair)
+        return self.gridOperator.evaluate_offer_or_bid(bidOfferPair)
+
+    async def aclose(self) -> None:
+        pass
@@ -0,0 +1,234 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+import json
+from os import getenv
+from typing import List, Optional
+
+import httpx
+from loguru import logger
+
+from app.logwriter import log_record
+from app.metrics import SPAN_HEADER, TRACE_HEADER, currentSpanId, currentTraceId
+from app.models import (
+    DEFAULT_ASSET_ID,
+    DEFAULT_RUN_ID,
+    BatteryAsset,
+    BatteryState,
+    BatteryStateTransition,
+    BidOfferPair,
+    BidOfferPairSubmissionResult,
+)
+from app.predictions import PredictionWindow
+from app.utils import convertDateTimeToFormat
+
+MARKET_SERVICE_HOST_ADDRESS = getenv("SVC_MARKET_HOST", "http://localhost:5002")
+BATTERY_SERVICE_HOST_ADDRESS = getenv("SVC_BATTERY_HOST", "http://localhost:5003")
+GRID_OPERATOR_HOST_ADDRESS = getenv(
+    "SVC_MOCK_GRID_OPERATOR_HOST", "http://localhost:5001"
+)
+MARKET_NAME = getenv("SVC_MARKET_NAME", "default")
+
+HTTP_TIMEOUT_SECONDS = float(getenv("SVC_HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_MAX_CONNECTIONS = int(getenv("SVC_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(getenv("SVC_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_MAX_RETRIES = int(getenv("SVC_HTTP_MAX_RETRIES", "3"))
+HTTP_RETRY_BACKOFF_SECONDS = float(getenv("SVC_HTTP_RETRY_BACKOFF_SECONDS", "0.1"))
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class DecimalCompatibleEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return obj.to_eng_string()
+        # Let the base class default method raise the TypeError
+        return json.JSONEncoder.default(self, obj)
+
+
+class HttpServiceBackend:
+    """
+    Calls the market, grid operator and battery services over HTTP.
+
+    All calls share one keep-alive connection pool. Reads are retried with
+    exponential backoff on transport errors and gateway failures; writes are
+    only retried when the connection could not be made, so a request that may
+    have reached the other service is never sent twice.
+
+    Battery calls address the battery service run `runId`.
+    """
+
+    def __init__(
+        self,
+        runId: str = DEFAULT_RUN_ID,
+        pool: Optional["HttpServiceBackend"] = None,
+    ):
+        self.runId = runId
+        ## the backend whose connection pool is shared
+        self.pool = pool
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def for_run(self, runId: str) -> "HttpServiceBackend":
+        if runId == self.runId:
+            return self
+        return HttpServiceBackend(runId, pool=self.pool or self)
+
+    def getClient(self) -> httpx.AsyncClient:
+        if self.pool is not None:
+            return self.pool.getClient()
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+            )
+        return self.client
+
+    async def aclose(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def send(
+        self, method: str, url: str, *, idempotent: bool, **kwargs
+    ) -> httpx.Response:
+        ## the other service's logs and timings carry the trace of this request,
+        ## and the span of the step the call is made for
+        traceId = currentTraceId.get()
+        if traceId is not None:
+            kwargs["headers"] = {**kwargs.get("headers", {}), TRACE_HEADER: traceId}
+        spanId = currentSpanId.get()
+        if spanId is not None:
+            kwargs["headers"] = {**kwargs.get("headers", {}), SPAN_HEADER: spanId}
+        attempt = 0
+        while True:
+            try:
+                response = await self.getClient().request(method, url, **kwargs)
+                if not (
+                    idempotent
+                    and response.status_code in RETRYABLE_STATUS_CODES
+                    and attempt < HTTP_MAX_RETRIES
+                ):
+                    return response
+                logger.warning(
+                    f"{method} {url} returned {response.status_code}, retrying"
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt >= HTTP_MAX_RETRIES:
+                    raise e
+                logger.warning(f"{method} {url} could not connect, retrying: {e}")
+            except httpx.TransportError as e:
+                if not idempotent or attempt >= HTTP_MAX_RETRIES:
+                    raise e
+                logger.warning(f"{method} {url} failed, retrying: {e}")
+
+            await asyncio.sleep(HTTP_RETRY_BACKOFF_SECONDS * (2**attempt))
+            attempt += 1
+
+    async def get_market_predictions_for_range(
+        self, firstDateTime: datetime, lastDateTime: datetime
+    ) -> PredictionWindow:
+        try:
+            response = await self.send(
+                "GET",
+                f"{MARKET_SERVICE_HOST_ADDRESS}/predictions/range/",
+                idempotent=True,
+                params={
+                    "from": convertDateTimeToFormat(firstDateTime),
+                    "to": convertDateTimeToFormat(lastDateTime),
+                    "market": MARKET_NAME,
+                    "format": "columnar",
+                },
+            )
+            response.raise_for_status()
+            return PredictionWindow.fromColumnar(response.json())
+        except Exception as e:
+            raise Exception(f"Failed to get market predictions, cause: {str(e)}")
+
+    async def get_battery_assets(self) -> List[BatteryAsset]:
+        try:
+            response = await self.send(
+                "GET", f"{BATTERY_SERVICE_HOST_ADDRESS}/assets/", idempotent=True
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise Exception(f"Failed to get battery assets, cause: {str(e)}")
+
+    async def get_battery_state(
+        self, dateTime: datetime, assetId: str = DEFAULT_ASSET_ID
+    ) -> BatteryState:
+        try:
+            response = await self.send(
+                "GET",
+                f"{BATTERY_SERVICE_HOST_ADDRESS}/state/",
+                idempotent=True,
+                params={
+                    "settlementPeriodStartTime": convertDateTimeToFormat(dateTime),
+                    "assetId": assetId,
+                    "runId": self.runId,
+                },
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise Exception(f"Failed to get battery state, cause: {str(e)}")
+
+    async def apply_battery_transitions(
+        self, transitions: List[BatteryStateTransition]
+    ) -> List[BatteryState]:
+        try:
+            response = await self.send(
+                "POST",
+                f"{BATTERY_SERVICE_HOST_ADDRESS}/transitions/",
+                ## a batch of reads only changes what a /state/ read would
+                idempotent=all(
+                    transition.action == "read" for transition in transitions
+                ),
+                headers=JSON_HEADERS,
+                content=json.dumps(
+                    {
+                        "transitions": [
+                            transition.dict() for transition in transitions
+                        ],
+                        "runId": self.runId,
+                    },
+                    cls=DecimalCompatibleEncoder,
+                ),
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise Exception(f"Failed to apply battery transitions, cause: {str(e)}")
+
+    async def reset_run(self) -> None:
+        try:
+            response = await self.send(
+                "DELETE",
+                f"{BATTERY_SERVICE_HOST_ADDRESS}/runs/{self.runId}/",
+                ## a second reset leaves the run as the first one did
+                idempotent=True,
+            )
+            response.raise_for_status()
+        except Exception as e:
+            raise Exception(f"Failed to reset run {self.runId}, cause: {str(e)}")
+
+    async def submit_bid_offer_pair(
+        self, bidOfferPair: BidOfferPair
+    ) -> BidOfferPairSubmissionResult:
+        log_record("INFO", "submitting bid offer", submittedBidOfferPair=bidOfferPair)
+        try:
+            response = await self.send(
+                "POST",
+                f"{GRID_OPERATOR_HOST_ADDRESS}/submissions",
+                idempotent=False,
+                headers=JSON_HEADERS,
+                content=json.dumps(bidOfferPair.dict(), cls=DecimalCompatibleEncoder),
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise Exception(f"Failed to submit bid-offer pair, cause: {str(e)}")
@@ -0,0 +1,246 @@
+"""
+Run the optimiser over many settlement period windows in parallel, each against
+its own in-process market, grid operator and battery.
+
+    python -m app.backtest --first 2021-10-04T00:00:00 --last 2021-10-10T22:00:00 --strategy greedy optimal
+"""
+
+import asyncio
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from multiprocessing import get_context
+from os import cpu_count, getenv
+from time import perf_counter
+from typing import List, Optional
+
+from app.backends.embedded import (
+    EmbeddedBattery,
+    EmbeddedGridOperator,
+    EmbeddedMarket,
+    EmbeddedServiceBackend,
+)
+from app.models import (
+    BacktestReport,
+    BacktestWindow,
+    BacktestWindowResult,
+    Strategy,
+)
+from app.results import ResultsRecorder
+from app.services import use_backend
+from app.simulation import bid_offer_pair_of, run_strategy
+from app.strategies import (
+    DEFAULT_STRATEGY,
+    NUMBER_OF_CANDIDATES,
+    SIMULATION_TIMESTEP,
+    TIMESTEP_BEFORE_GATE_CLOSURE,
+)
+from app.utils import convertDateTimeToFormat, convertFromFormatToDateTime
+
+## the most worker processes a backtest uses, 0 for one per core
+BACKTEST_WORKERS = int(getenv("SVC_BACKTEST_WORKERS", "0"))
+
+## predictions are read once per worker process and shared by all its windows
+workerMarket: Optional[EmbeddedMarket] = None
+
+
+def initialiseWorker():
+    global workerMarket
+    workerMarket = EmbeddedMarket()
+
+
+def runWindow(
+    window: BacktestWindow, seed: Optional[int], runId: Optional[str]
+) -> BacktestWindowResult:
+    """
+    Run one window against a fresh battery, so windows never see each other's
+    state whichever worker they land on. With a `runId`, its steps are recorded
+    under that results run.
+    """
+    result = BacktestWindowResult(
+        firstSettlementPeriodStart=window.firstSettlementPeriodStart,
+        lastSettlementPeriodStart=window.lastSettlementPeriodStart,
+        strategy=window.strategy or DEFAULT_STRATEGY,
+        numberOfCandidates=window.numberOfCandidates or NUMBER_OF_CANDIDATES,
+    )
+    windowBackend = EmbeddedServiceBackend(
+        market=workerMarket,
+        gridOperator=EmbeddedGridOperator(seed),
+        battery=EmbeddedBattery(),
+    )
+    startTime = perf_counter()
+    try:
+        with use_backend(windowBackend):
+            outcomes = asyncio.run(
+                run_strategy(
+                    convertFromFormatToDateTime(window.firstSettlementPeriodStart),
+                    convertFromFormatToDateTime(window.lastSettlementPeriodStart),
+                    numberOfCandidates=result.numberOfCandidates,
+                    strategy=result.strategy,
+                )
+            )
+    except Exception as e:
+        result.error = str(e)
+        result.durationSeconds = perf_counter() - startTime
+        return result
+
+    if runId is not None:
+        recorder = ResultsRecorder(runId, result.strategy, result.numberOfCandidates)
+        for outcome in outcomes:
+            recorder.add(outcome, bid_offer_pair_of(outcome))
+        recorder.flush(final=True)
+
+    for outcome in outcomes:
+        bidOfferPair = outcome["submittedBidOfferPair"]
+        if bidOfferPair is None:
+            continue
+        result.submissions += 1
+        if outcome["offerAccepted"]:
+            result.acceptedSubmissions += 1
+            result.offerVolumeAccepted += float(bidOfferPair.offerVolume)
+            result.revenue += float(bidOfferPair.offerPrice * bidOfferPair.offerVolume)
+        if outcome["bidAccepted"]:
+            result.acceptedSubmissions += 1
+            result.bidVolumeAccepted += float(bidOfferPair.bidVolume)
+            result.revenue -= float(bidOfferPair.bidPrice * bidOfferPair.bidVolume)
+    result.steps = len(outcomes)
+    result.durationSeconds = perf_counter() - startTime
+    return result
+
+
+def run_backtest(
+    windows: List[BacktestWindow],
+    workers: Optional[int] = None,
+    seed: Optional[int] = None,
+    runId: Optional[str] = None,
+) -> BacktestReport:
+    """
+    Fan the windows out over a process pool and aggregate their results, in the
+    order the windows were given. With a `seed`, window `i` accepts submissions
+    with seed `seed + i` so a backtest can be repeated exactly. With a `runId`,
+    the steps of every window are recorded under that results run. `workers`
+    is capped at BACKTEST_WORKERS, or one per core when that is 0.
+    """
+    maxWorkers = BACKTEST_WORKERS or cpu_count() or 1
+    workers = max(1, min(workers or maxWorkers, maxWorkers, len(windows)))
+    seeds = [None if seed is None else seed + index for index in range(len(windows))]
+
+    startTime = perf_counter()
+    ## spawned rather than forked, the service may call this from a threaded process
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),
+        initializer=initialiseWorker,
+    ) as pool:
+        results = list(pool.map(runWindow, windows, seeds, [runId] * len(windows)))
+
+    succeeded = [result for result in results if result.error is None]
+    totalRevenue = sum(result.revenue for result in succeeded)
+    return BacktestReport(
+        windows=results,
+        workers=workers,
+        succeeded=len(succeeded),
+        failed=len(results) - len(succeeded),
+        totalRevenue=totalRevenue,
+        meanRevenue=totalRevenue / len(succeeded) if succeeded else None,
+        durationSeconds=perf_counter() - startTime,
+    )
+
+
+def splitIntoWindows(
+    first: str,
+    last: str,
+    windowLength: timedelta,
+    strategies: List[Strategy],
+    candidates: List[int],
+) -> List[BacktestWindow]:
+    """
+    Split first..last into consecutive windows of `windowLength`, once for every
+    combination of strategy and number of candidates. A window stops stepping
+    when its last settlement period is the last one before the next window.
+    """
+    firstDateTime = convertFromFormatToDateTime(first)
+    lastDateTime = convertFromFormatToDateTime(last)
+    windows = []
+    windowStart = firstDateTime
+    while windowStart <= lastDateTime:
+        windowEnd = min(
+            windowStart
+            + windowLength
+            - SIMULATION_TIMESTEP
+            - TIMESTEP_BEFORE_GATE_CLOSURE,
+            lastDateTime,
+        )
+        for strategy in strategies:
+            for numberOfCandidates in candidates:
+                windows.append(
+                    BacktestWindow(
+                        firstSettlementPeriodStart=convertDateTimeToFormat(windowStart),
+                        lastSettlementPeriodStart=convertDateTimeToFormat(windowEnd),
+                        strategy=strategy,
+                        numberOfCandidates=numberOfCandidates,
+                    )
+                )
+        windowStart += windowLength
+    return windows
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--first", required=True, help="first settlement period start")
+    parser.add_argument("--last", required=True, help="last settlement period start")
+    parser.add_argument(
+        "--window-hours",
+        type=float,
+        default=24,
+        help="length of each window",
+    )
+    parser.add_argument(
+        "--strategy",
+        type=Strategy,
+        nargs="+",
+        default=[DEFAULT_STRATEGY],
+        help="strategies to run every window with",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        nargs="+",
+        default=[NUMBER_OF_CANDIDATES],
+        help="numbers of greedy candidates to run every window with",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--seed", type=int, default=None, help="acceptance seed")
+    parser.add_argument("--output", default=None, help="write the report here")
+    parser.add_argument("--run-id", default=None, help="record the steps as this run")
+    arguments = parser.parse_args()
+
+    report = run_backtest(
+        splitIntoWindows(
+            arguments.first,
+            arguments.last,
+            timedelta(hours=arguments.window_hours),
+            arguments.strategy,
+            arguments.candidates,
+        ),
+        workers=arguments.workers,
+        seed=arguments.seed,
+        runId=arguments.run_id,
+    )
+    if arguments.output:
+        with open(arguments.output, "w") as write:
+            write.write(report.json(indent=2))
+    for result in report.windows:
+        print(
+            f"{result.firstSettlementPeriodStart} - {result.lastSettlementPeriodStart} "
+            f"{result.strategy.value} k={result.numberOfCandidates}: "
+            + (
+                f"revenue {result.revenue:.2f}"
+                if result.error is None
+                else result.error
+            )
+        )
+    print(
+        f"{report.succeeded} windows succeeded, {report.failed} failed, total revenue "
+        f"{report.totalRevenue:.2f}, {report.workers} workers, {report.durationSeconds:.1f}s"
+    )
@@ -0,0 +1,145 @@
+"""
+The decisions of a strategy run, on step indices and float arrays.
+
+Steps are numbered from the first simulation timestamp of a run, and battery
+states and limits are float arrays with one entry per asset or scenario. Days
+are worked out for every step of a run at once, and greedy candidates for a
+whole day at its first step. Datetimes, strings, Decimals and BidOfferPairs are
+left to the callers, which only build them for what is sent to the services or
+returned.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from app.models import BatteryAsset, BatteryState
+from app.predictions import PredictionWindow
+from app.strategies import (
+    MINUTES_PER_DAY,
+    OFFER_BID_VOLUME,
+    SIMULATION_TIMESTEP,
+    TIMESTEP_BEFORE_GATE_CLOSURE,
+)
+
+STEP_MINUTES = SIMULATION_TIMESTEP / timedelta(minutes=1)
+GATE_CLOSURE_MINUTES = TIMESTEP_BEFORE_GATE_CLOSURE / timedelta(minutes=1)
+LIMITS = ["maxCapacity", "maxChargeCycle", "maxDischargeCycle"]
+
+
+def stepDays(
+    firstTimestamp: datetime, numberOfSteps: int, offset: timedelta = timedelta(0)
+) -> np.ndarray:
+    """
+    The day of every step, counted from the day of `firstTimestamp`, for the
+    time `offset` after each step's simulation timestamp.
+    """
+    minutesIntoFirstDay = (
+        firstTimestamp - datetime.combine(firstTimestamp.date(), datetime.min.time())
+    ) / timedelta(minutes=1)
+    return (
+        minutesIntoFirstDay
+        + offset / timedelta(minutes=1)
+        + STEP_MINUTES * np.arange(numberOfSteps)
+    ) // MINUTES_PER_DAY
+
+
+def dayStarts(days: np.ndarray) -> np.ndarray:
+    """Mark the steps on a different day to the step before, never the first."""
+    return np.diff(days, prepend=days[:1]) != 0
+
+
+def dayLength(startsDay: np.ndarray, step: int) -> int:
+    """The number of steps from `step` to the next day start or the last step."""
+    laterStarts = np.flatnonzero(startsDay[step + 1 :])
+    return int(laterStarts[0]) + 1 if len(laterStarts) else len(startsDay) - step
+
+
+def greedyDayPrices(
+    predictionWindow: PredictionWindow,
+    predictionRow: int,
+    numberOfSteps: int,
+    numberOfCandidates: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Candidate bid and offer prices for the settlement periods of a day of
+    `numberOfSteps` steps, all from the vintage predicted at its first step.
+    NaN where a price is not among the `numberOfCandidates` lowest bids or
+    highest offers of the vintage, or was not predicted.
+    """
+    lowestBids, highestOffers = predictionWindow.selectCandidates(numberOfCandidates)
+    columns = predictionWindow.columns(
+        GATE_CLOSURE_MINUTES + STEP_MINUTES * np.arange(numberOfSteps)
+    )
+    predicted = columns >= 0
+    columns = np.where(predicted, columns, 0)
+    return (
+        np.where(
+            predicted & lowestBids[predictionRow, columns],
+            predictionWindow.bidPrices[predictionRow, columns],
+            np.nan,
+        ),
+        np.where(
+            predicted & highestOffers[predictionRow, columns],
+            predictionWindow.offerPrices[predictionRow, columns],
+            np.nan,
+        ),
+    )
+
+
+def assetLimits(assets: Sequence[BatteryAsset]) -> Dict[str, np.ndarray]:
+    """The capacity and cycle limits of the assets, one array per limit."""
+    return {
+        limit: np.array([float(asset[limit]) for asset in assets]) for limit in LIMITS
+    }
+
+
+def limitGroups(assets: Sequence[BatteryAsset]) -> Dict[Tuple, np.ndarray]:
+    """The indices of the assets sharing each combination of limits."""
+    groups: Dict[Tuple, List[int]] = {}
+    for index, asset in enumerate(assets):
+        groups.setdefault(tuple(asset[limit] for limit in LIMITS), []).append(index)
+    return {limits: np.array(indices) for (limits, indices) in groups.items()}
+
+
+def stateArrays(
+    batteryStates: Sequence[BatteryState],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Charge levels and same-day import and export totals of the states."""
+    return (
+        np.array([float(state["chargeLevelAtPeriodStart"]) for state in batteryStates]),
+        np.array([float(state["sameDayImportTotal"]) for state in batteryStates]),
+        np.array([float(state["sameDayExportTotal"]) for state in batteryStates]),
+    )
+
+
+def dispatchDecisions(
+    *,
+    bidPrices,
+    offerPrices,
+    chargeLevel: np.ndarray,
+    importedToday: np.ndarray,
+    exportedToday: np.ndarray,
+    maxCapacity,
+    maxChargeCycle,
+    maxDischargeCycle,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Which batteries offer to discharge and which bid to charge. A battery
+    offers if it can discharge and has an offer price, else bids if it can
+    charge and has a bid price, else idles. Prices and limits are arrays like
+    the states or single values shared by all of them.
+    """
+    discharges = (
+        ~np.isnan(offerPrices)
+        & (chargeLevel - OFFER_BID_VOLUME >= 0)
+        & (exportedToday + OFFER_BID_VOLUME <= maxDischargeCycle)
+    )
+    charges = (
+        ~discharges
+        & ~np.isnan(bidPrices)
+        & (chargeLevel + OFFER_BID_VOLUME <= maxCapacity)
+        & (importedToday + OFFER_BID_VOLUME <= maxChargeCycle)
+    )
+    return discharges, charges
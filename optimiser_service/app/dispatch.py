@@ -0,0 +1,100 @@
+from enum import IntEnum
+from typing import Tuple
+
+import numpy as np
+
+
+class DispatchAction(IntEnum):
+    idle = 0
+    discharge = 1
+    charge = 2
+
+
+def solveOptimalDispatchPolicy(
+    *,
+    offerPrices: np.ndarray,
+    bidPrices: np.ndarray,
+    startsNewDay: np.ndarray,
+    volume: float,
+    maxCapacity: float,
+    maxChargeCycle: float,
+    maxDischargeCycle: float,
+    acceptanceRate: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Revenue-optimal action for the first of a run of settlement periods, from
+    every possible state.
+
+    Solves a dynamic program backwards over the periods. The state is the
+    charge level and the volumes imported and exported so far that day, each
+    counted in multiples of `volume`; `startsNewDay[t]` resets the day totals
+    before period `t`. In every period the battery can stay idle, offer
+    `volume` (earning the offer price) or bid for `volume` (paying the bid
+    price), and a submission is accepted with probability `acceptanceRate`,
+    leaving the state unchanged otherwise. Periods without a price (NaN) only
+    allow staying idle.
+
+    The value function covers every state at once, so each period costs a
+    handful of array operations however fine the state grid is.
+
+    Returns the best first action and its expected revenue for every state,
+    as arrays indexed by `dispatchStateIndex`.
+    """
+    stateShape = (
+        int(maxCapacity // volume) + 1,
+        int(maxChargeCycle // volume) + 1,
+        int(maxDischargeCycle // volume) + 1,
+    )
+
+    ## value of each state at the start of the period after the current one
+    nextValue = np.zeros(stateShape)
+    bestAction = np.full(stateShape, int(DispatchAction.idle))
+
+    for period in range(len(offerPrices) - 1, -1, -1):
+        if period + 1 < len(offerPrices) and startsNewDay[period + 1]:
+            ## day totals are reset before the next period starts
+            continuationValue = np.broadcast_to(nextValue[:, :1, :1], stateShape).copy()
+        else:
+            continuationValue = nextValue
+
+        idleValue = continuationValue
+        dischargeValue = np.full(stateShape, -np.inf)
+        chargeValue = np.full(stateShape, -np.inf)
+
+        offerPrice = offerPrices[period]
+        if not np.isnan(offerPrice):
+            ## one level less charge and one more level exported today
+            dischargeValue[1:, :, :-1] = (
+                acceptanceRate * (offerPrice * volume + continuationValue[:-1, :, 1:])
+                + (1 - acceptanceRate) * continuationValue[1:, :, :-1]
+            )
+
+        bidPrice = bidPrices[period]
+        if not np.isnan(bidPrice):
+            ## one level more charge and one more level imported today
+            chargeValue[:-1, :-1, :] = (
+                acceptanceRate * (-bidPrice * volume + continuationValue[1:, 1:, :])
+                + (1 - acceptanceRate) * continuationValue[:-1, :-1, :]
+            )
+
+        actionValues = np.stack([idleValue, dischargeValue, chargeValue])
+        bestAction = np.argmax(actionValues, axis=0)
+        nextValue = np.max(actionValues, axis=0)
+
+    return bestAction, nextValue
+
+
+def dispatchStateIndex(
+    chargeLevel, importedToday, exportedToday, *, volume: float, stateShape
+) -> Tuple:
+    """
+    Index into `solveOptimalDispatchPolicy` tables for one state, or for a
+    whole array of states at once.
+    """
+    return tuple(
+        np.clip(np.floor_divide(np.asarray(each, dtype=float), volume), 0, size - 1)
+        .astype(int)
+        .reshape(np.shape(each))
+        for (each, size) in zip((chargeLevel, importedToday, exportedToday), stateShape)
+    )
+
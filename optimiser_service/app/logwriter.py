@@ -0,0 +1,189 @@
+import json
+import sys
+from datetime import datetime
+from math import isfinite
+from os import getenv, path, rename
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import time
+from typing import Optional
+
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+
+LOG_QUEUE_SIZE = int(getenv("SVC_LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(getenv("SVC_LOG_BATCH_SIZE", "500"))
+LOG_ROTATION_BYTES = int(getenv("SVC_LOG_ROTATION_BYTES", str(10 * 1024 * 1024)))
+## state records are also echoed to the terminal, from the writer thread
+LOG_TO_CONSOLE = getenv("SVC_LOG_TO_CONSOLE", "true").lower() == "true"
+
+
+class LogRecordEncoder(json.JSONEncoder):
+    """
+    Encodes Decimals, datetimes and models as the API responses do, and NaN
+    and infinite floats as null, which strict JSON readers accept.
+    """
+
+    def encode(self, obj):
+        return super().encode(withoutNonFinite(obj))
+
+    def default(self, obj):
+        return withoutNonFinite(jsonable_encoder(obj))
+
+
+def withoutNonFinite(value):
+    """`value` with every NaN or infinite float in it replaced by None."""
+    if isinstance(value, float):
+        return value if isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: withoutNonFinite(item) for (key, item) in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [withoutNonFinite(item) for item in value]
+    return value
+
+
+class LogWriter:
+    """
+    Writes log records to a newline-delimited JSON file from a background
+    thread.
+
+    Callers only put a record on a bounded queue and never wait for it to be
+    written; when the queue is full the record is dropped and counted. The
+    thread takes whatever records are waiting, up to `batchSize`, encodes each
+    one once and writes them with a single write. The file is renamed with a
+    timestamp and a new one started once it would grow past `rotationBytes`.
+    """
+
+    def __init__(
+        self,
+        location: str,
+        queueSize: int = LOG_QUEUE_SIZE,
+        batchSize: int = LOG_BATCH_SIZE,
+        rotationBytes: int = LOG_ROTATION_BYTES,
+        toConsole: bool = LOG_TO_CONSOLE,
+    ):
+        self.location = location
+        self.queue: Queue = Queue(maxsize=max(queueSize, 1))
+        self.batchSize = max(batchSize, 1)
+        self.rotationBytes = rotationBytes
+        self.toConsole = toConsole
+        self.dropped = 0
+        self.droppedLock = Lock()
+        self.file = open(location, "a")
+        self.thread = Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, level: str, message: str, fields: dict, echo: bool = False):
+        """Queue a record, stamped with the current time."""
+        try:
+            self.queue.put_nowait((time(), level, message, fields, echo))
+        except Full:
+            with self.droppedLock:
+                self.dropped += 1
+
+    def sink(self, message):
+        """A loguru sink, so the service's other logs go to the same file."""
+        record = message.record
+        self.write(
+            record["level"].name,
+            record["message"],
+            {"name": record["name"]},
+        )
+
+    def close(self):
+        """Write every queued record, then stop the thread and close the file."""
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            stopping = batch[-1] is None
+            try:
+                self.writeBatch([record for record in batch if record is not None])
+            except Exception as e:
+                print(f"log records not written, cause: {str(e)}", file=sys.stderr)
+            if stopping:
+                return
+
+    def writeBatch(self, batch: list):
+        with self.droppedLock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            batch.append(
+                (time(), "WARNING", f"{dropped} log records dropped", {}, False)
+            )
+        if not batch:
+            return
+
+        lines = []
+        echoed = []
+        for timestamp, level, message, fields, echo in batch:
+            line = json.dumps(
+                {
+                    "time": datetime.fromtimestamp(timestamp).isoformat(),
+                    "level": level,
+                    "message": message,
+                    **fields,
+                },
+                cls=LogRecordEncoder,
+                separators=(",", ":"),
+            )
+            lines.append(line)
+            if echo:
+                echoed.append(line)
+        text = "\n".join(lines) + "\n"
+
+        if self.file.tell() and self.file.tell() + len(text) > self.rotationBytes:
+            self.rotate()
+        self.file.write(text)
+        self.file.flush()
+        if self.toConsole and echoed:
+            sys.stderr.write("\n".join(echoed) + "\n")
+
+    def rotate(self):
+        self.file.close()
+        stem, extension = path.splitext(self.location)
+        rename(
+            self.location,
+            f"{stem}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S_%f')}{extension}",
+        )
+        self.file = open(self.location, "a")
+
+
+activeWriter: Optional[LogWriter] = None
+activeSinkId: Optional[int] = None
+
+
+def start_log_writer(location: str) -> LogWriter:
+    """Send log records to `location`, and the loguru logs with them."""
+    global activeWriter, activeSinkId
+    stop_log_writer()
+    activeWriter = LogWriter(location)
+    activeSinkId = logger.add(activeWriter.sink)
+    return activeWriter
+
+
+def stop_log_writer():
+    global activeWriter, activeSinkId
+    if activeWriter is not None:
+        logger.remove(activeSinkId)
+        activeWriter.close()
+        activeWriter, activeSinkId = None, None
+
+
+def log_record(level: str, message: str, **fields):
+    """
+    Log a structured record without waiting for it to be written. Without a
+    running writer, such as in backtest workers, it goes to loguru instead.
+    """
+    if activeWriter is not None:
+        activeWriter.write(level, message, fields, echo=True)
+    else:
+        logger.log(level, f"{message} {json.dumps(fields, cls=LogRecordEncoder)}")
@@ -1,39 +1,70 @@
-from datetime import date, datetime, timedelta
-from decimal import Decimal
-from typing import List, Optional, Union, cast
+import asyncio
+import re
+import sys
+from functools import partial
+from typing import AsyncIterator, List, Optional
 from os import makedirs, getenv
 
-from fastapi import BackgroundTasks, FastAPI
+from fastapi import FastAPI, HTTPException, Path, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from loguru import logger
 from json import dumps
 
-from app.models import BidOfferPair
+from app.backtest import run_backtest
+from app.models import (
+    DEFAULT_ASSET_ID,
+    DEFAULT_RUN_ID,
+    BacktestReport,
+    BacktestRequest,
+    BidOfferPair,
+    ChargeCurve,
+    DailyResult,
+    RevenueDistribution,
+    StepOutcome,
+    Strategy,
+    StrategyEncoding,
+)
+from app.logwriter import log_record, start_log_writer, stop_log_writer
+from app.metrics import (
+    TracingMiddleware,
+    currentTimings,
+    currentTraceId,
+    render_metrics,
+)
+from app.montecarlo import (
+    MONTE_CARLO_MAX_SCENARIOS,
+    MONTE_CARLO_SCENARIOS,
+    simulate_revenue_distribution,
+)
+from app.profiling import profiled_run, should_profile
+from app.results import (
+    RECORD_RESULTS,
+    ResultsRecorder,
+    charge_curves,
+    daily_results,
+    delete_results,
+)
+from app.simulation import bid_offer_pair_of, iterate_strategy, select_assets
+from app.strategies import (
+    DEFAULT_STRATEGY,
+    EXPECTED_ACCEPTANCE_RATE,
+    NUMBER_OF_CANDIDATES,
+)
 from app.utils import (
     convertDateTimeToFormat,
     convertFromFormatToDateTime,
     log_optimiser_current_state,
 )
-from app.services import (
-    DischargeRequest,
-    MarketPredictions,
-    charge_battery,
-    discharge_battery,
-    get_battery_state,
-    get_next_48_market_predictions,
-    submit_bid_offer_pair,
-    ChargeRequest,
-)
+from app.services import close_backend, reset_run, use_run
 
-
-BATTERY_MAX_CHARGE_CYCLE = 20
-BATTERY_MAX_DISCHARGE_CYCLE = 20
-BATTERY_MAX_CAPACITY = 10
-SIMULATION_TIMESTEP = timedelta(minutes=30)
-TIMESTEP_BEFORE_GATE_CLOSURE = timedelta(hours=1)
-OFFER_BID_VOLUME = 5
+## the run ids the battery service accepts
+## runs name directories, so ids start with a letter or digit and are never ".."
+RUN_ID_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$"
 
 
 app = FastAPI()
+app.add_middleware(TracingMiddleware)
 
 
 @app.on_event("startup")
@@ -45,7 +76,17 @@ def configure_logging():
     except OSError:
         logger.info("log directory not made as it already exists")
 
-    logger.add(logFileName, rotation="10 MB", serialize=True)
+    start_log_writer(logFileName)
+
+
+@app.on_event("shutdown")
+async def close_service_connections():
+    await close_backend()
+
+
+@app.on_event("shutdown")
+def flush_logs():
+    stop_log_writer()
 
 
 @app.get("/")
@@ -53,204 +94,268 @@ def read_root():
     return {"Hello": "from optimiser"}
 
 
-def evaluate_bid_offer_pair_at_time(
-    simulationTimeStamp: datetime,
-    offerPrice=Decimal(9999),
-    offerVolume=Decimal(0),
-    bidVolume=Decimal(0),
-    bidPrice=Decimal(-9999),
-) -> BidOfferPair:
-    bidOfferPair = BidOfferPair(
-        submissionTime=convertDateTimeToFormat(simulationTimeStamp),
-        settlementPeriodStartTime=convertDateTimeToFormat(
-            simulationTimeStamp + TIMESTEP_BEFORE_GATE_CLOSURE
-        ),
-        offerPrice=offerPrice,
-        offerVolume=offerVolume,
-        bidVolume=bidVolume,
-        bidPrice=bidPrice,
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return render_metrics()
+
+
+def log_run_timings(runId: str):
+    """Log the time the request spent in each kind of call to the other services."""
+    log_record(
+        "INFO",
+        "strategy run timings",
+        runId=runId,
+        traceId=currentTraceId.get(),
+        timings={
+            call: {"calls": int(calls), "seconds": seconds}
+            for (call, (calls, seconds)) in (currentTimings.get() or {}).items()
+        },
+    )
+
+
+def log_outcome(outcome: StepOutcome, bidOfferPair: BidOfferPair):
+    batteryState = outcome["batteryState"]
+    log_optimiser_current_state(
+        assetId=outcome["assetId"],
+        simulationTimestamp=convertDateTimeToFormat(outcome["simulationTimestamp"]),
+        batteryStateOfCharge=batteryState["chargeLevelAtPeriodStart"],
+        totalEnergyExportedFromStartToDate=batteryState["cumulativeExportTotal"],
+        totalEnergyImportedFromStartToDate=batteryState["cumulativeImportTotal"],
+        totalEnergyExportedOnCurrentDay=batteryState["sameDayExportTotal"],
+        totalEnergyImportedOnCurrentDay=batteryState["sameDayImportTotal"],
+        bidPricePrediction=outcome["bidPricePrediction"],
+        offerPricePrediction=outcome["offerPricePrediction"],
+        submittedBidOfferPair=bidOfferPair,
+        bidAccepted=outcome["bidAccepted"],
+        offerAccepted=outcome["offerAccepted"],
     )
-    return bidOfferPair
+
+
+async def stream_outcomes(
+    steps: AsyncIterator[List[StepOutcome]],
+    runId: str,
+    recorder: Optional[ResultsRecorder],
+    profile: bool,
+) -> AsyncIterator[str]:
+    """
+    One NDJSON line per asset and step, written as soon as the step is
+    settled. A failure ends the stream with a line holding its `detail`.
+    """
+    with use_run(runId), profiled_run(
+        profile, runId, sys._getframe(), currentTraceId.get()
+    ):
+        try:
+            async for stepOutcomes in steps:
+                lines = []
+                for outcome in stepOutcomes:
+                    bidOfferPair = bid_offer_pair_of(outcome)
+                    log_outcome(outcome, bidOfferPair)
+                    if recorder:
+                        recorder.add(outcome, bidOfferPair)
+                    lines.append(
+                        dumps(
+                            jsonable_encoder(
+                                {
+                                    "submittedBidOfferPair": bidOfferPair,
+                                    "bidAccepted": outcome["bidAccepted"],
+                                    "offerAccepted": outcome["offerAccepted"],
+                                    "batteryState": outcome["batteryState"],
+                                }
+                            )
+                        )
+                        + "\n"
+                    )
+                yield "".join(lines)
+                if recorder and recorder.finishedDays:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, recorder.flush
+                    )
+        except Exception as e:
+            logger.error(f"strategy stream stopped, cause: {str(e)}")
+            yield dumps({"detail": str(e)}) + "\n"
+        finally:
+            ## a client that disconnects cancels the stream, stop the run with it
+            await steps.aclose()
+            ## and keep what was run before it stopped
+            if recorder:
+                recorder.flush(final=True)
+            log_run_timings(runId)
 
 
 @app.get("/strategy/", response_model=List[BidOfferPair])
-def optimise_revenue_for_period(
+async def optimise_revenue_for_period(
     firstSettlementPeriodStart: str,
     lastSettlementPeriodStart: str,
-    background_tasks: BackgroundTasks,
-) -> List[BidOfferPair]:
-    firstSettlementPeriodStartAsDateTime = convertFromFormatToDateTime(
-        firstSettlementPeriodStart
+    numberOfCandidates: int = Query(NUMBER_OF_CANDIDATES, ge=1),
+    strategy: Strategy = DEFAULT_STRATEGY,
+    assetId: Optional[List[str]] = Query(None),
+    runId: str = Query(DEFAULT_RUN_ID, regex=RUN_ID_PATTERN),
+    format: StrategyEncoding = StrategyEncoding.json,
+    profile: Optional[bool] = None,
+    record: Optional[bool] = None,
+):
+    """
+    The bid offer pair submitted for every asset at every step of the period.
+
+    The default `json` encoding returns them all once the run is done, with
+    the time spent in each kind of service call in its Server-Timing header.
+    The `ndjson` encoding streams one line per asset and step as soon as the
+    step is settled, with the pair, whether it was accepted and the battery
+    state, and logs the timings when the run ends.
+
+    With `profile` the run is sampled and its collapsed stacks are written
+    next to the logs, without it runs are profiled as configured. With
+    `record` its steps are recorded under the results of `runId`, without it
+    they are recorded as configured.
+    """
+    try:
+        assets = await select_assets(assetId)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    steps = iterate_strategy(
+        convertFromFormatToDateTime(firstSettlementPeriodStart),
+        convertFromFormatToDateTime(lastSettlementPeriodStart),
+        numberOfCandidates=numberOfCandidates,
+        strategy=strategy,
+        assets=assets,
     )
-    lastSettlementPeriodStartAsDateTime = convertFromFormatToDateTime(
-        lastSettlementPeriodStart
+    recorder = (
+        ResultsRecorder(runId, strategy, numberOfCandidates)
+        if (RECORD_RESULTS if record is None else record)
+        else None
     )
-
-    desiredNumberOfComputations = (
-        int(
-            (lastSettlementPeriodStartAsDateTime - firstSettlementPeriodStartAsDateTime)
-            / SIMULATION_TIMESTEP
+    if format == StrategyEncoding.ndjson:
+        return StreamingResponse(
+            stream_outcomes(steps, runId, recorder, should_profile(profile)),
+            media_type="application/x-ndjson",
         )
-        + 1
-    )
 
-    resultsToReturn: List[Union[BidOfferPair, None]] = [
-        None
-    ] * desiredNumberOfComputations
+    with use_run(runId), profiled_run(
+        should_profile(profile), runId, sys._getframe(), currentTraceId.get()
+    ):
+        outcomes = [outcome async for stepOutcomes in steps for outcome in stepOutcomes]
+    log_run_timings(runId)
+
+    bidOfferPairs = [bid_offer_pair_of(outcome) for outcome in outcomes]
+    for outcome, bidOfferPair in zip(outcomes, bidOfferPairs):
+        log_outcome(outcome, bidOfferPair)
+        if recorder:
+            recorder.add(outcome, bidOfferPair)
+    if recorder:
+        await asyncio.get_running_loop().run_in_executor(
+            None, partial(recorder.flush, final=True)
+        )
 
-    prospectiveOffersAndBids: MarketPredictions = {"offer_prices": {}, "bid_prices": {}}
+    return bidOfferPairs
 
-    for step in range(desiredNumberOfComputations):
 
-        simulationTimestamp = firstSettlementPeriodStartAsDateTime + (
-            SIMULATION_TIMESTEP * step
+@app.get("/strategy/montecarlo/", response_model=RevenueDistribution)
+async def simulate_revenue_for_period(
+    firstSettlementPeriodStart: str,
+    lastSettlementPeriodStart: str,
+    scenarios: int = Query(MONTE_CARLO_SCENARIOS, ge=1, le=MONTE_CARLO_MAX_SCENARIOS),
+    seed: Optional[int] = Query(None, ge=0),
+    acceptanceRate: float = Query(EXPECTED_ACCEPTANCE_RATE, ge=0, le=1),
+    numberOfCandidates: int = Query(NUMBER_OF_CANDIDATES, ge=1),
+    strategy: Strategy = DEFAULT_STRATEGY,
+    assetId: str = DEFAULT_ASSET_ID,
+    runId: str = Query(DEFAULT_RUN_ID, regex=RUN_ID_PATTERN),
+) -> RevenueDistribution:
+    try:
+        (asset,) = await select_assets([assetId])
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    with use_run(runId):
+        return await simulate_revenue_distribution(
+            firstSettlementPeriodStart=convertFromFormatToDateTime(
+                firstSettlementPeriodStart
+            ),
+            lastSettlementPeriodStart=convertFromFormatToDateTime(
+                lastSettlementPeriodStart
+            ),
+            numberOfScenarios=scenarios,
+            strategy=strategy,
+            numberOfCandidates=numberOfCandidates,
+            acceptanceRate=acceptanceRate,
+            asset=asset,
+            seed=seed,
         )
 
-        settlementPeriodDateTime = simulationTimestamp + TIMESTEP_BEFORE_GATE_CLOSURE
 
-        isTimeStepStartOfNewDay = (
-            simulationTimestamp.date()
-            != (simulationTimestamp - SIMULATION_TIMESTEP).date()
-        )
+@app.delete("/runs/{runId}/", status_code=204)
+async def reset_battery_run(runId: str = Path(..., regex=RUN_ID_PATTERN)):
+    """Start every battery of the run afresh, in the battery service or in-process."""
+    with use_run(runId):
+        await reset_run()
+    return Response(status_code=204)
+
+
+@app.post("/backtest/", response_model=BacktestReport)
+async def backtest_windows(request: BacktestRequest) -> BacktestReport:
+    if request.runId is not None and not re.match(RUN_ID_PATTERN, request.runId):
+        raise HTTPException(status_code=422, detail=f"invalid runId {request.runId}")
+    ## the process pool is driven from a thread so the event loop stays free
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        run_backtest,
+        request.windows,
+        request.workers,
+        request.seed,
+        request.runId,
+    )
 
-        batteryStateAtSimulationTimestamp = get_battery_state(simulationTimestamp)
-        batteryStateAtSettlementPeriodTimestamp = get_battery_state(
-            settlementPeriodDateTime
-        )
-        next48Predictions = get_next_48_market_predictions(simulationTimestamp)
-        bidAccepted = False
-        offerAccepted = False
-
-        ## get market predictions at start of the day or on first timestep
-        if step == 0 or (isTimeStepStartOfNewDay):
-
-            ## as there is no volume demand prediction along with offers and bids
-            ## it is assumed that any charge/discharge will be for a volume of 5MWh
-            ## this implies a limit of 4 charges and 4 discharges.
-
-            ## an 80% acceptance also means at least 5 possible bids/offers need to be generated.
-
-            lowest5BidTimesAndPrices = sorted(
-                next48Predictions["bid_prices"].items(),
-                key=lambda timeAndPrice: timeAndPrice[1],
-            )[0:5]
-            prospectiveOffersAndBids["bid_prices"] = {
-                each[0]: each[1] for each in lowest5BidTimesAndPrices
-            }
-
-            highest5OfferTimesAndPrices = sorted(
-                next48Predictions["offer_prices"].items(),
-                key=lambda timeAndPrice: timeAndPrice[1],
-            )[-5:]
-            prospectiveOffersAndBids["offer_prices"] = {
-                each[0]: each[1] for each in highest5OfferTimesAndPrices
-            }
-
-        possibleBidOfferPair = None
-
-        if (
-            convertDateTimeToFormat(settlementPeriodDateTime)
-            in prospectiveOffersAndBids["offer_prices"]
-            and (
-                batteryStateAtSettlementPeriodTimestamp["chargeLevelAtPeriodStart"]
-                - OFFER_BID_VOLUME
-                >= 0
-            )
-            and (
-                batteryStateAtSettlementPeriodTimestamp["sameDayExportTotal"]
-                + OFFER_BID_VOLUME
-                <= BATTERY_MAX_DISCHARGE_CYCLE
-            )
-        ):
-            possibleBidOfferPair = evaluate_bid_offer_pair_at_time(
-                simulationTimeStamp=simulationTimestamp,
-                offerPrice=prospectiveOffersAndBids["offer_prices"][
-                    convertDateTimeToFormat(settlementPeriodDateTime)
-                ],
-                offerVolume=OFFER_BID_VOLUME,
-            )
-
-            submissionResult = submit_bid_offer_pair(possibleBidOfferPair)
-
-            if submissionResult["accepted"]:
-                discharge_battery(
-                    DischargeRequest(
-                        settlementPeriodStartTime=convertDateTimeToFormat(
-                            settlementPeriodDateTime
-                        ),
-                        offerVolume=OFFER_BID_VOLUME,
-                    )
-                )
-                offerAccepted = True
-        elif (
-            convertDateTimeToFormat(settlementPeriodDateTime)
-            in prospectiveOffersAndBids["bid_prices"]
-            and (
-                batteryStateAtSettlementPeriodTimestamp["chargeLevelAtPeriodStart"]
-                + OFFER_BID_VOLUME
-                <= BATTERY_MAX_CAPACITY
-            )
-            and (
-                (
-                    batteryStateAtSettlementPeriodTimestamp["sameDayImportTotal"]
-                    + OFFER_BID_VOLUME
-                )
-                <= BATTERY_MAX_CHARGE_CYCLE
-            )
-        ):
-            possibleBidOfferPair = evaluate_bid_offer_pair_at_time(
-                simulationTimeStamp=simulationTimestamp,
-                bidPrice=prospectiveOffersAndBids["bid_prices"][
-                    convertDateTimeToFormat(settlementPeriodDateTime)
-                ],
-                bidVolume=OFFER_BID_VOLUME,
-            )
-
-            submissionResult = submit_bid_offer_pair(possibleBidOfferPair)
-
-            if submissionResult["accepted"]:
-                charge_battery(
-                    ChargeRequest(
-                        settlementPeriodStartTime=convertDateTimeToFormat(
-                            settlementPeriodDateTime
-                        ),
-                        bidVolume=OFFER_BID_VOLUME,
-                    )
-                )
-                bidAccepted = True
-        else:
-            possibleBidOfferPair = evaluate_bid_offer_pair_at_time(
-                simulationTimeStamp=simulationTimestamp,
-            )
-
-        resultsToReturn[step] = possibleBidOfferPair
-
-        background_tasks.add_task(
-            log_optimiser_current_state,
-            simulationTimestamp=convertDateTimeToFormat(simulationTimestamp),
-            batteryStateOfCharge=batteryStateAtSimulationTimestamp[
-                "chargeLevelAtPeriodStart"
-            ],
-            totalEnergyExportedFromStartToDate=batteryStateAtSimulationTimestamp[
-                "cumulativeExportTotal"
-            ],
-            totalEnergyImportedFromStartToDate=batteryStateAtSimulationTimestamp[
-                "cumulativeImportTotal"
-            ],
-            totalEnergyExportedOnCurrentDay=batteryStateAtSimulationTimestamp[
-                "sameDayExportTotal"
-            ],
-            totalEnergyImportedOnCurrentDay=batteryStateAtSimulationTimestamp[
-                "sameDayImportTotal"
-            ],
-            bidPricePrediction=next48Predictions["bid_prices"][
-                convertDateTimeToFormat(settlementPeriodDateTime)
-            ],
-            offerPricePrediction=next48Predictions["offer_prices"][
-                convertDateTimeToFormat(settlementPeriodDateTime)
-            ],
-            submittedBidOfferPair=resultsToReturn[step],
-            bidAccepted=bidAccepted,
-            offerAccepted=offerAccepted,
-        )
-    return cast(List[BidOfferPair], resultsToReturn)
+
+@app.get("/results/{runId}/daily/", response_model=List[DailyResult])
+async def get_daily_results(
+    runId: str = Path(..., regex=RUN_ID_PATTERN),
+    firstDay: Optional[str] = None,
+    lastDay: Optional[str] = None,
+    strategy: Optional[Strategy] = None,
+    numberOfCandidates: Optional[int] = None,
+) -> List[DailyResult]:
+    """Revenue and accepted volumes per asset and day of the recorded steps."""
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        partial(
+            daily_results,
+            runId,
+            firstDay=firstDay,
+            lastDay=lastDay,
+            strategy=strategy,
+            numberOfCandidates=numberOfCandidates,
+        ),
+    )
+
+
+@app.get("/results/{runId}/charge/", response_model=List[ChargeCurve])
+async def get_charge_curves(
+    runId: str = Path(..., regex=RUN_ID_PATTERN),
+    firstDay: Optional[str] = None,
+    lastDay: Optional[str] = None,
+    strategy: Optional[Strategy] = None,
+    numberOfCandidates: Optional[int] = None,
+) -> List[ChargeCurve]:
+    """The charge level of every asset at each recorded step."""
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        partial(
+            charge_curves,
+            runId,
+            firstDay=firstDay,
+            lastDay=lastDay,
+            strategy=strategy,
+            numberOfCandidates=numberOfCandidates,
+        ),
+    )
+
+
+@app.delete("/results/{runId}/", status_code=204)
+async def delete_run_results(runId: str = Path(..., regex=RUN_ID_PATTERN)):
+    """Delete every recorded step of the run."""
+    if not await asyncio.get_running_loop().run_in_executor(
+        None, delete_results, runId
+    ):
+        raise HTTPException(status_code=404, detail=f"No results recorded for {runId}")
+    return Response(status_code=204)
@@ -1,5 +1,14 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from datetime import datetime
 from decimal import Decimal
+from enum import Enum
+from os import getenv
+from typing import List, Optional, TypedDict
+
+## the battery addressed by requests that do not name one
+DEFAULT_ASSET_ID = "battery-1"
+## the battery service run written to by requests that do not name one
+DEFAULT_RUN_ID = "default"
 
 
 class BidOfferPair(BaseModel):
@@ -9,3 +18,159 @@ class BidOfferPair(BaseModel):
     offerVolume: Decimal
     bidPrice: Decimal
     bidVolume: Decimal
+    assetId: str = DEFAULT_ASSET_ID
+
+
+class BatteryAsset(TypedDict):
+    assetId: str
+    maxCapacity: Decimal
+    maxChargeCycle: Decimal
+    maxDischargeCycle: Decimal
+    initialChargeLevel: Decimal
+
+
+class BatteryState(TypedDict):
+    assetId: str
+    settlementPeriodStartTime: str
+    chargeLevelAtPeriodStart: Decimal
+    sameDayImportTotal: Decimal
+    sameDayExportTotal: Decimal
+    cumulativeImportTotal: Decimal
+    cumulativeExportTotal: Decimal
+
+
+class BidOfferPairSubmissionResult(TypedDict):
+    submissionTime: str
+    settlementPeriodStartTime: str
+    offerPrice: Decimal
+    offerVolume: Decimal
+    bidPrice: Decimal
+    bidVolume: Decimal
+    accepted: bool
+
+
+class ChargeRequest(BaseModel):
+    settlementPeriodStartTime: str
+    bidVolume: Decimal
+    assetId: str = DEFAULT_ASSET_ID
+
+
+class DischargeRequest(BaseModel):
+    settlementPeriodStartTime: str
+    offerVolume: Decimal
+    assetId: str = DEFAULT_ASSET_ID
+
+
+class BatteryStateTransition(BaseModel):
+    settlementPeriodStartTime: str
+    ## "read", "charge" or "discharge"
+    action: str = "read"
+    volume: Decimal = Decimal(0)
+    assetId: str = DEFAULT_ASSET_ID
+
+
+class Strategy(str, Enum):
+    greedy = "greedy"
+    optimal = "optimal"
+
+
+class StrategyEncoding(str, Enum):
+    json = "json"
+    ndjson = "ndjson"
+
+
+class RevenuePercentile(BaseModel):
+    percentile: float
+    revenue: float
+
+
+class RevenueDistribution(BaseModel):
+    assetId: str
+    strategy: Strategy
+    scenarios: int
+    seed: int
+    acceptanceRate: float
+    meanRevenue: float
+    standardDeviation: float
+    minimumRevenue: float
+    maximumRevenue: float
+    percentiles: List[RevenuePercentile]
+    meanOfferVolumeAccepted: float
+    meanBidVolumeAccepted: float
+    meanFinalChargeLevel: float
+
+
+class StepOutcome(TypedDict):
+    assetId: str
+    simulationTimestamp: datetime
+    batteryState: BatteryState
+    bidPricePrediction: float
+    offerPricePrediction: float
+    ## None when the asset idled, see `bid_offer_pair_of`
+    submittedBidOfferPair: Optional[BidOfferPair]
+    bidAccepted: bool
+    offerAccepted: bool
+
+
+## the most windows one /backtest/ request may ask for
+BACKTEST_MAX_WINDOWS = int(getenv("SVC_BACKTEST_MAX_WINDOWS", "1000"))
+
+
+class BacktestWindow(BaseModel):
+    firstSettlementPeriodStart: str
+    lastSettlementPeriodStart: str
+    strategy: Optional[Strategy] = None
+    numberOfCandidates: Optional[int] = None
+
+
+class BacktestRequest(BaseModel):
+    windows: List[BacktestWindow] = Field(..., max_items=BACKTEST_MAX_WINDOWS)
+    ## at most SVC_BACKTEST_WORKERS, or one per core
+    workers: Optional[int] = Field(None, ge=1)
+    seed: Optional[int] = None
+    ## record the steps of every window under this results run
+    runId: Optional[str] = None
+
+
+class BacktestWindowResult(BaseModel):
+    firstSettlementPeriodStart: str
+    lastSettlementPeriodStart: str
+    strategy: Strategy
+    numberOfCandidates: int
+    steps: int = 0
+    submissions: int = 0
+    acceptedSubmissions: int = 0
+    offerVolumeAccepted: float = 0
+    bidVolumeAccepted: float = 0
+    revenue: float = 0
+    durationSeconds: float = 0
+    error: Optional[str] = None
+
+
+class BacktestReport(BaseModel):
+    windows: List[BacktestWindowResult]
+    workers: int
+    succeeded: int
+    failed: int
+    totalRevenue: float
+    meanRevenue: Optional[float]
+    durationSeconds: float
+
+
+class DailyResult(BaseModel):
+    strategy: Strategy
+    numberOfCandidates: int
+    day: str
+    assetId: str
+    steps: int
+    revenue: float
+    offerVolumeAccepted: float
+    bidVolumeAccepted: float
+
+
+class ChargeCurve(BaseModel):
+    strategy: Strategy
+    numberOfCandidates: int
+    assetId: str
+    simulationTimestamps: List[str]
+    chargeLevels: List[float]
@@ -0,0 +1,217 @@
+from datetime import datetime
+from os import getenv
+from typing import List, Optional
+
+import numpy as np
+
+from app.decisions import (
+    dayLength,
+    dayStarts,
+    dispatchDecisions,
+    greedyDayPrices,
+    stepDays,
+)
+from app.models import (
+    BatteryAsset,
+    RevenueDistribution,
+    RevenuePercentile,
+    Strategy,
+)
+from app.prefetch import PredictionPrefetcher
+from app.services import get_battery_state
+from app.strategies import (
+    OFFER_BID_VOLUME,
+    SIMULATION_TIMESTEP,
+    TIMESTEP_BEFORE_GATE_CLOSURE,
+    optimal_dispatch_policy,
+    optimal_dispatch_prices,
+)
+
+## scenarios drawing from the same random stream, so the draws of a scenario
+## for a given seed do not depend on how many scenarios are requested
+SCENARIOS_PER_STREAM = int(getenv("SVC_MONTE_CARLO_SCENARIOS_PER_STREAM", "1024"))
+MONTE_CARLO_SCENARIOS = int(getenv("SVC_MONTE_CARLO_SCENARIOS", "1000"))
+MONTE_CARLO_MAX_SCENARIOS = int(getenv("SVC_MONTE_CARLO_MAX_SCENARIOS", "100000"))
+REPORTED_PERCENTILES = [5.0, 25.0, 50.0, 75.0, 95.0]
+
+
+class ScenarioStreams:
+    """
+    Independent acceptance draws for every scenario, from one seeded NumPy
+    generator per block of `SCENARIOS_PER_STREAM` scenarios.
+    """
+
+    def __init__(self, numberOfScenarios: int, seed: Optional[int]):
+        seedSequence = np.random.SeedSequence(seed)
+        self.seed = int(seedSequence.entropy)
+        self.blockSizes = [
+            min(SCENARIOS_PER_STREAM, numberOfScenarios - start)
+            for start in range(0, numberOfScenarios, SCENARIOS_PER_STREAM)
+        ]
+        self.generators = [
+            np.random.default_rng(child)
+            for child in seedSequence.spawn(len(self.blockSizes))
+        ]
+
+    def accepted(self, acceptanceRate: float) -> np.ndarray:
+        """One acceptance outcome per scenario for the current step."""
+        return (
+            np.concatenate(
+                [
+                    generator.random(blockSize)
+                    for (generator, blockSize) in zip(self.generators, self.blockSizes)
+                ]
+            )
+            < acceptanceRate
+        )
+
+
+async def simulate_revenue_distribution(
+    *,
+    firstSettlementPeriodStart: datetime,
+    lastSettlementPeriodStart: datetime,
+    numberOfScenarios: int,
+    strategy: Strategy,
+    numberOfCandidates: int,
+    acceptanceRate: float,
+    asset: BatteryAsset,
+    seed: Optional[int] = None,
+) -> RevenueDistribution:
+    """
+    Run the strategy over the period for many acceptance scenarios at once.
+
+    Mirrors the decisions of `/strategy/` step by step, but keeps the battery
+    state of every scenario in arrays and replaces the grid operator with a
+    seeded acceptance draw, so no submissions or battery updates are sent to
+    the services. The starting state of `asset` is read once from the battery.
+    """
+    desiredNumberOfComputations = (
+        int(
+            (lastSettlementPeriodStart - firstSettlementPeriodStart)
+            / SIMULATION_TIMESTEP
+        )
+        + 1
+    )
+    timestamps: List[datetime] = [
+        firstSettlementPeriodStart + (SIMULATION_TIMESTEP * step)
+        for step in range(desiredNumberOfComputations)
+    ]
+
+    ## same read order as a /strategy/ run, the first read may seed the battery
+    await get_battery_state(firstSettlementPeriodStart, asset["assetId"])
+    initialState = await get_battery_state(
+        firstSettlementPeriodStart + TIMESTEP_BEFORE_GATE_CLOSURE, asset["assetId"]
+    )
+    maxCapacity = float(asset["maxCapacity"])
+    maxChargeCycle = float(asset["maxChargeCycle"])
+    maxDischargeCycle = float(asset["maxDischargeCycle"])
+
+    chargeLevel = np.full(
+        numberOfScenarios, float(initialState["chargeLevelAtPeriodStart"])
+    )
+    importedToday = np.full(
+        numberOfScenarios, float(initialState["sameDayImportTotal"])
+    )
+    exportedToday = np.full(
+        numberOfScenarios, float(initialState["sameDayExportTotal"])
+    )
+    revenue = np.zeros(numberOfScenarios)
+    offerVolumeAccepted = np.zeros(numberOfScenarios)
+    bidVolumeAccepted = np.zeros(numberOfScenarios)
+
+    streams = ScenarioStreams(numberOfScenarios, seed)
+
+    ## the same-day totals are reset when the settlement period starts a new day
+    startsSettlementDay = dayStarts(
+        stepDays(
+            firstSettlementPeriodStart, len(timestamps), TIMESTEP_BEFORE_GATE_CLOSURE
+        )
+    )
+    ## greedy candidates are picked on the first step of every day
+    startsDay = dayStarts(stepDays(firstSettlementPeriodStart, len(timestamps)))
+    startsDay[:1] = True
+
+    dayStep = 0
+    dayBidPrices = np.array([])
+    dayOfferPrices = np.array([])
+
+    predictionPrefetcher = PredictionPrefetcher(timestamps)
+    try:
+        for step, simulationTimestamp in enumerate(timestamps):
+            if startsSettlementDay[step]:
+                importedToday[:] = 0
+                exportedToday[:] = 0
+
+            predictionWindow, predictionRow = await predictionPrefetcher.get(step)
+            accepted = streams.accepted(acceptanceRate)
+
+            if strategy == Strategy.optimal:
+                bidPrices, offerPrices = optimal_dispatch_prices(
+                    optimal_dispatch_policy(
+                        predictionWindow=predictionWindow,
+                        predictionRow=predictionRow,
+                        simulationTimestamp=simulationTimestamp,
+                        asset=asset,
+                    ),
+                    chargeLevel,
+                    importedToday,
+                    exportedToday,
+                )
+            else:
+                if startsDay[step]:
+                    dayStep = step
+                    dayBidPrices, dayOfferPrices = greedyDayPrices(
+                        predictionWindow,
+                        predictionRow,
+                        dayLength(startsDay, step),
+                        numberOfCandidates,
+                    )
+                bidPrices = dayBidPrices[step - dayStep]
+                offerPrices = dayOfferPrices[step - dayStep]
+
+            ## an offer is preferred over a bid, as in /strategy/
+            discharges, charges = dispatchDecisions(
+                bidPrices=bidPrices,
+                offerPrices=offerPrices,
+                chargeLevel=chargeLevel,
+                importedToday=importedToday,
+                exportedToday=exportedToday,
+                maxCapacity=maxCapacity,
+                maxChargeCycle=maxChargeCycle,
+                maxDischargeCycle=maxDischargeCycle,
+            )
+            discharges &= accepted
+            charges &= accepted
+
+            chargeLevel += OFFER_BID_VOLUME * (charges.astype(float) - discharges)
+            exportedToday += OFFER_BID_VOLUME * discharges
+            importedToday += OFFER_BID_VOLUME * charges
+            offerVolumeAccepted += OFFER_BID_VOLUME * discharges
+            bidVolumeAccepted += OFFER_BID_VOLUME * charges
+            if discharges.any():
+                revenue += np.where(discharges, offerPrices * OFFER_BID_VOLUME, 0)
+            if charges.any():
+                revenue -= np.where(charges, bidPrices * OFFER_BID_VOLUME, 0)
+    finally:
+        predictionPrefetcher.cancel()
+
+    return RevenueDistribution(
+        assetId=asset["assetId"],
+        strategy=strategy,
+        scenarios=numberOfScenarios,
+        seed=streams.seed,
+        acceptanceRate=acceptanceRate,
+        meanRevenue=float(revenue.mean()),
+        standardDeviation=float(revenue.std()),
+        minimumRevenue=float(revenue.min()),
+        maximumRevenue=float(revenue.max()),
+        percentiles=[
+            RevenuePercentile(percentile=percentile, revenue=float(value))
+            for (percentile, value) in zip(
+                REPORTED_PERCENTILES, np.percentile(revenue, REPORTED_PERCENTILES)
+            )
+        ],
+        meanOfferVolumeAccepted=float(offerVolumeAccepted.mean()),
+        meanBidVolumeAccepted=float(bidVolumeAccepted.mean()),
+        meanFinalChargeLevel=float(chargeLevel.mean()),
+    )
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.selection import selectHighestK, selectLowestK
+
+
+class PredictionWindow:
+    """
+    Prediction vintages for a run of request times, as float arrays.
+
+    Row `i` is the vintage requested at `timesOfPredictionRequest[i]` and
+    column `j` the price predicted `leadTimeMinutes[j]` after it, NaN where
+    the market made no prediction.
+    """
+
+    def __init__(
+        self,
+        timesOfPredictionRequest: List[str],
+        leadTimeMinutes: List[int],
+        offerPrices: np.ndarray,
+        bidPrices: np.ndarray,
+    ):
+        self.timesOfPredictionRequest = timesOfPredictionRequest
+        self.leadTimeMinutes = leadTimeMinutes
+        self.offerPrices = offerPrices
+        self.bidPrices = bidPrices
+        ## parsed once, so steps are matched to rows without formatting dates
+        self.requestTimes = np.array(timesOfPredictionRequest, dtype="datetime64[s]")
+        self.requestOrder = np.argsort(self.requestTimes, kind="stable")
+        self.candidates: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def fromColumnar(cls, body: dict) -> "PredictionWindow":
+        """Build from the market service's columnar range response."""
+        numberOfLeads = len(body["leadTimeMinutes"])
+        return cls(
+            body["timesOfPredictionRequest"],
+            body["leadTimeMinutes"],
+            ## nulls become NaN when converted to a float array
+            np.array(body["offer_prices"], dtype=float).reshape(-1, numberOfLeads),
+            np.array(body["bid_prices"], dtype=float).reshape(-1, numberOfLeads),
+        )
+
+    def rowsAt(self, requestTimes: np.ndarray) -> np.ndarray:
+        """The rows of the vintages requested at `requestTimes`, -1 where none was."""
+        requestTimes = np.asarray(requestTimes, dtype="datetime64[s]")
+        if not len(self.requestTimes):
+            return np.full(requestTimes.shape, -1)
+        sortedTimes = self.requestTimes[self.requestOrder]
+        positions = np.searchsorted(sortedTimes, requestTimes).clip(
+            0, len(sortedTimes) - 1
+        )
+        return np.where(
+            sortedTimes[positions] == requestTimes, self.requestOrder[positions], -1
+        )
+
+    def lead(self, requestTime: datetime, predictionTime: datetime) -> Optional[int]:
+        """Column holding the price predicted at `requestTime` for `predictionTime`."""
+        leadTime = predictionTime - requestTime
+        if leadTime <= timedelta(0) or leadTime % timedelta(minutes=1):
+            return None
+        leadTimeMinutes = int(leadTime / timedelta(minutes=1))
+        ## lead times are evenly spaced, so the column is found arithmetically
+        column = leadTimeMinutes // self.leadTimeMinutes[0] - 1
+        if (
+            0 <= column < len(self.leadTimeMinutes)
+            and self.leadTimeMinutes[column] == leadTimeMinutes
+        ):
+            return column
+        return None
+
+    def columns(self, leadTimeMinutes: np.ndarray) -> np.ndarray:
+        """Columns of the prices predicted `leadTimeMinutes` ahead, -1 where none are."""
+        leadTimeMinutes = np.asarray(leadTimeMinutes)
+        columns = (leadTimeMinutes // self.leadTimeMinutes[0] - 1).astype(int)
+        inRange = (columns >= 0) & (columns < len(self.leadTimeMinutes))
+        columns = np.where(inRange, columns, 0)
+        return np.where(
+            inRange & (np.array(self.leadTimeMinutes)[columns] == leadTimeMinutes),
+            columns,
+            -1,
+        )
+
+    def selectCandidates(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Masks of the `k` lowest bids and `k` highest offers of every vintage.
+
+        Computed for the whole window in one pass and kept, so every step or
+        day boundary in the window only indexes into the result.
+        """
+        if k not in self.candidates:
+            self.candidates[k] = (
+                selectLowestK(self.bidPrices, k),
+                selectHighestK(self.offerPrices, k),
+            )
+        return self.candidates[k]
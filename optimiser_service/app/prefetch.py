@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime
+from os import getenv
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.predictions import PredictionWindow
+from app.services import get_market_predictions_for_range
+from app.utils import convertDateTimeToFormat
+
+## how many simulation steps of predictions are loaded by each range request
+PREDICTION_PREFETCH_DEPTH = int(getenv("SVC_PREDICTION_PREFETCH_DEPTH", "48"))
+
+
+class PredictionPrefetcher:
+    """
+    Pipelines market prediction fetches ahead of the simulation loop.
+
+    Predictions do not depend on the outcome of earlier steps, so they are
+    loaded in windows of `depth` steps with one range request each. While the
+    loop works through one window the next one is already in flight.
+    """
+
+    def __init__(
+        self, timestamps: List[datetime], depth: int = PREDICTION_PREFETCH_DEPTH
+    ):
+        self.timestamps = timestamps
+        self.stepTimes = np.array(timestamps, dtype="datetime64[s]")
+        self.depth = max(depth, 1)
+        self.windows: Dict[int, asyncio.Task] = {}
+        ## the row of every step of a window, found for all of them at once
+        self.rows: Dict[int, np.ndarray] = {}
+
+    def scheduleWindow(self, window: int):
+        firstStep = window * self.depth
+        if window in self.windows or firstStep >= len(self.timestamps):
+            return
+        lastStep = min(firstStep + self.depth, len(self.timestamps)) - 1
+        self.windows[window] = asyncio.ensure_future(
+            get_market_predictions_for_range(
+                self.timestamps[firstStep], self.timestamps[lastStep]
+            )
+        )
+
+    async def get(self, step: int) -> Tuple[PredictionWindow, int]:
+        """The window holding the predictions made at `step`, and their row in it."""
+        window = step // self.depth
+        self.scheduleWindow(window)
+        self.scheduleWindow(window + 1)
+        predictionWindow = await self.windows[window]
+        if window not in self.rows:
+            self.rows[window] = predictionWindow.rowsAt(
+                self.stepTimes[window * self.depth : (window + 1) * self.depth]
+            )
+        row = int(self.rows[window][step % self.depth])
+
+        if step % self.depth == self.depth - 1:
+            self.windows.pop(window)
+            self.rows.pop(window)
+
+        if row < 0:
+            raise Exception(
+                f"Failed to get market predictions, cause: none made at {convertDateTimeToFormat(self.timestamps[step])}"
+            )
+        return predictionWindow, row
+
+    def cancel(self):
+        for task in self.windows.values():
+            task.cancel()
+        self.windows = {}
+        self.rows = {}
@@ -0,0 +1,201 @@
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from os import getenv, makedirs, path
+from random import random
+from threading import Event, Thread, get_ident
+from time import perf_counter
+from types import CodeType, FrameType
+from typing import Dict, Iterator, Optional
+
+from loguru import logger
+
+from app.logwriter import log_record
+
+## profile strategy runs without being asked to, e.g. in staging
+PROFILE_STRATEGY_RUNS = getenv("SVC_PROFILE_STRATEGY_RUNS", "false").lower() == "true"
+## the share of those runs that are profiled
+PROFILE_SAMPLE_RATE = float(getenv("SVC_PROFILE_SAMPLE_RATE", "1"))
+PROFILE_INTERVAL_SECONDS = float(getenv("SVC_PROFILE_INTERVAL_SECONDS", "0.01"))
+## the share of a run's time the sampler may take, it samples less often to stay under it
+PROFILE_MAX_OVERHEAD = float(getenv("SVC_PROFILE_MAX_OVERHEAD", "0.02"))
+PROFILE_MAX_SAMPLES = int(getenv("SVC_PROFILE_MAX_SAMPLES", "100000"))
+PROFILE_MAX_DEPTH = int(getenv("SVC_PROFILE_MAX_DEPTH", "64"))
+PROFILE_LOCATION = getenv(
+    "SVC_PROFILE_LOCATION", path.join(getenv("SVC_LOG_LOCATION", "./logs"), "profiles")
+)
+
+
+class StrategyProfiler:
+    """
+    Samples the stack of the event loop thread while a strategy run is on it,
+    and counts the samples by collapsed stack.
+
+    Only the frames from `rootFrame` down are kept, so samples of other
+    requests on the loop are left out. While the run is off the loop's stack,
+    waiting or in tasks of its own, the sample is counted against the service
+    calls it has in flight instead, so the time spent on each service shows
+    next to the time computing.
+
+    The sampler times itself, and samples less often whenever that would take
+    more than `maxOverhead` of the run. It stops after `maxSamples`.
+    """
+
+    def __init__(
+        self,
+        rootFrame: FrameType,
+        interval: float = PROFILE_INTERVAL_SECONDS,
+        maxOverhead: float = PROFILE_MAX_OVERHEAD,
+        maxSamples: int = PROFILE_MAX_SAMPLES,
+        maxDepth: int = PROFILE_MAX_DEPTH,
+    ):
+        self.rootFrame = rootFrame
+        self.threadId = get_ident()
+        self.interval = interval
+        self.maxOverhead = max(maxOverhead, 1e-6)
+        self.maxSamples = maxSamples
+        self.maxDepth = maxDepth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.otherSamples = 0
+        self.samplingSeconds = 0.0
+        self.truncated = False
+        self.inFlightCalls: Counter = Counter()
+        self.labels: Dict[CodeType, str] = {}
+        self.stopped = Event()
+        self.startTime = perf_counter()
+        self.thread = Thread(target=self.run, name="strategy-profiler", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        interval = self.interval
+        while not self.stopped.wait(interval):
+            startTime = perf_counter()
+            self.sample()
+            samplingSeconds = perf_counter() - startTime
+            self.samplingSeconds += samplingSeconds
+            interval = max(self.interval, samplingSeconds / self.maxOverhead)
+            if self.samples >= self.maxSamples:
+                self.truncated = True
+                return
+
+    def sample(self):
+        frame = sys._current_frames().get(self.threadId)
+        stack = []
+        while frame is not None and frame is not self.rootFrame:
+            stack.append(frame)
+            frame = frame.f_back
+        if frame is None:
+            ## the loop is waiting, or running something other than the run's stack
+            inFlightCalls = sorted(
+                call for (call, count) in dict(self.inFlightCalls).items() if count
+            )
+            if not inFlightCalls:
+                self.otherSamples += 1
+                return
+            stack = [f"[service calls {' + '.join(inFlightCalls)}]"]
+        else:
+            stack = [self.label(frame.f_code) for frame in stack[-self.maxDepth :]]
+        self.stacks[
+            ";".join([self.label(self.rootFrame.f_code), *reversed(stack)])
+        ] += 1
+        self.samples += 1
+
+    def label(self, code: CodeType) -> str:
+        label = self.labels.get(code)
+        if label is None:
+            fileName = path.join(
+                path.basename(path.dirname(code.co_filename)),
+                path.basename(code.co_filename),
+            )
+            label = self.labels[code] = f"{code.co_name} ({fileName})"
+        return label
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.seconds = perf_counter() - self.startTime
+
+    def write(self, fileName: str):
+        """Write the samples in the collapsed stack format flame graph tools read."""
+        makedirs(path.dirname(fileName), exist_ok=True)
+        with open(fileName, "w") as write:
+            for stack, count in self.stacks.most_common():
+                write.write(f"{stack} {count}\n")
+
+
+## the profiler of the strategy run the current task belongs to
+currentProfiler: ContextVar[Optional[StrategyProfiler]] = ContextVar(
+    "currentProfiler", default=None
+)
+
+
+def should_profile(profile: Optional[bool]) -> bool:
+    """Whether to profile a run, as asked or else as configured."""
+    if profile is not None:
+        return profile
+    return PROFILE_STRATEGY_RUNS and random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profiled_call(call: str) -> Iterator[None]:
+    """Count the block as a call in flight for the profiler of the current run."""
+    profiler = currentProfiler.get()
+    if profiler is None:
+        yield
+        return
+    profiler.inFlightCalls[call] += 1
+    try:
+        yield
+    finally:
+        profiler.inFlightCalls[call] -= 1
+
+
+def profileFileName(runId: str, traceId: Optional[str]) -> str:
+    return path.join(
+        PROFILE_LOCATION,
+        f"strategy-{runId}-{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+        f"-{(traceId or 'untraced')[:8]}.folded",
+    )
+
+
+@contextmanager
+def profiled_run(
+    enabled: bool, runId: str, rootFrame: FrameType, traceId: Optional[str]
+) -> Iterator[Optional[StrategyProfiler]]:
+    """
+    Profile the block, a strategy run whose stack starts at `rootFrame`, if
+    `enabled`. The collapsed stacks are written to PROFILE_LOCATION when it
+    ends and the file is logged.
+    """
+    if not enabled:
+        yield None
+        return
+    profiler = StrategyProfiler(rootFrame)
+    token = currentProfiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        currentProfiler.reset(token)
+        profiler.stop()
+        fileName = profileFileName(runId, traceId)
+        try:
+            profiler.write(fileName)
+        except OSError as e:
+            ## a profile that is not written must not hide how the run ended
+            logger.error(f"profile of run {runId} not written, cause: {str(e)}")
+            fileName = None
+        log_record(
+            "INFO",
+            "strategy run profile",
+            runId=runId,
+            traceId=traceId,
+            fileName=fileName,
+            samples=profiler.samples,
+            otherSamples=profiler.otherSamples,
+            seconds=profiler.seconds,
+            samplingSeconds=profiler.samplingSeconds,
+            truncated=profiler.truncated,
+        )
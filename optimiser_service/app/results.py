@@ -0,0 +1,324 @@
+from collections import defaultdict
+from datetime import date
+from json import dump, load
+from os import getenv, listdir, makedirs, path, replace
+from shutil import rmtree
+from time import time_ns
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+import numpy as np
+
+from app.models import (
+    BidOfferPair,
+    ChargeCurve,
+    DailyResult,
+    StepOutcome,
+    Strategy,
+)
+
+## record /strategy/ runs that do not ask to be recorded
+RECORD_RESULTS = getenv("SVC_RECORD_RESULTS", "false").lower() == "true"
+RESULTS_LOCATION = getenv("SVC_RESULTS_LOCATION", "./results")
+MANIFEST_FILENAME = "manifest.json"
+
+## the per-step fields of `log_optimiser_current_state`, one file per column
+FLOAT_COLUMNS = [
+    "batteryStateOfCharge",
+    "totalEnergyImportedFromStartToDate",
+    "totalEnergyExportedFromStartToDate",
+    "totalEnergyImportedOnCurrentDay",
+    "totalEnergyExportedOnCurrentDay",
+    "bidPricePrediction",
+    "offerPricePrediction",
+    "offerPrice",
+    "offerVolume",
+    "bidPrice",
+    "bidVolume",
+]
+BOOL_COLUMNS = ["bidAccepted", "offerAccepted"]
+COLUMN_TYPES = {
+    "assetId": str,
+    "simulationTimestamp": "datetime64[s]",
+    **{column: float for column in FLOAT_COLUMNS},
+    **{column: bool for column in BOOL_COLUMNS},
+}
+## columns of the pass a step was recorded by, read from the part manifests
+PASS_COLUMN_TYPES = {"strategy": str, "numberOfCandidates": int}
+
+
+def partLocation(location: str, runId: str, day: str, part: str) -> str:
+    return path.join(location, runId, day, part)
+
+
+class ResultsRecorder:
+    """
+    Collects the outcomes of a run and writes them as columns, one part per
+    day of steps.
+
+    A part is a directory of .npy files, one per column, under
+    `<location>/<runId>/<day>/`. Its manifest is written last, so a part that
+    is being written is never read. Every pass over a day adds a part and
+    nothing is rewritten.
+    """
+
+    def __init__(
+        self,
+        runId: str,
+        strategy: Strategy,
+        numberOfCandidates: int,
+        location: str = RESULTS_LOCATION,
+    ):
+        self.runId = runId
+        self.strategy = strategy
+        self.numberOfCandidates = numberOfCandidates
+        self.location = location
+        self.day: Optional[date] = None
+        self.rows: Dict[str, list] = defaultdict(list)
+        self.finishedDays: List[tuple] = []
+
+    def add(self, outcome: StepOutcome, bidOfferPair: BidOfferPair):
+        day = outcome["simulationTimestamp"].date()
+        if day != self.day and self.rows:
+            self.finishedDays.append((self.day, self.rows))
+            self.rows = defaultdict(list)
+        self.day = day
+
+        batteryState = outcome["batteryState"]
+        for column, value in (
+            ("assetId", outcome["assetId"]),
+            ("simulationTimestamp", outcome["simulationTimestamp"]),
+            ("batteryStateOfCharge", batteryState["chargeLevelAtPeriodStart"]),
+            (
+                "totalEnergyImportedFromStartToDate",
+                batteryState["cumulativeImportTotal"],
+            ),
+            (
+                "totalEnergyExportedFromStartToDate",
+                batteryState["cumulativeExportTotal"],
+            ),
+            ("totalEnergyImportedOnCurrentDay", batteryState["sameDayImportTotal"]),
+            ("totalEnergyExportedOnCurrentDay", batteryState["sameDayExportTotal"]),
+            ("bidPricePrediction", outcome["bidPricePrediction"]),
+            ("offerPricePrediction", outcome["offerPricePrediction"]),
+            ("offerPrice", bidOfferPair.offerPrice),
+            ("offerVolume", bidOfferPair.offerVolume),
+            ("bidPrice", bidOfferPair.bidPrice),
+            ("bidVolume", bidOfferPair.bidVolume),
+            ("bidAccepted", outcome["bidAccepted"]),
+            ("offerAccepted", outcome["offerAccepted"]),
+        ):
+            self.rows[column].append(value)
+
+    def flush(self, final: bool = False):
+        """Write the days that are complete, and the current one too if `final`."""
+        if final and self.rows:
+            self.finishedDays.append((self.day, self.rows))
+            self.rows = defaultdict(list)
+        finishedDays, self.finishedDays = self.finishedDays, []
+        for day, rows in finishedDays:
+            self.writePart(day, rows)
+
+    def writePart(self, day: date, rows: Dict[str, list]):
+        ## named by the time it was written, so parts sort oldest first
+        part = f"{time_ns():020d}-{uuid4().hex[:8]}"
+        location = partLocation(self.location, self.runId, day.isoformat(), part)
+        makedirs(location)
+        for column, columnType in COLUMN_TYPES.items():
+            np.save(
+                path.join(location, f"{column}.npy"),
+                np.array(rows[column], dtype=columnType),
+            )
+
+        temporaryFileName = path.join(location, f"{MANIFEST_FILENAME}.tmp")
+        with open(temporaryFileName, "w") as write:
+            dump(
+                {
+                    "runId": self.runId,
+                    "day": day.isoformat(),
+                    "strategy": self.strategy.value,
+                    "numberOfCandidates": self.numberOfCandidates,
+                    "rows": len(rows["assetId"]),
+                    "columns": list(COLUMN_TYPES),
+                },
+                write,
+            )
+        replace(temporaryFileName, path.join(location, MANIFEST_FILENAME))
+
+
+def delete_results(runId: str, location: str = RESULTS_LOCATION) -> bool:
+    """Delete every recorded part of a run, False if it has none."""
+    runLocation = path.join(location, runId)
+    if not path.isdir(runLocation):
+        return False
+    rmtree(runLocation)
+    return True
+
+
+def readColumns(
+    runId: str,
+    columns: List[str],
+    *,
+    firstDay: Optional[str] = None,
+    lastDay: Optional[str] = None,
+    strategy: Optional[Strategy] = None,
+    numberOfCandidates: Optional[int] = None,
+    location: str = RESULTS_LOCATION,
+) -> Dict[str, np.ndarray]:
+    """
+    The recorded values of `columns` for a run, over the days from `firstDay`
+    to `lastDay` inclusive, ordered by time. `strategy` and
+    `numberOfCandidates` can be asked for as columns too.
+
+    Only the day directories in range are listed and only the requested
+    columns are read, memory-mapped. Where a step of an asset was recorded by
+    several passes with the same strategy, the latest pass is kept.
+    """
+    runLocation = path.join(location, runId)
+    days = sorted(
+        day
+        for day in (listdir(runLocation) if path.isdir(runLocation) else [])
+        if (firstDay is None or day >= firstDay) and (lastDay is None or day <= lastDay)
+    )
+
+    keyColumns = ["assetId", "simulationTimestamp"]
+    parts = defaultdict(list)
+    for day in days:
+        for part in sorted(listdir(path.join(runLocation, day))):
+            manifestFileName = path.join(runLocation, day, part, MANIFEST_FILENAME)
+            if not path.isfile(manifestFileName):
+                continue
+            with open(manifestFileName, "r") as read:
+                manifest = load(read)
+            if (strategy is not None and manifest["strategy"] != strategy.value) or (
+                numberOfCandidates is not None
+                and manifest["numberOfCandidates"] != numberOfCandidates
+            ):
+                continue
+            for column in dict.fromkeys(keyColumns + columns):
+                if column in PASS_COLUMN_TYPES:
+                    continue
+                parts[column].append(
+                    np.load(
+                        path.join(runLocation, day, part, f"{column}.npy"),
+                        mmap_mode="r",
+                    )
+                )
+            for column in PASS_COLUMN_TYPES:
+                parts[column].append(np.full(manifest["rows"], manifest[column]))
+
+    if not parts:
+        return {
+            column: np.array([], dtype={**COLUMN_TYPES, **PASS_COLUMN_TYPES}[column])
+            for column in columns
+        }
+
+    values = {column: np.concatenate(arrays) for (column, arrays) in parts.items()}
+    ## a later pass over the same step supersedes earlier ones of the same strategy
+    keys = np.rec.fromarrays(
+        [
+            values["strategy"],
+            values["numberOfCandidates"],
+            values["assetId"],
+            values["simulationTimestamp"].astype("int64"),
+        ]
+    )
+    _, lastIndices = np.unique(keys[::-1], return_index=True)
+    kept = np.sort(len(keys) - 1 - lastIndices)
+    order = kept[np.argsort(values["simulationTimestamp"][kept], kind="stable")]
+    return {column: values[column][order] for column in columns}
+
+
+def daily_results(runId: str, **filters) -> List[DailyResult]:
+    """
+    Revenue and accepted volumes of every asset on every recorded day, for
+    each strategy and number of candidates it was run with.
+    """
+    columns = readColumns(
+        runId,
+        [
+            "strategy",
+            "numberOfCandidates",
+            "assetId",
+            "simulationTimestamp",
+            "offerPrice",
+            "offerVolume",
+            "bidPrice",
+            "bidVolume",
+            "bidAccepted",
+            "offerAccepted",
+        ],
+        **filters,
+    )
+    offerVolumeAccepted = np.where(columns["offerAccepted"], columns["offerVolume"], 0)
+    bidVolumeAccepted = np.where(columns["bidAccepted"], columns["bidVolume"], 0)
+    revenue = (
+        offerVolumeAccepted * columns["offerPrice"]
+        - bidVolumeAccepted * columns["bidPrice"]
+    )
+
+    groups, groupOfRow = np.unique(
+        np.rec.fromarrays(
+            [
+                columns["strategy"],
+                columns["numberOfCandidates"],
+                columns["simulationTimestamp"].astype("datetime64[D]"),
+                columns["assetId"],
+            ]
+        ),
+        return_inverse=True,
+    )
+    steps = np.bincount(groupOfRow, minlength=len(groups))
+    revenues = np.bincount(groupOfRow, revenue, minlength=len(groups))
+    offerVolumes = np.bincount(groupOfRow, offerVolumeAccepted, minlength=len(groups))
+    bidVolumes = np.bincount(groupOfRow, bidVolumeAccepted, minlength=len(groups))
+    return [
+        DailyResult(
+            strategy=str(strategy),
+            numberOfCandidates=int(numberOfCandidates),
+            day=str(day),
+            assetId=str(assetId),
+            steps=int(steps[group]),
+            revenue=float(revenues[group]),
+            offerVolumeAccepted=float(offerVolumes[group]),
+            bidVolumeAccepted=float(bidVolumes[group]),
+        )
+        for group, (strategy, numberOfCandidates, day, assetId) in enumerate(groups)
+    ]
+
+
+def charge_curves(runId: str, **filters) -> List[ChargeCurve]:
+    """
+    The charge level of every asset at each recorded step, for each strategy
+    and number of candidates it was run with.
+    """
+    columns = readColumns(
+        runId,
+        [
+            "strategy",
+            "numberOfCandidates",
+            "assetId",
+            "simulationTimestamp",
+            "batteryStateOfCharge",
+        ],
+        **filters,
+    )
+    groups, groupOfRow = np.unique(
+        np.rec.fromarrays(
+            [columns["strategy"], columns["numberOfCandidates"], columns["assetId"]]
+        ),
+        return_inverse=True,
+    )
+    return [
+        ChargeCurve(
+            strategy=str(strategy),
+            numberOfCandidates=int(numberOfCandidates),
+            assetId=str(assetId),
+            simulationTimestamps=[
+                str(timestamp)
+                for timestamp in columns["simulationTimestamp"][groupOfRow == group]
+            ],
+            chargeLevels=columns["batteryStateOfCharge"][groupOfRow == group].tolist(),
+        )
+        for group, (strategy, numberOfCandidates, assetId) in enumerate(groups)
+    ]
@@ -0,0 +1,30 @@
+import numpy as np
+
+
+def selectLowestK(prices: np.ndarray, k: int) -> np.ndarray:
+    """
+    Mark the `k` lowest prices along the last axis.
+
+    Works on a single vintage of predictions or on a whole window of them at
+    once, returning a boolean mask of the same shape. Missing (NaN) prices are
+    never selected, so a row with fewer than `k` prices has all of them marked.
+    """
+    prices = np.asarray(prices, dtype=float)
+    mask = np.zeros(prices.shape, dtype=bool)
+    numberOfPrices = prices.shape[-1] if prices.ndim else 0
+    if k <= 0 or numberOfPrices == 0:
+        return mask
+
+    isMissing = np.isnan(prices)
+    if k >= numberOfPrices:
+        return ~isMissing
+
+    ranked = np.where(isMissing, np.inf, prices)
+    lowestIndices = np.argpartition(ranked, k - 1, axis=-1)[..., :k]
+    np.put_along_axis(mask, lowestIndices, True, axis=-1)
+    return mask & ~isMissing
+
+
+def selectHighestK(prices: np.ndarray, k: int) -> np.ndarray:
+    """Mark the `k` highest prices along the last axis, see `selectLowestK`."""
+    return selectLowestK(-np.asarray(prices, dtype=float), k)
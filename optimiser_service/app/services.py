@@ -1,132 +1,108 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from decimal import Decimal
-import json
-from os import getenv
-from typing import Dict, TypedDict
-from pydantic.main import BaseModel
-import requests
-from app.models import BidOfferPair
-
-from app.utils import convertDateTimeToFormat
-from loguru import logger
-
-MARKET_SERVICE_HOST_ADDRESS = getenv("SVC_MARKET_HOST", "http://localhost:5002")
-BATTERY_SERVICE_HOST_ADDRESS = getenv("SVC_BATTERY_HOST", "http://localhost:5003")
-GRID_OPERATOR_HOST_ADDRESS = getenv(
-    "SVC_MOCK_GRID_OPERATOR_HOST", "http://localhost:5001"
+from typing import ContextManager, Iterator, List
+
+from app.backends import ServiceBackend, create_backend
+from app.metrics import timed_call
+from app.models import (
+    DEFAULT_ASSET_ID,
+    BatteryAsset,
+    BatteryState,
+    BatteryStateTransition,
+    BidOfferPair,
+    BidOfferPairSubmissionResult,
 )
+from app.predictions import PredictionWindow
+from app.utils import convertDateTimeToFormat
 
+## selected with SVC_BACKEND_MODE, "http" (default) or "embedded"
+backend: ServiceBackend = create_backend()
 
-class MarketPredictions(TypedDict):
-    offer_prices: Dict[str, Decimal]
-    bid_prices: Dict[str, Decimal]
-
-
-class BatteryState(TypedDict):
-    settlementPeriodStartTime: str
-    chargeLevelAtPeriodStart: Decimal
-    sameDayImportTotal: Decimal
-    sameDayExportTotal: Decimal
-    cumulativeImportTotal: Decimal
-    cumulativeExportTotal: Decimal
-
-
-class BidOfferPairSubmissionResult(TypedDict):
-    submissionTime: str
-    settlementPeriodStartTime: str
-    offerPrice: Decimal
-    offerVolume: Decimal
-    bidPrice: Decimal
-    bidVolume: Decimal
-    accepted: bool
-
-
-class ChargeRequest(BaseModel):
-    settlementPeriodStartTime: str
-    bidVolume: Decimal
-
-
-class DischargeRequest(BaseModel):
-    settlementPeriodStartTime: str
-    offerVolume: Decimal
-
-
-JSON_HEADERS = {"Content-Type": "application/json"}
-
-
-class DecimalCompatibleEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return obj.to_eng_string()
-        # Let the base class default method raise the TypeError
-        return json.JSONEncoder.default(self, obj)
-
+## the backend the current task talks to, so concurrent runs can each use their own
+activeBackend: ContextVar[ServiceBackend] = ContextVar("activeBackend", default=backend)
 
-def get_next_48_market_predictions(dateTime: datetime) -> MarketPredictions:
-    response = requests.get(
-        f"{MARKET_SERVICE_HOST_ADDRESS}/predictions",
-        params={"timeOfPredictionRequest": convertDateTimeToFormat(dateTime)},
-    )
 
+@contextmanager
+def use_backend(runBackend: ServiceBackend) -> Iterator[ServiceBackend]:
+    """Route the service calls made inside the block to `runBackend`."""
+    token = activeBackend.set(runBackend)
     try:
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        raise Exception(f"Failed to get market predictions, cause: {str(e)}")
-
-
-def get_battery_state(dateTime: datetime) -> BatteryState:
-    response = requests.get(
-        f"{BATTERY_SERVICE_HOST_ADDRESS}/state",
-        params={"settlementPeriodStartTime": convertDateTimeToFormat(dateTime)},
+        yield runBackend
+    finally:
+        activeBackend.reset(token)
+
+
+def use_run(runId: str) -> ContextManager[ServiceBackend]:
+    """Address the batteries of the battery service run `runId` inside the block."""
+    return use_backend(activeBackend.get().for_run(runId))
+
+
+async def get_market_predictions_for_range(
+    firstDateTime: datetime, lastDateTime: datetime
+) -> PredictionWindow:
+    with timed_call("market_range"):
+        return await activeBackend.get().get_market_predictions_for_range(
+            firstDateTime, lastDateTime
+        )
+
+
+async def get_battery_assets() -> List[BatteryAsset]:
+    with timed_call("battery_assets"):
+        return await activeBackend.get().get_battery_assets()
+
+
+async def get_battery_state(
+    dateTime: datetime, assetId: str = DEFAULT_ASSET_ID
+) -> BatteryState:
+    with timed_call("battery_state"):
+        return await activeBackend.get().get_battery_state(dateTime, assetId)
+
+
+async def apply_battery_transitions(
+    transitions: List[BatteryStateTransition],
+) -> List[BatteryState]:
+    ## reads are told apart from the writes that settle accepted pairs
+    reads = all(transition.action == "read" for transition in transitions)
+    with timed_call("battery_read" if reads else "battery_write"):
+        return await activeBackend.get().apply_battery_transitions(transitions)
+
+
+async def get_fleet_battery_states(
+    dateTimes: List[datetime], assetIds: List[str]
+) -> List[List[BatteryState]]:
+    """
+    The states of every asset at each time, read with one call. Each asset's
+    times are read in order.
+    """
+    states = await apply_battery_transitions(
+        [
+            BatteryStateTransition(
+                settlementPeriodStartTime=convertDateTimeToFormat(dateTime),
+                assetId=assetId,
+            )
+            for assetId in assetIds
+            for dateTime in dateTimes
+        ]
     )
+    return [
+        states[index : index + len(dateTimes)]
+        for index in range(0, len(states), len(dateTimes))
+    ]
 
-    try:
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        raise Exception(f"Failed to get battery state, cause: {str(e)}")
-
-
-def submit_bid_offer_pair(bidOfferPair: BidOfferPair) -> BidOfferPairSubmissionResult:
-    logger.info(f"submitting bid offer: {bidOfferPair}")
-    response = requests.post(
-        f"{GRID_OPERATOR_HOST_ADDRESS}/submissions",
-        headers=JSON_HEADERS,
-        data=json.dumps(bidOfferPair.dict(), cls=DecimalCompatibleEncoder),
-    )
 
-    try:
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        raise Exception(f"Failed to submit bid-offer pair, cause: {str(e)}")
-
-
-## TODO Add calls for charge and discharge
-def charge_battery(chargeRequest: ChargeRequest) -> BatteryState:
-    response = requests.post(
-        f"{BATTERY_SERVICE_HOST_ADDRESS}/charge",
-        headers=JSON_HEADERS,
-        data=json.dumps(chargeRequest.dict(), cls=DecimalCompatibleEncoder),
-    )
+async def reset_run() -> None:
+    """Start every battery of the current run afresh."""
+    with timed_call("battery_reset"):
+        await activeBackend.get().reset_run()
 
-    try:
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        raise Exception(f"Failed to charge battery, cause: {str(e)}")
 
+async def submit_bid_offer_pair(
+    bidOfferPair: BidOfferPair,
+) -> BidOfferPairSubmissionResult:
+    with timed_call("grid_submission"):
+        return await activeBackend.get().submit_bid_offer_pair(bidOfferPair)
 
-def discharge_battery(dischargeRequest: DischargeRequest) -> BatteryState:
-    response = requests.post(
-        f"{BATTERY_SERVICE_HOST_ADDRESS}/discharge",
-        headers=JSON_HEADERS,
-        data=json.dumps(dischargeRequest.dict(), cls=DecimalCompatibleEncoder),
-    )
 
-    try:
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        raise Exception(f"Failed to discharge battery, cause: {str(e)}")
+async def close_backend() -> None:
+    await backend.aclose()
@@ -0,0 +1,314 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+
+from app.models import (
+    DEFAULT_ASSET_ID,
+    BatteryAsset,
+    BatteryStateTransition,
+    BidOfferPair,
+    StepOutcome,
+    Strategy,
+)
+from app.decisions import (
+    GATE_CLOSURE_MINUTES,
+    assetLimits,
+    dayLength,
+    dayStarts,
+    dispatchDecisions,
+    greedyDayPrices,
+    limitGroups,
+    stateArrays,
+    stepDays,
+)
+from app.metrics import step_span
+from app.prefetch import PredictionPrefetcher
+from app.services import (
+    apply_battery_transitions,
+    get_battery_assets,
+    get_fleet_battery_states,
+    submit_bid_offer_pair,
+)
+from app.strategies import (
+    OFFER_BID_VOLUME,
+    SIMULATION_TIMESTEP,
+    TIMESTEP_BEFORE_GATE_CLOSURE,
+    optimal_dispatch_policy,
+    optimal_dispatch_prices,
+)
+from app.utils import convertDateTimeToFormat
+
+
+def evaluate_bid_offer_pair_at_time(
+    simulationTimeStamp: datetime,
+    offerPrice=Decimal(9999),
+    offerVolume=Decimal(0),
+    bidVolume=Decimal(0),
+    bidPrice=Decimal(-9999),
+    assetId: str = DEFAULT_ASSET_ID,
+) -> BidOfferPair:
+    bidOfferPair = BidOfferPair(
+        submissionTime=convertDateTimeToFormat(simulationTimeStamp),
+        settlementPeriodStartTime=convertDateTimeToFormat(
+            simulationTimeStamp + TIMESTEP_BEFORE_GATE_CLOSURE
+        ),
+        offerPrice=offerPrice,
+        offerVolume=offerVolume,
+        bidVolume=bidVolume,
+        bidPrice=bidPrice,
+        assetId=assetId,
+    )
+    return bidOfferPair
+
+
+def bid_offer_pair_of(outcome: StepOutcome) -> BidOfferPair:
+    """The pair submitted at the step of `outcome`, or the idle pair it stands for."""
+    return outcome["submittedBidOfferPair"] or evaluate_bid_offer_pair_at_time(
+        simulationTimeStamp=outcome["simulationTimestamp"],
+        assetId=outcome["assetId"],
+    )
+
+
+async def select_assets(assetIds: Optional[List[str]] = None) -> List[BatteryAsset]:
+    """
+    The assets of the battery fleet with the given IDs, only the default one
+    when none are given. Raises LookupError for an ID that is not in the fleet.
+    """
+    fleet = {asset["assetId"]: asset for asset in await get_battery_assets()}
+    unknownAssetIds = [
+        assetId for assetId in (assetIds or [DEFAULT_ASSET_ID]) if assetId not in fleet
+    ]
+    if unknownAssetIds:
+        raise LookupError(f"Unknown battery assets: {', '.join(unknownAssetIds)}")
+    return [fleet[assetId] for assetId in dict.fromkeys(assetIds or [DEFAULT_ASSET_ID])]
+
+
+async def run_strategy(
+    firstSettlementPeriodStart: datetime,
+    lastSettlementPeriodStart: datetime,
+    *,
+    numberOfCandidates: int,
+    strategy: Strategy,
+    assets: Optional[List[BatteryAsset]] = None,
+) -> List[StepOutcome]:
+    """Run the whole period, see `iterate_strategy`, and return every outcome."""
+    return [
+        outcome
+        async for stepOutcomes in iterate_strategy(
+            firstSettlementPeriodStart,
+            lastSettlementPeriodStart,
+            numberOfCandidates=numberOfCandidates,
+            strategy=strategy,
+            assets=assets,
+        )
+        for outcome in stepOutcomes
+    ]
+
+
+async def iterate_strategy(
+    firstSettlementPeriodStart: datetime,
+    lastSettlementPeriodStart: datetime,
+    *,
+    numberOfCandidates: int,
+    strategy: Strategy,
+    assets: Optional[List[BatteryAsset]] = None,
+) -> AsyncIterator[List[StepOutcome]]:
+    """
+    Step through the period against the services, submitting and settling a
+    bid offer pair for every asset at every step, and yield what happened to
+    each asset as soon as its step is settled.
+
+    All assets share one pass: their states are read with one call per step,
+    their pairs are submitted concurrently and accepted ones are settled with
+    one call. Without `assets` only the default battery is run. Closing the
+    iterator early stops the run after the step it is in.
+    """
+    assets = assets or await select_assets()
+    assetIds = [asset["assetId"] for asset in assets]
+
+    desiredNumberOfComputations = (
+        int(
+            (lastSettlementPeriodStart - firstSettlementPeriodStart)
+            / SIMULATION_TIMESTEP
+        )
+        + 1
+    )
+
+    timestamps = [
+        firstSettlementPeriodStart + (SIMULATION_TIMESTEP * step)
+        for step in range(desiredNumberOfComputations)
+    ]
+    ## greedy candidates are picked on the first step of every day
+    startsDay = dayStarts(stepDays(firstSettlementPeriodStart, len(timestamps)))
+    startsDay[:1] = True
+    limits = assetLimits(assets)
+    groups = limitGroups(assets)
+
+    idle = np.full(len(assets), False)
+
+    dayStep = 0
+    dayBidPrices = np.array([])
+    dayOfferPrices = np.array([])
+    dayHasCandidate = np.array([])
+    settlementPeriodWindow = None
+    settlementPeriodLead = -1
+
+    predictionPrefetcher = PredictionPrefetcher(timestamps)
+
+    try:
+        for step, simulationTimestamp in enumerate(timestamps):
+            with step_span(simulationTimestamp):
+                settlementPeriodDateTime = (
+                    simulationTimestamp + TIMESTEP_BEFORE_GATE_CLOSURE
+                )
+
+                ## both states of every asset come from one batch read, applied in order
+                ## so the first read of a run can seed a battery before the second one
+                fleetStates, (predictionWindow, predictionRow) = await asyncio.gather(
+                    get_fleet_battery_states(
+                        [simulationTimestamp, settlementPeriodDateTime], assetIds
+                    ),
+                    predictionPrefetcher.get(step),
+                )
+
+                if strategy == Strategy.greedy:
+                    if startsDay[step]:
+
+                        ## as there is no volume demand prediction along with offers and bids
+                        ## it is assumed that any charge/discharge will be for a volume of 5MWh
+                        ## this implies a limit of 4 charges and 4 discharges.
+
+                        ## an 80% acceptance also means at least 5 possible bids/offers need to be generated.
+
+                        dayStep = step
+                        dayBidPrices, dayOfferPrices = greedyDayPrices(
+                            predictionWindow,
+                            predictionRow,
+                            dayLength(startsDay, step),
+                            numberOfCandidates,
+                        )
+                        dayHasCandidate = ~(
+                            np.isnan(dayBidPrices) & np.isnan(dayOfferPrices)
+                        )
+                    bidPrices = dayBidPrices[step - dayStep]
+                    offerPrices = dayOfferPrices[step - dayStep]
+
+                ## most steps of a greedy day have no candidate and every asset idles
+                if strategy == Strategy.greedy and not dayHasCandidate[step - dayStep]:
+                    discharges = charges = idle
+                else:
+                    chargeLevel, importedToday, exportedToday = stateArrays(
+                        [batteryState for (_, batteryState) in fleetStates]
+                    )
+                    if strategy == Strategy.optimal:
+                        bidPrices = np.full(len(assets), np.nan)
+                        offerPrices = np.full(len(assets), np.nan)
+                        ## assets with the same limits share one dispatch policy
+                        for indices in groups.values():
+                            (
+                                bidPrices[indices],
+                                offerPrices[indices],
+                            ) = optimal_dispatch_prices(
+                                optimal_dispatch_policy(
+                                    predictionWindow=predictionWindow,
+                                    predictionRow=predictionRow,
+                                    simulationTimestamp=simulationTimestamp,
+                                    asset=assets[indices[0]],
+                                ),
+                                chargeLevel[indices],
+                                importedToday[indices],
+                                exportedToday[indices],
+                            )
+                    discharges, charges = dispatchDecisions(
+                        bidPrices=bidPrices,
+                        offerPrices=offerPrices,
+                        chargeLevel=chargeLevel,
+                        importedToday=importedToday,
+                        exportedToday=exportedToday,
+                        **limits,
+                    )
+                    bidPrices = np.broadcast_to(bidPrices, discharges.shape)
+                    offerPrices = np.broadcast_to(offerPrices, discharges.shape)
+
+                ## only submitted pairs are built, idle ones when they are returned
+                submittedBidOfferPairs: Dict[int, BidOfferPair] = {
+                    int(index): (
+                        evaluate_bid_offer_pair_at_time(
+                            simulationTimeStamp=simulationTimestamp,
+                            offerPrice=float(offerPrices[index]),
+                            offerVolume=OFFER_BID_VOLUME,
+                            assetId=assetIds[index],
+                        )
+                        if discharges[index]
+                        else evaluate_bid_offer_pair_at_time(
+                            simulationTimeStamp=simulationTimestamp,
+                            bidPrice=float(bidPrices[index]),
+                            bidVolume=OFFER_BID_VOLUME,
+                            assetId=assetIds[index],
+                        )
+                    )
+                    for index in np.flatnonzero(discharges | charges)
+                }
+                submissionResults = await asyncio.gather(
+                    *(
+                        submit_bid_offer_pair(bidOfferPair)
+                        for bidOfferPair in submittedBidOfferPairs.values()
+                    )
+                )
+                accepted = np.full(len(assets), False)
+                for index, submissionResult in zip(
+                    submittedBidOfferPairs, submissionResults
+                ):
+                    accepted[index] = submissionResult["accepted"]
+                if accepted.any():
+                    await apply_battery_transitions(
+                        [
+                            BatteryStateTransition(
+                                settlementPeriodStartTime=submittedBidOfferPairs[
+                                    index
+                                ].settlementPeriodStartTime,
+                                action="discharge" if discharges[index] else "charge",
+                                volume=OFFER_BID_VOLUME,
+                                assetId=assetIds[index],
+                            )
+                            for index in np.flatnonzero(accepted)
+                        ]
+                    )
+
+                if predictionWindow is not settlementPeriodWindow:
+                    settlementPeriodWindow = predictionWindow
+                    settlementPeriodLead = predictionWindow.columns(
+                        GATE_CLOSURE_MINUTES
+                    )
+                bidPricePrediction, offerPricePrediction = (
+                    (
+                        predictionWindow.bidPrices[predictionRow, settlementPeriodLead],
+                        predictionWindow.offerPrices[
+                            predictionRow, settlementPeriodLead
+                        ],
+                    )
+                    if settlementPeriodLead >= 0
+                    else (np.nan, np.nan)
+                )
+
+                outcomes = [
+                    StepOutcome(
+                        assetId=assetIds[index],
+                        simulationTimestamp=simulationTimestamp,
+                        batteryState=batteryStateAtSimulationTimestamp,
+                        bidPricePrediction=bidPricePrediction,
+                        offerPricePrediction=offerPricePrediction,
+                        submittedBidOfferPair=submittedBidOfferPairs.get(index),
+                        bidAccepted=bool(accepted[index] and charges[index]),
+                        offerAccepted=bool(accepted[index] and discharges[index]),
+                    )
+                    for index, (batteryStateAtSimulationTimestamp, _) in enumerate(
+                        fleetStates
+                    )
+                ]
+            yield outcomes
+    finally:
+        predictionPrefetcher.cancel()
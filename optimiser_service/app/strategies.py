@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.dispatch import (
+    DispatchAction,
+    dispatchStateIndex,
+    solveOptimalDispatchPolicy,
+)
+from app.models import BatteryAsset, Strategy
+from app.predictions import PredictionWindow
+
+SIMULATION_TIMESTEP = timedelta(minutes=30)
+TIMESTEP_BEFORE_GATE_CLOSURE = timedelta(hours=1)
+OFFER_BID_VOLUME = 5
+NUMBER_OF_CANDIDATES = int(getenv("SVC_NUMBER_OF_CANDIDATES", "5"))
+DEFAULT_STRATEGY = Strategy(getenv("SVC_STRATEGY", Strategy.greedy.value))
+EXPECTED_ACCEPTANCE_RATE = float(getenv("SVC_EXPECTED_ACCEPTANCE_RATE", "0.8"))
+MINUTES_PER_DAY = 24 * 60
+
+
+class DispatchPolicy:
+    """
+    The optimal first action from every battery state, for the settlement
+    period straight after gate closure, with that period's prices.
+    """
+
+    def __init__(self, bestAction: np.ndarray, offerPrice: float, bidPrice: float):
+        self.bestAction = bestAction
+        self.offerPrice = offerPrice
+        self.bidPrice = bidPrice
+
+    def actions(self, chargeLevel, importedToday, exportedToday) -> np.ndarray:
+        """Best action for one battery state or an array of them."""
+        return self.bestAction[
+            dispatchStateIndex(
+                chargeLevel,
+                importedToday,
+                exportedToday,
+                volume=OFFER_BID_VOLUME,
+                stateShape=self.bestAction.shape,
+            )
+        ]
+
+
+def optimal_dispatch_policy(
+    *,
+    predictionWindow: PredictionWindow,
+    predictionRow: int,
+    simulationTimestamp: datetime,
+    asset: BatteryAsset,
+) -> Optional[DispatchPolicy]:
+    """
+    Solve the dispatch program over the horizon predicted at this step, for
+    the limits of `asset`.
+    """
+    firstLead = predictionWindow.lead(
+        simulationTimestamp, simulationTimestamp + TIMESTEP_BEFORE_GATE_CLOSURE
+    )
+    if firstLead is None:
+        return None
+
+    offerPrices = predictionWindow.offerPrices[predictionRow, firstLead:]
+    bidPrices = predictionWindow.bidPrices[predictionRow, firstLead:]
+    minutesIntoSimulationDay = (
+        simulationTimestamp.hour * 60 + simulationTimestamp.minute
+    )
+    periodDays = (
+        minutesIntoSimulationDay
+        + np.array(predictionWindow.leadTimeMinutes[firstLead:])
+    ) // MINUTES_PER_DAY
+    startsNewDay = np.diff(periodDays, prepend=periodDays[:1]) != 0
+
+    bestAction, _ = solveOptimalDispatchPolicy(
+        offerPrices=offerPrices,
+        bidPrices=bidPrices,
+        startsNewDay=startsNewDay,
+        volume=OFFER_BID_VOLUME,
+        maxCapacity=float(asset["maxCapacity"]),
+        maxChargeCycle=float(asset["maxChargeCycle"]),
+        maxDischargeCycle=float(asset["maxDischargeCycle"]),
+        acceptanceRate=EXPECTED_ACCEPTANCE_RATE,
+    )
+    return DispatchPolicy(bestAction, float(offerPrices[0]), float(bidPrices[0]))
+
+
+def optimal_dispatch_prices(
+    policy: Optional[DispatchPolicy],
+    chargeLevel: np.ndarray,
+    importedToday: np.ndarray,
+    exportedToday: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bid and offer prices to submit for the upcoming settlement period from
+    each battery state, NaN where the revenue-optimal schedule over the
+    predicted horizon leaves it idle.
+    """
+    if policy is None:
+        return np.full(np.shape(chargeLevel), np.nan), np.full(
+            np.shape(chargeLevel), np.nan
+        )
+
+    actions = policy.actions(chargeLevel, importedToday, exportedToday)
+    return (
+        np.where(actions == DispatchAction.charge, policy.bidPrice, np.nan),
+        np.where(actions == DispatchAction.discharge, policy.offerPrice, np.nan),
+    )
@@ -1,17 +1,15 @@
 from datetime import datetime
 from decimal import Decimal
-from loguru import logger
-from json import dumps
-from fastapi.encoders import jsonable_encoder
 
+from app.logwriter import log_record
 from app.models import BidOfferPair
 
-
 DATE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
 
 
 def log_optimiser_current_state(
     *,
+    assetId: str,
     simulationTimestamp: datetime,
     batteryStateOfCharge: Decimal,
     totalEnergyImportedFromStartToDate: Decimal,
@@ -24,30 +22,21 @@ def log_optimiser_current_state(
     bidAccepted: bool,
     offerAccepted: bool,
 ):
-    logger.success(
-        dumps(
-            {
-                "simulationTimestamp": simulationTimestamp,
-                "batteryStateOfCharge": jsonable_encoder(batteryStateOfCharge),
-                "totalEnergyExportedFromStartToDate": jsonable_encoder(
-                    totalEnergyExportedFromStartToDate
-                ),
-                "totalEnergyImportedFromStartToDate": jsonable_encoder(
-                    totalEnergyImportedFromStartToDate
-                ),
-                "totalEnergyExportedOnCurrentDay": jsonable_encoder(
-                    totalEnergyExportedOnCurrentDay
-                ),
-                "totalEnergyImportedOnCurrentDay": jsonable_encoder(
-                    totalEnergyImportedOnCurrentDay
-                ),
-                "bidPricePrediction": jsonable_encoder(bidPricePrediction),
-                "offerPricePrediction": jsonable_encoder(offerPricePrediction),
-                "submittedBidOfferPair": jsonable_encoder(submittedBidOfferPair),
-                "bidAccepted": bidAccepted,
-                "offerAccepted": offerAccepted,
-            }
-        )
+    log_record(
+        "SUCCESS",
+        "optimiser state",
+        assetId=assetId,
+        simulationTimestamp=simulationTimestamp,
+        batteryStateOfCharge=batteryStateOfCharge,
+        totalEnergyExportedFromStartToDate=totalEnergyExportedFromStartToDate,
+        totalEnergyImportedFromStartToDate=totalEnergyImportedFromStartToDate,
+        totalEnergyExportedOnCurrentDay=totalEnergyExportedOnCurrentDay,
+        totalEnergyImportedOnCurrentDay=totalEnergyImportedOnCurrentDay,
+        bidPricePrediction=bidPricePrediction,
+        offerPricePrediction=offerPricePrediction,
+        submittedBidOfferPair=submittedBidOfferPair,
+        bidAccepted=bidAccepted,
+        offerAccepted=offerAccepted,
     )
 
 
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from app import services
+from app.backends import embedded
+from app.backends.embedded import (
+    BATTERY_INITIAL_CHARGE_LEVEL,
+    EmbeddedMarket,
+    EmbeddedServiceBackend,
+)
+from app.models import DEFAULT_RUN_ID, BatteryStateTransition
+from app.utils import convertDateTimeToFormat
+
+FIRST_STEP = datetime(2021, 10, 4)
+
+
+@pytest.fixture(scope="module")
+def market():
+    return EmbeddedMarket()
+
+
+@pytest.fixture
+def backend(market):
+    backend = EmbeddedServiceBackend(market=market)
+    with services.use_backend(backend):
+        yield backend
+
+
+async def chargeLevelAt(dateTime: datetime) -> Decimal:
+    return (await services.get_battery_state(dateTime))["chargeLevelAtPeriodStart"]
+
+
+async def charge(dateTime: datetime):
+    await services.apply_battery_transitions(
+        [
+            BatteryStateTransition(
+                settlementPeriodStartTime=convertDateTimeToFormat(dateTime),
+                action="charge",
+                volume=Decimal(5),
+            )
+        ]
+    )
+
+
+def test_reset_run_starts_it_seeded_again(backend):
+    async def resetAfterCharging():
+        with services.use_run("run-1"):
+            assert await chargeLevelAt(FIRST_STEP) == BATTERY_INITIAL_CHARGE_LEVEL
+            await charge(FIRST_STEP)
+            afterCharge = await chargeLevelAt(FIRST_STEP + timedelta(hours=1))
+
+            await services.reset_run()
+
+            ## seeded at the first time read after the reset
+            laterStep = FIRST_STEP + timedelta(hours=2)
+            return afterCharge, await chargeLevelAt(laterStep)
+
+    afterCharge, afterReset = asyncio.run(resetAfterCharging())
+
+    assert afterCharge == BATTERY_INITIAL_CHARGE_LEVEL + 5
+    assert afterReset == BATTERY_INITIAL_CHARGE_LEVEL
+
+
+def test_reset_run_leaves_other_runs_alone(backend):
+    async def resetOneOfTwo():
+        with services.use_run("run-1"):
+            await chargeLevelAt(FIRST_STEP)
+            await charge(FIRST_STEP)
+        with services.use_run("run-2"):
+            await chargeLevelAt(FIRST_STEP)
+            await services.reset_run()
+        with services.use_run("run-1"):
+            return await chargeLevelAt(FIRST_STEP + timedelta(hours=1))
+
+    assert asyncio.run(resetOneOfTwo()) == BATTERY_INITIAL_CHARGE_LEVEL + 5
+
+
+def test_least_recently_used_runs_are_dropped(backend, monkeypatch):
+    monkeypatch.setattr(embedded, "EMBEDDED_RUNS", 2)
+
+    firstRun = backend.for_run("run-1")
+    backend.for_run("run-2")
+    assert backend.for_run("run-1") is firstRun
+    backend.for_run("run-3")
+
+    ## run-2 was used least recently, the default run is always kept
+    assert list(backend.runs) == [DEFAULT_RUN_ID, "run-1", "run-3"]
+    assert backend.for_run(DEFAULT_RUN_ID) is backend
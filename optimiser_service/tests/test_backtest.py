@@ -0,0 +1,22 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models import BACKTEST_MAX_WINDOWS, BacktestRequest
+
+WINDOW = {
+    "firstSettlementPeriodStart": "2021-10-04T00:00:00",
+    "lastSettlementPeriodStart": "2021-10-04T22:00:00",
+}
+
+
+def test_backtest_request_takes_at_most_the_max_windows():
+    BacktestRequest(windows=[WINDOW] * BACKTEST_MAX_WINDOWS)
+
+    with pytest.raises(ValidationError):
+        BacktestRequest(windows=[WINDOW] * (BACKTEST_MAX_WINDOWS + 1))
+
+
+@pytest.mark.parametrize("workers", [0, -1])
+def test_backtest_request_needs_a_worker(workers):
+    with pytest.raises(ValidationError):
+        BacktestRequest(windows=[WINDOW], workers=workers)
@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+from app.decisions import dispatchDecisions
+from app.dispatch import DispatchAction, dispatchStateIndex, solveOptimalDispatchPolicy
+from app.selection import selectHighestK, selectLowestK
+from app.strategies import OFFER_BID_VOLUME
+
+PERIODS_PER_DAY = 48
+NUMBER_OF_CANDIDATES = 5
+LIMITS = {"maxCapacity": 10.0, "maxChargeCycle": 20.0, "maxDischargeCycle": 20.0}
+
+
+def greedyCandidates(prices: np.ndarray, startsNewDay: np.ndarray, select):
+    """The prices the greedy strategy would submit at, picked day by day."""
+    candidates = np.full(len(prices), np.nan)
+    dayStarts = np.append(np.flatnonzero(startsNewDay), len(prices))
+    for first, end in zip(np.append(0, dayStarts[:-1]), dayStarts):
+        day = prices[first:end]
+        candidates[first:end] = np.where(select(day, NUMBER_OF_CANDIDATES), day, np.nan)
+    return candidates
+
+
+def greedyExpectedRevenue(
+    offerPrices, bidPrices, startsNewDay, acceptanceRate: float
+) -> float:
+    """
+    Expected revenue of the greedy strategy from an empty battery, over every
+    way its submissions could be accepted or not.
+    """
+    offerCandidates = greedyCandidates(offerPrices, startsNewDay, selectHighestK)
+    bidCandidates = greedyCandidates(bidPrices, startsNewDay, selectLowestK)
+    probabilities = {(0.0, 0.0, 0.0): 1.0}
+    revenue = 0.0
+
+    for period in range(len(offerPrices)):
+        if period and startsNewDay[period]:
+            nextProbabilities = {}
+            for (chargeLevel, _, _), probability in probabilities.items():
+                state = (chargeLevel, 0.0, 0.0)
+                nextProbabilities[state] = nextProbabilities.get(state, 0) + probability
+            probabilities = nextProbabilities
+
+        nextProbabilities = {}
+        for state, probability in probabilities.items():
+            chargeLevel, importedToday, exportedToday = state
+            discharges, charges = dispatchDecisions(
+                bidPrices=bidCandidates[period],
+                offerPrices=offerCandidates[period],
+                chargeLevel=chargeLevel,
+                importedToday=importedToday,
+                exportedToday=exportedToday,
+                **LIMITS,
+            )
+            if discharges:
+                revenue += (
+                    probability
+                    * acceptanceRate
+                    * offerCandidates[period]
+                    * OFFER_BID_VOLUME
+                )
+                acceptedState = (
+                    chargeLevel - OFFER_BID_VOLUME,
+                    importedToday,
+                    exportedToday + OFFER_BID_VOLUME,
+                )
+            elif charges:
+                revenue -= (
+                    probability
+                    * acceptanceRate
+                    * bidCandidates[period]
+                    * OFFER_BID_VOLUME
+                )
+                acceptedState = (
+                    chargeLevel + OFFER_BID_VOLUME,
+                    importedToday + OFFER_BID_VOLUME,
+                    exportedToday,
+                )
+            else:
+                nextProbabilities[state] = nextProbabilities.get(state, 0) + probability
+                continue
+            nextProbabilities[acceptedState] = (
+                nextProbabilities.get(acceptedState, 0) + probability * acceptanceRate
+            )
+            nextProbabilities[state] = nextProbabilities.get(state, 0) + probability * (
+                1 - acceptanceRate
+            )
+        probabilities = nextProbabilities
+
+    return revenue
+
+
+def optimalExpectedRevenue(
+    offerPrices, bidPrices, startsNewDay, acceptanceRate: float
+) -> float:
+    """Expected revenue of the optimal dispatch policy from an empty battery."""
+    _, value = solveOptimalDispatchPolicy(
+        offerPrices=offerPrices,
+        bidPrices=bidPrices,
+        startsNewDay=startsNewDay,
+        volume=OFFER_BID_VOLUME,
+        acceptanceRate=acceptanceRate,
+        **LIMITS,
+    )
+    return value[
+        dispatchStateIndex(0, 0, 0, volume=OFFER_BID_VOLUME, stateShape=value.shape)
+    ]
+
+
+@pytest.mark.parametrize("acceptanceRate", [1.0, 0.8])
+@pytest.mark.parametrize("seed", range(5))
+def test_optimal_revenue_is_at_least_greedy_revenue(seed, acceptanceRate):
+    random = np.random.default_rng(seed)
+    numberOfPeriods = 2 * PERIODS_PER_DAY
+    bidPrices = random.uniform(20, 80, numberOfPeriods)
+    offerPrices = bidPrices + random.uniform(-10, 10, numberOfPeriods)
+    ## some periods without predictions
+    bidPrices[random.choice(numberOfPeriods, 10, replace=False)] = np.nan
+    offerPrices[random.choice(numberOfPeriods, 10, replace=False)] = np.nan
+    startsNewDay = np.arange(numberOfPeriods) % PERIODS_PER_DAY == 0
+    startsNewDay[0] = False
+
+    greedyRevenue = greedyExpectedRevenue(
+        offerPrices, bidPrices, startsNewDay, acceptanceRate
+    )
+    optimalRevenue = optimalExpectedRevenue(
+        offerPrices, bidPrices, startsNewDay, acceptanceRate
+    )
+
+    assert optimalRevenue >= greedyRevenue - 1e-9
+
+
+def test_optimal_dispatch_buys_low_and_sells_high():
+    offerPrices = np.array([np.nan, 10.0, 3.0])
+    bidPrices = np.array([1.0, 8.0, np.nan])
+    startsNewDay = np.zeros(3, dtype=bool)
+
+    bestAction, value = solveOptimalDispatchPolicy(
+        offerPrices=offerPrices,
+        bidPrices=bidPrices,
+        startsNewDay=startsNewDay,
+        volume=OFFER_BID_VOLUME,
+        acceptanceRate=1.0,
+        **LIMITS,
+    )
+    emptyBattery = dispatchStateIndex(
+        0, 0, 0, volume=OFFER_BID_VOLUME, stateShape=value.shape
+    )
+
+    assert bestAction[emptyBattery] == DispatchAction.charge
+    ## charge at 1, then discharge at 10
+    assert value[emptyBattery] == pytest.approx((10.0 - 1.0) * OFFER_BID_VOLUME)
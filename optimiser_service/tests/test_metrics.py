@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from app.metrics import currentSpanId, currentTraceId, step_span
+
+STEP = datetime(2021, 10, 4, 1, 30)
+
+
+def test_step_span_is_named_by_the_trace_and_step():
+    token = currentTraceId.set("trace-1")
+    try:
+        with step_span(STEP) as spanId:
+            assert currentSpanId.get() == spanId == "trace-1-20211004T013000"
+    finally:
+        currentTraceId.reset(token)
+
+    assert currentSpanId.get() is None
+
+
+def test_step_span_without_a_trace_is_named_by_the_step():
+    with step_span(STEP) as spanId:
+        assert spanId == "20211004T013000"
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import BidOfferPair, Strategy
+from app.results import ResultsRecorder, charge_curves, daily_results, delete_results
+
+RUN_ID = "run-1"
+ASSET_ID = "battery-1"
+FIRST_STEP = datetime(2021, 10, 4)
+STEPS = 4
+
+
+def recordPass(
+    location: str,
+    strategy: Strategy,
+    offerPrice: float,
+    numberOfCandidates: int = 5,
+    numberOfSteps: int = STEPS,
+):
+    """Record a pass whose every offer of one unit is accepted at `offerPrice`."""
+    recorder = ResultsRecorder(RUN_ID, strategy, numberOfCandidates, location=location)
+    for step in range(numberOfSteps):
+        simulationTimestamp = FIRST_STEP + timedelta(minutes=30 * step)
+        recorder.add(
+            {
+                "assetId": ASSET_ID,
+                "simulationTimestamp": simulationTimestamp,
+                "batteryState": {
+                    "chargeLevelAtPeriodStart": offerPrice,
+                    "cumulativeImportTotal": 0,
+                    "cumulativeExportTotal": step,
+                    "sameDayImportTotal": 0,
+                    "sameDayExportTotal": step,
+                },
+                "bidPricePrediction": None,
+                "offerPricePrediction": offerPrice,
+                "bidAccepted": False,
+                "offerAccepted": True,
+            },
+            BidOfferPair(
+                submissionTime=simulationTimestamp.isoformat(),
+                settlementPeriodStartTime=simulationTimestamp.isoformat(),
+                offerPrice=offerPrice,
+                offerVolume=1,
+                bidPrice=0,
+                bidVolume=0,
+                assetId=ASSET_ID,
+            ),
+        )
+    recorder.flush(final=True)
+
+
+def test_each_strategy_of_a_run_has_its_own_results(tmp_path):
+    recordPass(str(tmp_path), Strategy.greedy, 10)
+    recordPass(str(tmp_path), Strategy.optimal, 20)
+
+    results = daily_results(RUN_ID, location=str(tmp_path))
+
+    assert sorted((result.strategy, result.revenue) for result in results) == [
+        (Strategy.greedy, 10 * STEPS),
+        (Strategy.optimal, 20 * STEPS),
+    ]
+    assert all(result.steps == STEPS for result in results)
+    assert sorted(
+        (curve.strategy, curve.chargeLevels)
+        for curve in charge_curves(RUN_ID, location=str(tmp_path))
+    ) == [(Strategy.greedy, [10] * STEPS), (Strategy.optimal, [20] * STEPS)]
+
+
+def test_each_number_of_candidates_has_its_own_results(tmp_path):
+    recordPass(str(tmp_path), Strategy.greedy, 10, numberOfCandidates=5)
+    recordPass(str(tmp_path), Strategy.greedy, 30, numberOfCandidates=8)
+
+    results = daily_results(RUN_ID, location=str(tmp_path))
+
+    assert sorted(
+        (result.numberOfCandidates, result.revenue) for result in results
+    ) == [
+        (5, 10 * STEPS),
+        (8, 30 * STEPS),
+    ]
+
+
+def test_later_pass_of_a_strategy_supersedes_earlier_ones(tmp_path):
+    recordPass(str(tmp_path), Strategy.greedy, 10)
+    recordPass(str(tmp_path), Strategy.optimal, 20)
+    recordPass(str(tmp_path), Strategy.greedy, 30, numberOfSteps=2)
+
+    results = daily_results(RUN_ID, location=str(tmp_path), strategy=Strategy.greedy)
+
+    ## the first two steps are from the later pass, the rest from the first
+    assert [(result.steps, result.revenue) for result in results] == [
+        (STEPS, 30 * 2 + 10 * (STEPS - 2))
+    ]
+
+
+def test_results_can_be_filtered_by_strategy(tmp_path):
+    recordPass(str(tmp_path), Strategy.greedy, 10)
+    recordPass(str(tmp_path), Strategy.optimal, 20)
+
+    results = daily_results(RUN_ID, location=str(tmp_path), strategy=Strategy.optimal)
+
+    assert [result.strategy for result in results] == [Strategy.optimal]
+    assert daily_results(RUN_ID, location=str(tmp_path), numberOfCandidates=8) == []
+
+
+def test_deleted_results_are_gone(tmp_path):
+    recordPass(str(tmp_path), Strategy.greedy, 10)
+
+    assert delete_results(RUN_ID, location=str(tmp_path))
+
+    assert daily_results(RUN_ID, location=str(tmp_path)) == []
+    assert charge_curves(RUN_ID, location=str(tmp_path)) == []
+    assert not delete_results(RUN_ID, location=str(tmp_path))
+
+
+@pytest.mark.parametrize("read", [daily_results, charge_curves])
+def test_run_without_results_has_none(tmp_path, read):
+    assert read("unknown-run", location=str(tmp_path)) == []
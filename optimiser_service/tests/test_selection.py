@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from app.selection import selectHighestK, selectLowestK
+
+NUMBER_OF_CANDIDATES = 5
+
+
+def greedyLowest(pricesByTime: dict, k: int) -> set:
+    """The times the original greedy strategy picked the lowest bids at."""
+    return {
+        time
+        for (time, _) in sorted(
+            pricesByTime.items(), key=lambda timeAndPrice: timeAndPrice[1]
+        )[0:k]
+    }
+
+
+def greedyHighest(pricesByTime: dict, k: int) -> set:
+    """The times the original greedy strategy picked the highest offers at."""
+    return {
+        time
+        for (time, _) in sorted(
+            pricesByTime.items(), key=lambda timeAndPrice: timeAndPrice[1]
+        )[-k:]
+    }
+
+
+def selectedTimes(mask: np.ndarray, times: list) -> set:
+    return {times[index] for index in np.flatnonzero(mask)}
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_top_k_matches_greedy_selection(seed):
+    random = np.random.default_rng(seed)
+    times = [
+        f"2021-10-04T{hour:02d}:{minute:02d}:00"
+        for hour in range(24)
+        for minute in (0, 30)
+    ]
+    prices = random.permutation(len(times)) + random.random(len(times))
+    pricesByTime = dict(zip(times, prices))
+
+    assert selectedTimes(
+        selectLowestK(prices, NUMBER_OF_CANDIDATES), times
+    ) == greedyLowest(pricesByTime, NUMBER_OF_CANDIDATES)
+    assert selectedTimes(
+        selectHighestK(prices, NUMBER_OF_CANDIDATES), times
+    ) == greedyHighest(pricesByTime, NUMBER_OF_CANDIDATES)
+
+
+def test_top_k_selects_every_row_of_a_window():
+    random = np.random.default_rng(0)
+    window = random.random((6, 48))
+
+    lowest = selectLowestK(window, NUMBER_OF_CANDIDATES)
+    highest = selectHighestK(window, NUMBER_OF_CANDIDATES)
+
+    for row in range(len(window)):
+        assert np.array_equal(
+            lowest[row], selectLowestK(window[row], NUMBER_OF_CANDIDATES)
+        )
+        assert np.array_equal(
+            highest[row], selectHighestK(window[row], NUMBER_OF_CANDIDATES)
+        )
+
+
+def test_top_k_never_selects_missing_prices():
+    prices = np.array([np.nan, 3.0, 1.0, np.nan, 2.0, 5.0, 4.0])
+
+    assert np.flatnonzero(selectLowestK(prices, 2)).tolist() == [2, 4]
+    assert np.flatnonzero(selectHighestK(prices, 2)).tolist() == [5, 6]
+    ## fewer prices than candidates, every predicted one is selected
+    assert np.flatnonzero(selectLowestK(prices, 6)).tolist() == [1, 2, 4, 5, 6]
+
+
+def test_top_k_of_nothing_selects_nothing():
+    assert not selectLowestK(np.array([1.0, 2.0]), 0).any()
+    assert selectLowestK(np.array([]), NUMBER_OF_CANDIDATES).shape == (0,)